@@ -31,10 +31,37 @@ def create_app(config_class=Config):
     from app.routes import api_bp
     app.register_blueprint(api_bp, url_prefix='/api/v1')
 
-    from app.models import parking_garage, parking_spot, sensor, camera, occupancy_history
+    from app.models import parking_garage, parking_spot, sensor, camera, occupancy_history, occupancy_rollup, occupancy_forecast, sensor_mapping
 
     with app.app_context():
         db.create_all()
         print("Database tables created successfully")
 
+        from app.utils.db_init import upgrade_schema
+        upgrade_schema()
+
+        from app.services.occupancy_store import init_occupancy_store
+        init_occupancy_store(app)
+
+        from app.services.event_hub import init_event_hub
+        init_event_hub(app)
+
+        from app.services.response_cache import init_response_cache
+        init_response_cache(app)
+
+        from app.services.forecast_service import init_forecast_store
+        init_forecast_store(app)
+
+        from app.services.sensor_mapping_service import init_sensor_mapping_index
+        init_sensor_mapping_index(app)
+
+        from app.services.reading_filter import init_reading_filter
+        init_reading_filter(app)
+
+        from app.services.telemetry_buffer import init_telemetry_buffer
+        init_telemetry_buffer(app)
+
+        from app.services.metrics import init_metrics
+        init_metrics(app)
+
     return app
@@ -3,5 +3,8 @@ from app.models.parking_spot import ParkingSpot
 from app.models.sensor import Sensor
 from app.models.camera import Camera
 from app.models.occupancy_history import OccupancyHistory
+from app.models.occupancy_rollup import OccupancyRollup, RollupWatermark
+from app.models.occupancy_forecast import OccupancyForecast, ForecastWatermark
+from app.models.sensor_mapping import SensorMapping
 
-__all__ = ['ParkingGarage', 'ParkingSpot', 'Sensor', 'Camera', 'OccupancyHistory']
+__all__ = ['ParkingGarage', 'ParkingSpot', 'Sensor', 'Camera', 'OccupancyHistory', 'OccupancyRollup', 'RollupWatermark', 'OccupancyForecast', 'ForecastWatermark', 'SensorMapping']
@@ -0,0 +1,30 @@
+from datetime import datetime
+from app import db
+
+class OccupancyForecast(db.Model):
+    __tablename__ = 'occupancy_forecast'
+
+    # floor_number 0 holds the garage-wide profile
+    GARAGE_LEVEL = 0
+
+    forecast_id = db.Column(db.Integer, primary_key=True)
+    garage_id = db.Column(db.Integer, db.ForeignKey('parking_garage.garage_id'), nullable=False)
+    floor_number = db.Column(db.Integer, nullable=False)
+    slot = db.Column(db.Integer, nullable=False)
+    total_spots = db.Column(db.Integer, nullable=False)
+    # Exponentially decayed sums over past weeks; the forecast is weighted_* / weight
+    weighted_occupied = db.Column(db.Float, nullable=False, default=0.0)
+    weighted_peak = db.Column(db.Float, nullable=False, default=0.0)
+    weight = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('garage_id', 'floor_number', 'slot', name='unique_forecast_slot'),
+    )
+
+
+class ForecastWatermark(db.Model):
+    __tablename__ = 'forecast_watermark'
+
+    garage_id = db.Column(db.Integer, db.ForeignKey('parking_garage.garage_id'), primary_key=True)
+    processed_until = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -6,8 +6,18 @@ class OccupancyHistory(db.Model):
 
     history_id = db.Column(db.Integer, primary_key=True)
     space_id = db.Column(db.Integer, db.ForeignKey('parking_spot.space_id'), nullable=False)
+    # Denormalized from parking_spot so garage and floor series avoid a join
+    garage_id = db.Column(db.Integer)
+    floor_number = db.Column(db.Integer)
     was_occupied = db.Column(db.Boolean, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('idx_history_space_time', 'space_id', 'timestamp'),
+        # was_occupied is included so series queries are served from the index alone
+        db.Index('idx_history_garage_time', 'garage_id', 'timestamp', 'was_occupied'),
+        db.Index('idx_history_garage_floor_time', 'garage_id', 'floor_number', 'timestamp', 'was_occupied'),
+    )
 
     def to_dict(self):
         return {
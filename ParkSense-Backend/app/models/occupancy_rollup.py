@@ -0,0 +1,50 @@
+from datetime import datetime
+from app import db
+
+class OccupancyRollup(db.Model):
+    __tablename__ = 'occupancy_rollup'
+
+    # floor_number 0 holds the garage-wide series
+    GARAGE_LEVEL = 0
+    BUCKET_SECONDS = {
+        'minute': 60,
+        'hour': 3600,
+        'day': 86400
+    }
+
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    garage_id = db.Column(db.Integer, db.ForeignKey('parking_garage.garage_id'), nullable=False)
+    floor_number = db.Column(db.Integer, nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    total_spots = db.Column(db.Integer, nullable=False)
+    occupied_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    peak_occupied = db.Column(db.Integer, nullable=False, default=0)
+    end_occupied = db.Column(db.Integer, nullable=False, default=0)
+    transitions = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('garage_id', 'granularity', 'floor_number', 'bucket_start', name='unique_rollup_bucket'),
+    )
+
+    def to_dict(self):
+        bucket_seconds = OccupancyRollup.BUCKET_SECONDS[self.granularity]
+        avg_occupied = self.occupied_seconds / bucket_seconds
+        return {
+            'bucket_start': self.bucket_start.isoformat(),
+            'floor_number': self.floor_number or None,
+            'total_spots': self.total_spots,
+            'avg_occupied': round(avg_occupied, 2),
+            'avg_occupancy_rate': round(avg_occupied / self.total_spots * 100, 2) if self.total_spots > 0 else 0,
+            'peak_occupied': self.peak_occupied,
+            'transitions': self.transitions
+        }
+
+
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermark'
+
+    granularity = db.Column(db.String(10), primary_key=True)
+    last_history_id = db.Column(db.Integer, nullable=False, default=0)
+    processed_until = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -8,8 +8,8 @@ class Sensor(db.Model):
     parking_space_id = db.Column(db.Integer, db.ForeignKey('parking_spot.space_id'), nullable=False, unique=True, index=True)
     status = db.Column(db.String(20), default='active', index=True)  
     last_reading = db.Column(db.Float)
-    battery_level = db.Column(db.Integer, default=100)
-    last_ping = db.Column(db.DateTime, default=datetime.utcnow)
+    battery_level = db.Column(db.Integer, default=100, index=True)
+    last_ping = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -0,0 +1,25 @@
+from datetime import datetime
+from app import db
+
+class SensorMapping(db.Model):
+    __tablename__ = 'sensor_mapping'
+
+    mapping_id = db.Column(db.Integer, primary_key=True)
+    thing_id = db.Column(db.String(64), nullable=False)
+    property_name = db.Column(db.String(128), nullable=False)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.sensor_id'), nullable=False, index=True)
+    # Drives incremental reloads of the in-memory index
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('thing_id', 'property_name', name='unique_thing_property'),
+    )
+
+    def to_dict(self):
+        return {
+            'mapping_id': self.mapping_id,
+            'thing_id': self.thing_id,
+            'property_name': self.property_name,
+            'sensor_id': self.sensor_id,
+            'updated_at': self.updated_at.isoformat()
+        }
@@ -1,73 +1,506 @@
-from flask import jsonify, request
+import json
+import queue
+from datetime import datetime, timedelta, timezone
+from flask import jsonify, request, current_app, Response
 from app.routes import api_bp
-from app.services.parking_service import ParkingService
+from app.services.parking_service import ParkingService, SPOT_FIELDS
+from app.services.rollup_service import RollupService
+from app.services.occupancy_series_service import OccupancySeriesService
+from app.services.forecast_service import get_forecast_store
+from app.models.occupancy_rollup import OccupancyRollup
+from app.services.event_hub import get_event_hub, SubscriberLimitReached
+from app.utils.http_cache import etag_for, not_modified, cache_generation, cached_json
+
+SPOT_TYPES = ['regular', 'handicap', 'staff', 'paid']
+STEP_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+HISTORY_DEFAULT_SPAN = {
+    'minute': timedelta(hours=2),
+    'hour': timedelta(hours=24),
+    'day': timedelta(days=30)
+}
 
 @api_bp.route('/garages', methods=['GET'])
 def get_garages():
-    garages = ParkingService.get_all_garages()
-    return jsonify({
-        'success': True,
-        'count': len(garages),
-        'data': garages
-    }), 200
+    tags = [('garages',)]
+    generation = cache_generation(tags)
+    etag = etag_for(ParkingService.get_version_tag())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    def build():
+        garages = ParkingService.get_all_garages()
+        return {
+            'success': True,
+            'count': len(garages),
+            'data': garages
+        }
+
+    return cached_json(tags, etag, generation, build), 200
 
 @api_bp.route('/garages/<int:garage_id>', methods=['GET'])
 def get_garage(garage_id):
-    garage = ParkingService.get_garage_by_id(garage_id)
+    tags = [('garage', garage_id)]
+    generation = cache_generation(tags)
+    etag = etag_for(ParkingService.get_version_tag(garage_id))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = cached_json(
+        tags, etag, generation,
+        lambda: _envelope(ParkingService.get_garage_by_id(garage_id))
+    )
 
-    if not garage:
+    if response is None:
         return jsonify({
             'success': False,
             'error': 'Garage not found'
         }), 404
 
-    return jsonify({
-        'success': True,
-        'data': garage
-    }), 200
+    return response, 200
 
 @api_bp.route('/garages/<int:garage_id>/availability', methods=['GET'])
 def get_garage_availability(garage_id):
-    availability = ParkingService.get_garage_availability(garage_id)
+    tags = [('garage', garage_id)]
+    generation = cache_generation(tags)
+    etag = etag_for(ParkingService.get_version_tag(garage_id))
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
-    if not availability:
+    try:
+        fields = _parse_fields()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    if request.args.get('format') == 'bitmap':
+        build = lambda: _envelope(ParkingService.get_occupancy_bitmap(garage_id))
+    else:
+        build = lambda: _envelope(ParkingService.get_garage_availability(garage_id, fields))
+
+    response = cached_json(tags, etag, generation, build)
+
+    if response is None:
         return jsonify({
             'success': False,
             'error': 'Garage not found'
         }), 404
 
-    return jsonify({
-        'success': True,
-        'data': availability
-    }), 200
+    return response, 200
+
+@api_bp.route('/garages/<int:garage_id>/layout', methods=['GET'])
+def get_garage_layout(garage_id):
+    tags = [('layout', garage_id)]
+    generation = cache_generation(tags)
+    layout_version = ParkingService.get_layout_version(garage_id)
+    etag = etag_for(layout_version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = cached_json(
+        tags, etag, generation,
+        lambda: _envelope(ParkingService.get_layout(garage_id))
+    )
+
+    if response is None:
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found'
+        }), 404
+
+    # A layout addressed by its version never changes
+    if request.args.get('version') == layout_version:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+
+    return response, 200
 
 @api_bp.route('/garages/<int:garage_id>/floors/<int:floor_number>', methods=['GET'])
 def get_floor_availability(garage_id, floor_number):
-    availability = ParkingService.get_floor_availability(garage_id, floor_number)
+    tags = [('floor', garage_id, floor_number)]
+    generation = cache_generation(tags)
+    etag = etag_for(ParkingService.get_version_tag(garage_id, floor_number))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    try:
+        fields = _parse_fields()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    if request.args.get('format') == 'bitmap':
+        build = lambda: _envelope(ParkingService.get_occupancy_bitmap(garage_id, floor_number))
+    else:
+        build = lambda: _envelope(ParkingService.get_floor_availability(garage_id, floor_number, fields))
 
-    if not availability:
+    response = cached_json(tags, etag, generation, build)
+
+    if response is None:
         return jsonify({
             'success': False,
             'error': 'Floor not found'
         }), 404
 
-    return jsonify({
-        'success': True,
-        'data': availability
-    }), 200
+    return response, 200
 
 @api_bp.route('/garages/<int:garage_id>/spots/type/<spot_type>', methods=['GET'])
 def get_spots_by_type(garage_id, spot_type):
-    if spot_type not in ['regular', 'handicap', 'staff', 'paid']:
+    if spot_type not in SPOT_TYPES:
         return jsonify({
             'success': False,
             'error': 'Invalid spot type'
         }), 400
 
-    spots = ParkingService.get_available_spots_by_type(garage_id, spot_type)
+    try:
+        fields, after, limit = _parse_page_args()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    # Clients that predate paging ask for neither and expect every matching spot
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        limit = None
+
+    tags = [('type', garage_id, spot_type)]
+    generation = cache_generation(tags)
+    etag = etag_for(ParkingService.get_version_tag(garage_id))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    def build():
+        spots, next_cursor = ParkingService.get_available_spots_by_type(
+            garage_id, spot_type, fields=fields, after=after, limit=limit
+        )
+        return {
+            'success': True,
+            'count': len(spots),
+            'next_cursor': next_cursor,
+            'data': spots
+        }
+
+    return cached_json(tags, etag, generation, build), 200
+
+@api_bp.route('/garages/<int:garage_id>/spots', methods=['GET'])
+def list_garage_spots(garage_id):
+    floor_number = request.args.get('floor', type=int)
+    spot_type = request.args.get('type')
+    available_only = request.args.get('available', '').lower() in ('1', 'true')
+
+    if spot_type is not None and spot_type not in SPOT_TYPES:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid spot type'
+        }), 400
+
+    try:
+        fields, after, limit = _parse_page_args()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    if floor_number is not None:
+        tags = [('floor', garage_id, floor_number)]
+    elif spot_type is not None:
+        tags = [('type', garage_id, spot_type)]
+    else:
+        tags = [('garage', garage_id)]
+    generation = cache_generation(tags)
+
+    version_tag = ParkingService.get_version_tag(garage_id)
+    if version_tag is None:
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found'
+        }), 404
+
+    etag = etag_for(version_tag)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    def build():
+        spots, next_cursor = ParkingService.list_spots(
+            garage_id,
+            floor_number=floor_number,
+            spot_type=spot_type,
+            available_only=available_only,
+            fields=fields,
+            after=after,
+            limit=limit
+        )
+        return {
+            'success': True,
+            'count': len(spots),
+            'next_cursor': next_cursor,
+            'data': spots
+        }
+
+    return cached_json(tags, etag, generation, build), 200
+
+@api_bp.route('/garages/<int:garage_id>/history', methods=['GET'])
+def get_garage_history(garage_id):
+    granularity = request.args.get('granularity', 'hour')
+    floor_number = request.args.get('floor', type=int)
+
+    if granularity not in OccupancyRollup.BUCKET_SECONDS:
+        return jsonify({
+            'success': False,
+            'error': f"granularity must be one of: {', '.join(OccupancyRollup.BUCKET_SECONDS)}"
+        }), 400
+
+    try:
+        start, end = _parse_time_range(HISTORY_DEFAULT_SPAN[granularity])
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    max_buckets = current_app.config.get('ROLLUP_MAX_BUCKETS', 2000)
+    if (end - start).total_seconds() / OccupancyRollup.BUCKET_SECONDS[granularity] > max_buckets:
+        return jsonify({
+            'success': False,
+            'error': f'Range covers more than {max_buckets} {granularity} buckets, use a coarser granularity'
+        }), 400
+
+    if ParkingService.get_version_tag(garage_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found'
+        }), 404
+
+    buckets = RollupService.get_garage_history(garage_id, granularity, start, end, floor_number)
+
+    return jsonify({
+        'success': True,
+        'granularity': granularity,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'count': len(buckets),
+        'data': buckets
+    }), 200
+
+@api_bp.route('/garages/<int:garage_id>/occupancy', methods=['GET'])
+def get_garage_occupancy_series(garage_id):
+    floor_number = request.args.get('floor', type=int)
+
+    try:
+        start, end = _parse_time_range(timedelta(hours=24))
+        step = _parse_step(request.args.get('step', '5m'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    # The level at from is derived from every transition since, so none may have been archived
+    if current_app.config.get('HISTORY_RETENTION_ENABLED', False):
+        retention_days = current_app.config.get('HISTORY_RETENTION_DAYS', 30)
+        if start < datetime.utcnow() - timedelta(days=retention_days):
+            return jsonify({
+                'success': False,
+                'error': f'from must be within the last {retention_days} days of retained history'
+            }), 400
+
+    max_points = current_app.config.get('OCCUPANCY_SERIES_MAX_POINTS', 2000)
+    if (end - start).total_seconds() / step > max_points:
+        return jsonify({
+            'success': False,
+            'error': f'Range covers more than {max_points} steps, use a larger step'
+        }), 400
+
+    series = OccupancySeriesService.get_series(
+        garage_id, start.replace(microsecond=0), end.replace(microsecond=0), step, floor_number
+    )
+
+    if series is None:
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found' if floor_number is None else 'Floor not found'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'data': series
+    }), 200
+
+@api_bp.route('/garages/<int:garage_id>/forecast', methods=['GET'])
+def get_garage_forecast(garage_id):
+    floor_number = request.args.get('floor', type=int)
+    hours = request.args.get('hours', default=current_app.config.get('FORECAST_DEFAULT_HOURS', 3), type=int)
+    max_hours = current_app.config.get('FORECAST_MAX_HOURS', 48)
+
+    if hours < 1 or hours > max_hours:
+        return jsonify({
+            'success': False,
+            'error': f'hours must be between 1 and {max_hours}'
+        }), 400
+
+    try:
+        at = _parse_time_arg('at') or datetime.utcnow()
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    store = get_forecast_store()
+    forecast = store.get_forecast(garage_id, at, hours * 60 // store.slot_minutes, floor_number)
+
+    if forecast is None:
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found' if floor_number is None else 'Floor not found'
+        }), 404
 
     return jsonify({
         'success': True,
-        'count': len(spots),
-        'data': spots
+        'data': forecast
     }), 200
+
+def _parse_step(value):
+    unit = STEP_UNITS.get(value[-1:], None)
+    try:
+        step = int(value[:-1]) * unit if unit else int(value)
+    except ValueError:
+        raise ValueError('step must be seconds or a number followed by s, m, h or d')
+    if step < 1:
+        raise ValueError('step must be at least one second')
+    return step
+
+def _parse_time_range(default_span):
+    end = _parse_time_arg('to') or datetime.utcnow()
+    start = _parse_time_arg('from') or end - default_span
+    if start >= end:
+        raise ValueError('from must be earlier than to')
+    return start, end
+
+def _parse_time_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 timestamp')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _parse_fields():
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in SPOT_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(SPOT_FIELDS)}")
+    return fields
+
+def _parse_page_args():
+    fields = _parse_fields()
+
+    after = request.args.get('cursor')
+    if after is not None:
+        try:
+            after = int(after)
+        except ValueError:
+            raise ValueError('Invalid cursor')
+
+    max_limit = current_app.config.get('SPOTS_MAX_PER_PAGE', 500)
+    limit = request.args.get('limit', default=current_app.config.get('SPOTS_PER_PAGE', 50), type=int)
+    if limit < 1 or limit > max_limit:
+        raise ValueError(f'limit must be between 1 and {max_limit}')
+
+    return fields, after, limit
+
+def _envelope(data):
+    if not data:
+        return None
+    return {
+        'success': True,
+        'data': data
+    }
+
+@api_bp.route('/garages/<int:garage_id>/changes', methods=['GET'])
+def get_garage_changes(garage_id):
+    since = request.args.get('since', type=int)
+
+    if since is not None and since < 0:
+        return jsonify({
+            'success': False,
+            'error': 'since must be a non-negative sequence number'
+        }), 400
+
+    changes = ParkingService.get_changes_since(garage_id, since)
+
+    if not changes:
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'data': changes
+    }), 200
+
+@api_bp.route('/garages/<int:garage_id>/stream', methods=['GET'])
+def stream_garage_changes(garage_id):
+    hub = get_event_hub()
+    try:
+        subscription = hub.subscribe(garage_id)
+    except SubscriberLimitReached as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+
+    # Snapshot after subscribing so no change falls between the two; events the
+    # snapshot already covers carry a seq at or below its id and can be skipped
+    snapshot = ParkingService.get_floor_counts(garage_id)
+
+    if snapshot is None:
+        hub.unsubscribe(subscription)
+        return jsonify({
+            'success': False,
+            'error': 'Garage not found'
+        }), 404
+
+    keepalive = current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+
+    def generate():
+        try:
+            yield _sse_event('snapshot', snapshot)
+            while True:
+                try:
+                    event = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse_event(event.get('type', 'change'), event)
+        finally:
+            hub.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _sse_event(name, data):
+    event_id = f"id: {data['seq']}\n" if 'seq' in data else ''
+    return f"{event_id}event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
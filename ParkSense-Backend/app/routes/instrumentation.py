@@ -0,0 +1,18 @@
+from flask import current_app, g, request
+from app.routes import api_bp
+
+
+@api_bp.before_request
+def start_request_metrics():
+    metrics = current_app.extensions.get('metrics')
+    if metrics is not None:
+        g.request_metrics = metrics.start_request()
+
+
+@api_bp.after_request
+def record_request_metrics(response):
+    metrics = current_app.extensions.get('metrics')
+    started = g.pop('request_metrics', None)
+    if metrics is not None and started is not None:
+        metrics.finish_request(started, request, response)
+    return response
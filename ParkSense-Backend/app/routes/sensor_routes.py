@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta, timezone
 from flask import jsonify, request, current_app
 from app.routes import api_bp
 from app.services.sensor_service import SensorService
@@ -33,6 +34,76 @@ def submit_sensor_reading(sensor_id):
         'data': result
     }), 200
 
+@api_bp.route('/sensors/readings', methods=['POST'])
+def submit_sensor_readings():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('readings')
+
+    if not isinstance(data, list) or not data:
+        return jsonify({
+            'success': False,
+            'error': 'Array of readings required'
+        }), 400
+
+    max_batch = current_app.config.get('SENSOR_BATCH_MAX_SIZE', 5000)
+    if len(data) > max_batch:
+        return jsonify({
+            'success': False,
+            'error': f'At most {max_batch} readings per batch'
+        }), 413
+
+    results = [None] * len(data)
+    readings = []
+    positions = []
+    now = datetime.utcnow()
+    latest = now + timedelta(seconds=current_app.config.get('SENSOR_TIMESTAMP_MAX_SKEW_SECONDS', 300))
+
+    for index, item in enumerate(data):
+        try:
+            reading = {
+                'sensor_id': int(item['sensor_id']),
+                'distance': float(item['distance']),
+                'timestamp': _parse_timestamp(item.get('ts'), now, latest)
+            }
+        except (KeyError, ValueError, TypeError, AttributeError, OverflowError, OSError):
+            results[index] = {
+                'sensor_id': item.get('sensor_id') if isinstance(item, dict) else None,
+                'success': False,
+                'error': 'sensor_id and numeric distance required, ts must be ISO 8601 or epoch seconds and not in the future'
+            }
+            continue
+
+        readings.append(reading)
+        positions.append(index)
+
+    if readings:
+        for index, result in zip(positions, SensorService.process_sensor_readings(readings)):
+            results[index] = result
+
+    accepted = sum(1 for result in results if result['success'])
+
+    return jsonify({
+        'success': True,
+        'count': len(results),
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'data': results
+    }), 200
+
+def _parse_timestamp(value, default, latest):
+    if value is None:
+        return default
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        parsed = datetime.utcfromtimestamp(value)
+    else:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if parsed > latest:
+        raise ValueError('Timestamp is in the future')
+    return parsed
+
 @api_bp.route('/sensors/<int:sensor_id>', methods=['GET'])
 def get_sensor_status(sensor_id):
     status = SensorService.get_sensor_status(sensor_id)
@@ -83,13 +154,64 @@ def update_battery_level(sensor_id):
 
 @api_bp.route('/sensors/health', methods=['GET'])
 def get_all_sensors_health():
-    health = SensorService.get_all_sensors_health()
+    sample_size = request.args.get('sample', default=10, type=int)
+    max_sample = current_app.config.get('SPOTS_MAX_PER_PAGE', 500)
+
+    if sample_size < 1 or sample_size > max_sample:
+        return jsonify({
+            'success': False,
+            'error': f'sample must be between 1 and {max_sample}'
+        }), 400
+
+    health = SensorService.get_all_sensors_health(sample_size)
 
     return jsonify({
         'success': True,
         'data': health
     }), 200
 
+@api_bp.route('/sensors/health/<category>', methods=['GET'])
+def get_sensors_by_health(category):
+    if category not in SensorService.HEALTH_CATEGORIES:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid health category'
+        }), 400
+
+    after = request.args.get('cursor', type=int)
+    max_limit = current_app.config.get('SPOTS_MAX_PER_PAGE', 500)
+    limit = request.args.get('limit', default=current_app.config.get('SPOTS_PER_PAGE', 50), type=int)
+
+    if limit < 1 or limit > max_limit:
+        return jsonify({
+            'success': False,
+            'error': f'limit must be between 1 and {max_limit}'
+        }), 400
+
+    sensors, next_cursor = SensorService.get_sensors_by_health(category, after=after, limit=limit)
+
+    return jsonify({
+        'success': True,
+        'count': len(sensors),
+        'next_cursor': next_cursor,
+        'data': sensors
+    }), 200
+
+@api_bp.route('/sensors/filter', methods=['GET'])
+def get_reading_filter_stats():
+    reading_filter = current_app.extensions.get('reading_filter')
+
+    if reading_filter is None:
+        return jsonify({
+            'success': True,
+            'data': {'enabled': False}
+        }), 200
+
+    return jsonify({
+        'success': True,
+        'data': dict(reading_filter.get_stats(), enabled=True)
+    }), 200
+
 @api_bp.route('/polling/status', methods=['GET'])
 def get_polling_status():
     polling_service = current_app.extensions.get('polling_service')
@@ -109,3 +231,19 @@ def get_polling_status():
         'success': True,
         'data': status
     }), 200
+
+
+@api_bp.route('/sensors/telemetry-buffer', methods=['GET'])
+def get_telemetry_buffer_stats():
+    buffer = current_app.extensions.get('telemetry_buffer')
+
+    if buffer is None:
+        return jsonify({
+            'success': True,
+            'data': {'enabled': False}
+        }), 200
+
+    return jsonify({
+        'success': True,
+        'data': dict(buffer.get_stats(), enabled=True)
+    }), 200
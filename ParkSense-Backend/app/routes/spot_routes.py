@@ -1,5 +1,7 @@
-from flask import jsonify, request
+from datetime import timedelta
+from flask import jsonify, request, current_app
 from app.routes import api_bp
+from app.routes.garage_routes import _parse_time_range
 from app.services.parking_service import ParkingService
 
 @api_bp.route('/spots/<int:space_id>', methods=['GET'])
@@ -48,6 +50,9 @@ def update_spot_occupancy(space_id):
 
 @api_bp.route('/spots/<int:space_id>/history', methods=['GET'])
 def get_spot_history(space_id):
+    if 'from' in request.args or 'to' in request.args:
+        return _get_spot_history_range(space_id)
+
     hours = request.args.get('hours', default=24, type=int)
 
     if hours < 1 or hours > 168:  
@@ -63,3 +68,29 @@ def get_spot_history(space_id):
         'count': len(history),
         'data': history
     }), 200
+
+def _get_spot_history_range(space_id):
+    try:
+        start, end = _parse_time_range(timedelta(hours=24))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    max_days = current_app.config.get('HISTORY_RANGE_MAX_DAYS', 366)
+    if end - start > timedelta(days=max_days):
+        return jsonify({
+            'success': False,
+            'error': f'Range must not exceed {max_days} days'
+        }), 400
+
+    history = ParkingService.get_occupancy_history(space_id, start=start, end=end)
+
+    return jsonify({
+        'success': True,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'count': len(history),
+        'data': history
+    }), 200
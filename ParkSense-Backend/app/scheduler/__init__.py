@@ -1,6 +1,6 @@
 """
 APScheduler Initialization
-Background scheduler for Arduino Cloud polling
+Background scheduler for Arduino Cloud polling and maintenance jobs
 """
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor
@@ -26,13 +26,18 @@ def init_scheduler(app):
 
     if not app.config.get('ARDUINO_POLL_ENABLED', False):
         logger.info("Arduino Cloud polling is disabled (ARDUINO_POLL_ENABLED=False)")
+
+    if not any(app.config.get(flag, False) for flag in ('ARDUINO_POLL_ENABLED', 'ROLLUP_ENABLED', 'HISTORY_RETENTION_ENABLED', 'FORECAST_ENABLED',
+                                                     'TELEMETRY_BUFFER_ENABLED', 'SENSOR_FILTER_SWEEP_ENABLED')):
         return None
 
-    logger.info("Initializing Arduino Cloud polling scheduler...")
+    logger.info("Initializing background scheduler...")
 
-    # Configure scheduler
+    # Configure scheduler; the Arduino Cloud poll and its retries get their own threads
+    # so a long rollup, archive or forecast run never delays a poll
     executors = {
-        'default': ThreadPoolExecutor(max_workers=2)
+        'default': ThreadPoolExecutor(max_workers=2),
+        'poll': ThreadPoolExecutor(max_workers=2)
     }
 
     job_defaults = {
@@ -61,10 +66,10 @@ def init_scheduler(app):
     return scheduler
 
 
-def shutdown_scheduler():
-    """Shutdown the scheduler gracefully"""
+def shutdown_scheduler(wait=True):
+    """Shutdown the scheduler gracefully, by default letting running jobs finish"""
     global scheduler
     if scheduler and scheduler.running:
         logger.info("Shutting down scheduler...")
-        scheduler.shutdown(wait=False)
+        scheduler.shutdown(wait=wait)
         logger.info("Scheduler shut down")
@@ -1,10 +1,42 @@
+import functools
 import logging
+import time
+from datetime import datetime, timedelta, timezone
+from apscheduler.jobstores.base import JobLookupError
+from config.arduino_config import ArduinoConfig
 from app.services.arduino_cloud_service import ArduinoCloudService
 from app.services.polling_service import PollingService
+from app.services.sensor_service import SensorService
+from app.services.rollup_service import RollupService
+from app.services.history_archive_service import HistoryArchiveService
+from app.services.forecast_service import ForecastService
 
 logger = logging.getLogger(__name__)
 
 
+def timed_job(app, job_id, func):
+    """
+    Wrap a job function to record its run time and failures in the app's metrics
+    """
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        metrics = app.extensions.get('metrics')
+        if metrics is None:
+            return func(*args, **kwargs)
+
+        labels = (('job', job_id),)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            metrics.inc('parksense_job_failures_total', labels)
+            raise
+        finally:
+            metrics.observe('parksense_job_duration_seconds', labels, time.perf_counter() - start)
+
+    return run
+
+
 def register_jobs(scheduler, app):
     """
     Register all scheduled jobs with the scheduler
@@ -14,6 +46,25 @@ def register_jobs(scheduler, app):
         app: Flask application instance
     """
     logger.info("Registering scheduled jobs...")
+
+    if app.config.get('ROLLUP_ENABLED', False):
+        register_rollup_job(scheduler, app)
+
+    if app.config.get('HISTORY_RETENTION_ENABLED', False):
+        register_history_retention_job(scheduler, app)
+
+    if app.config.get('FORECAST_ENABLED', False):
+        register_forecast_job(scheduler, app)
+
+    if app.config.get('TELEMETRY_BUFFER_ENABLED', False):
+        register_telemetry_flush_job(scheduler, app)
+
+    if app.config.get('SENSOR_FILTER_ENABLED', False) and app.config.get('SENSOR_FILTER_SWEEP_ENABLED', False):
+        register_reading_filter_sweep_job(scheduler, app)
+
+    if not app.config.get('ARDUINO_POLL_ENABLED', False):
+        return
+
     client_id = app.config.get('ARDUINO_CLIENT_ID')
     client_secret = app.config.get('ARDUINO_CLIENT_SECRET')
     thing_id = app.config.get('ARDUINO_THING_ID')
@@ -33,27 +84,260 @@ def register_jobs(scheduler, app):
         client_id=client_id,
         client_secret=client_secret,
         thing_id=thing_id,
-        max_retries=app.config.get('ARDUINO_MAX_RETRIES', 3)
+        max_retries=app.config.get('ARDUINO_MAX_RETRIES', 3),
+        thing_ids=app.config.get('ARDUINO_THING_IDS') or [thing_id],
+        token_url=app.config.get('ARDUINO_TOKEN_URL'),
+        api_base_url=app.config.get('ARDUINO_API_BASE_URL'),
+        max_workers=app.config.get('ARDUINO_POLL_WORKERS', 8),
+        rate_limit_requests=app.config.get('ARDUINO_RATE_LIMIT_REQUESTS', ArduinoConfig.RATE_LIMIT_REQUESTS),
+        rate_limit_period=app.config.get('ARDUINO_RATE_LIMIT_PERIOD', ArduinoConfig.RATE_LIMIT_PERIOD),
+        breaker_failure_threshold=app.config.get(
+            'ARDUINO_BREAKER_FAILURE_THRESHOLD', ArduinoConfig.BREAKER_FAILURE_THRESHOLD
+        ),
+        breaker_reset_timeout=app.config.get('ARDUINO_BREAKER_RESET_TIMEOUT', ArduinoConfig.BREAKER_RESET_TIMEOUT)
     )
 
     polling_service = PollingService(app, arduino_service)
 
-    interval = app.config.get('ARDUINO_POLL_INTERVAL', 5)
+    def poll(thing_ids=None):
+        result = polling_service.poll_and_update(thing_ids)
+        if result.get('skipped'):
+            return
+
+        # Retries run as one-off jobs so a failing poll never holds a scheduler thread while it waits
+        retry = result.get('retry')
+        if retry:
+            scheduler.add_job(
+                func=timed_job(app, 'arduino_cloud_poll_retry', poll),
+                trigger='date',
+                run_date=datetime.now(timezone.utc) + timedelta(seconds=retry['delay_seconds']),
+                args=[retry['thing_ids']],
+                id='arduino_cloud_poll_retry',
+                name='Arduino Cloud Poll Retry',
+                executor='poll',
+                replace_existing=True
+            )
+            logger.info(f"Retrying {len(retry['thing_ids'])} things in {retry['delay_seconds']} seconds "
+                        f"(attempt {retry['attempt']})")
+        elif thing_ids is None:
+            try:
+                scheduler.remove_job('arduino_cloud_poll_retry')
+            except JobLookupError:
+                pass
+
+        if thing_ids is None and polling_service.adaptive and polling_service.interval != poll.interval:
+            poll.interval = polling_service.interval
+            scheduler.reschedule_job('arduino_cloud_poll', trigger='interval', seconds=poll.interval)
+            logger.info(f"Arduino Cloud poll interval adjusted to {poll.interval:.1f} seconds")
+
+    interval = polling_service.interval
+    poll.interval = interval
 
     scheduler.add_job(
-        func=polling_service.poll_and_update,
+        func=timed_job(app, 'arduino_cloud_poll', poll),
         trigger='interval',
         seconds=interval,
         id='arduino_cloud_poll',
         name='Arduino Cloud Polling',
+        executor='poll',
         replace_existing=True,
         max_instances=1
     )
 
-    logger.info(f"Registered Arduino Cloud polling job (interval: {interval} seconds)")
+    logger.info(f"Registered Arduino Cloud polling job (interval: {interval} seconds, "
+                f"things: {len(arduino_service.thing_ids)})")
 
     if not hasattr(app, 'extensions'):
         app.extensions = {}
     app.extensions['polling_service'] = polling_service
 
     logger.info("All scheduled jobs registered successfully")
+
+
+def register_rollup_job(scheduler, app):
+    interval = app.config.get('ROLLUP_INTERVAL_SECONDS', 60)
+
+    def run_rollups():
+        with app.app_context():
+            run_rollups_until_caught_up(app)
+
+    scheduler.add_job(
+        func=timed_job(app, 'occupancy_rollup', run_rollups),
+        trigger='interval',
+        seconds=interval,
+        id='occupancy_rollup',
+        name='Occupancy Rollups',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    logger.info(f"Registered occupancy rollup job (interval: {interval} seconds)")
+
+
+def run_rollups_until_caught_up(app, max_batches=10):
+    """
+    Apply pending history in bounded batches
+
+    Must be called inside an application context.
+    """
+    from app import db
+
+    summary = None
+    for _ in range(max_batches):
+        try:
+            summary = RollupService.run(
+                batch_size=app.config.get('ROLLUP_BATCH_SIZE', 50000),
+                minute_retention_days=app.config.get('ROLLUP_MINUTE_RETENTION_DAYS', 7)
+            )
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Occupancy rollup failed: {e}", exc_info=True)
+            return None
+
+        if not summary['remaining']:
+            break
+
+    logger.debug(f"Occupancy rollups up to history_id {summary['last_history_id']}")
+    return summary
+
+
+def register_history_retention_job(scheduler, app):
+    interval = app.config.get('HISTORY_RETENTION_INTERVAL_SECONDS', 3600)
+
+    def archive_history():
+        with app.app_context():
+            run_history_retention(app)
+
+    scheduler.add_job(
+        func=timed_job(app, 'occupancy_history_retention', archive_history),
+        trigger='interval',
+        seconds=interval,
+        id='occupancy_history_retention',
+        name='Occupancy History Retention',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    logger.info(f"Registered history retention job (interval: {interval} seconds, "
+                f"retention: {app.config.get('HISTORY_RETENTION_DAYS', 30)} days)")
+
+
+def run_history_retention(app, max_batches=None):
+    """
+    Archive history past the retention window
+
+    Must be called inside an application context.
+    """
+    from app import db
+
+    try:
+        summary = HistoryArchiveService.run(
+            archive_dir=app.config['HISTORY_ARCHIVE_DIR'],
+            retention_days=app.config.get('HISTORY_RETENTION_DAYS', 30),
+            batch_size=app.config.get('HISTORY_ARCHIVE_BATCH_SIZE', 5000),
+            max_batches=max_batches or app.config.get('HISTORY_ARCHIVE_MAX_BATCHES', 20),
+            require_rollups=app.config.get('ROLLUP_ENABLED', False)
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"History retention failed: {e}", exc_info=True)
+        return None
+
+    if summary['archived_rows']:
+        logger.info(f"Archived {summary['archived_rows']} history rows older than {summary['cutoff']}")
+    return summary
+
+
+def register_forecast_job(scheduler, app):
+    interval = app.config.get('FORECAST_INTERVAL_SECONDS', 900)
+
+    def refresh_forecasts():
+        with app.app_context():
+            run_forecast_refresh(app)
+
+    scheduler.add_job(
+        func=timed_job(app, 'forecast_refresh', refresh_forecasts),
+        trigger='interval',
+        seconds=interval,
+        id='forecast_refresh',
+        name='Forecast Refresh',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    logger.info(f"Registered forecast refresh job (interval: {interval} seconds)")
+
+
+def run_forecast_refresh(app):
+    """
+    Fold newly completed slots into the forecast profiles
+
+    Must be called inside an application context.
+    """
+    from app import db
+    from app.services.forecast_service import get_forecast_store
+
+    try:
+        folded = ForecastService.refresh(
+            get_forecast_store(),
+            lookback_days=app.config.get('FORECAST_LOOKBACK_DAYS', 28),
+            decay=app.config.get('FORECAST_DECAY', 0.8)
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Forecast refresh failed: {e}", exc_info=True)
+        return None
+
+    logger.debug(f"Forecast slots folded per garage: {folded}")
+    return folded
+
+
+def register_telemetry_flush_job(scheduler, app):
+    interval = app.config.get('TELEMETRY_FLUSH_INTERVAL_SECONDS', 5)
+
+    def flush_telemetry():
+        with app.app_context():
+            buffer = app.extensions.get('telemetry_buffer')
+            if buffer is not None:
+                buffer.flush()
+
+    scheduler.add_job(
+        func=timed_job(app, 'telemetry_flush', flush_telemetry),
+        trigger='interval',
+        seconds=interval,
+        id='telemetry_flush',
+        name='Sensor Telemetry Flush',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    logger.info(f"Registered telemetry flush job (interval: {interval} seconds)")
+
+
+def register_reading_filter_sweep_job(scheduler, app):
+    interval = app.config.get('SENSOR_FILTER_SWEEP_INTERVAL_SECONDS', 1)
+
+    def settle_readings():
+        from app import db
+
+        with app.app_context():
+            try:
+                changed = SensorService.settle_pending_readings()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Reading filter sweep failed: {e}", exc_info=True)
+                return
+            if changed:
+                logger.debug(f"Reading filter sweep changed {changed} spots")
+
+    scheduler.add_job(
+        func=timed_job(app, 'reading_filter_sweep', settle_readings),
+        trigger='interval',
+        seconds=interval,
+        id='reading_filter_sweep',
+        name='Sensor Reading Filter Sweep',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    logger.info(f"Registered reading filter sweep job (interval: {interval} seconds)")
@@ -1,34 +1,292 @@
+import math
 import requests
 import logging
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from config.arduino_config import ArduinoConfig
 
 logger = logging.getLogger(__name__)
 
 
+class RetryableError(Exception):
+    """A request failed in a way worth trying again; retry_after is the earliest useful delay, if known"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(RetryableError):
+    pass
+
+
+class CircuitOpenError(RetryableError):
+    pass
+
+
+def _parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header, given as delay-seconds or an HTTP-date
+
+    Returns:
+        float: Non-negative, finite delay; DEFAULT_RETRY_DELAY if the header is missing or unparseable
+    """
+    if value is None:
+        return float(ArduinoConfig.DEFAULT_RETRY_DELAY)
+
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            moment = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return float(ArduinoConfig.DEFAULT_RETRY_DELAY)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        delay = (moment - datetime.now(timezone.utc)).total_seconds()
+
+    if not math.isfinite(delay):
+        return float(ArduinoConfig.DEFAULT_RETRY_DELAY)
+    return max(0.0, delay)
+
+
+class TokenCache:
+    """OAuth access token shared by every worker; only one of them refreshes it at a time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._token_expiry = None
+
+    def get(self, fetch):
+        with self._lock:
+            if self._access_token and self._token_expiry:
+                if datetime.utcnow() < self._token_expiry - timedelta(minutes=5):
+                    logger.debug("Using cached access token")
+                    return self._access_token
+
+            self._access_token, expires_in = fetch()
+            self._token_expiry = datetime.utcnow() + timedelta(seconds=expires_in)
+            return self._access_token
+
+    def invalidate(self, token=None):
+        """Drop the cached token, unless another worker already replaced the rejected one"""
+        with self._lock:
+            if token is None or token == self._access_token:
+                self._access_token = None
+                self._token_expiry = None
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request the service makes
+
+    Holds up to `max_requests` tokens, refilled continuously at `max_requests` per `period` seconds.
+    """
+
+    def __init__(self, max_requests=ArduinoConfig.RATE_LIMIT_REQUESTS, period=ArduinoConfig.RATE_LIMIT_PERIOD):
+        self.capacity = float(max_requests)
+        self.rate = max_requests / period
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    def acquire(self, max_wait=None):
+        """Block until a token is available, or raise RateLimited if that would take longer than max_wait"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.acquired += 1
+                    if waited:
+                        self.throttled += 1
+                        self.total_wait += waited
+                    return waited
+
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                if max_wait is not None and waited + delay > max_wait:
+                    self.rejected += 1
+                    raise RateLimited(f"Rate limited for another {delay:.1f}s", retry_after=delay)
+
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """Hold every caller back after the server answered 429"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'requests_per_second': self.rate,
+                'burst': self.capacity,
+                'acquired': self.acquired,
+                'throttled': self.throttled,
+                'rejected': self.rejected,
+                'total_wait_seconds': round(self.total_wait, 3)
+            }
+
+
+class CircuitBreaker:
+    """
+    Fails requests fast while Arduino Cloud looks down
+
+    closed: requests pass; `failure_threshold` consecutive failures open the circuit
+    open: requests are rejected without touching the network for `reset_timeout` seconds
+    half_open: a single probe passes; its success closes the circuit, its failure reopens it
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=ArduinoConfig.BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=ArduinoConfig.BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+
+        self.state = self.CLOSED
+        self.state_since = datetime.utcnow()
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+        self.trips = 0
+        self.rejected = 0
+        self.last_failure_time = None
+        self.last_failure = None
+        self.last_success_time = None
+
+    def _set_state(self, state):
+        self.state = state
+        self.state_since = datetime.utcnow()
+        logger.warning(f"Arduino Cloud circuit {state}")
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may go out now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit open, next probe in {remaining:.1f}s", retry_after=remaining)
+                self._set_state(self.HALF_OPEN)
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError("Circuit half-open, waiting for the probe request")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self.last_success_time = datetime.utcnow()
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, error):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            self.last_failure_time = datetime.utcnow()
+            self.last_failure = str(error)
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self.trips += 1
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def release(self):
+        """Give up an admitted request that never reached the server"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def get_stats(self):
+        with self._lock:
+            next_probe = None
+            if self.state == self.OPEN:
+                next_probe = round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 2)
+            return {
+                'state': self.state,
+                'state_since': self.state_since.isoformat(),
+                'seconds_in_state': round((datetime.utcnow() - self.state_since).total_seconds(), 1),
+                'next_probe_in_seconds': next_probe,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout_seconds': self.reset_timeout,
+                'trips': self.trips,
+                'rejected_requests': self.rejected,
+                'last_failure_time': self.last_failure_time.isoformat() if self.last_failure_time else None,
+                'last_failure': self.last_failure,
+                'last_success_time': self.last_success_time.isoformat() if self.last_success_time else None
+            }
+
+
+def is_transient(error):
+    """Network failures and server errors, as opposed to a request the server rejected"""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code >= 500
+
+
 class ArduinoCloudService:
 
-    def __init__(self, client_id, client_secret, thing_id, max_retries=3):
+    def __init__(self, client_id, client_secret, thing_id=None, max_retries=3, thing_ids=None,
+                 token_url=None, api_base_url=None, max_workers=ArduinoConfig.DEFAULT_POLL_WORKERS,
+                 timeout=ArduinoConfig.DEFAULT_TIMEOUT, rate_limit_requests=ArduinoConfig.RATE_LIMIT_REQUESTS,
+                 rate_limit_period=ArduinoConfig.RATE_LIMIT_PERIOD,
+                 breaker_failure_threshold=ArduinoConfig.BREAKER_FAILURE_THRESHOLD,
+                 breaker_reset_timeout=ArduinoConfig.BREAKER_RESET_TIMEOUT):
         self.client_id = client_id
         self.client_secret = client_secret
-        self.thing_id = thing_id
+        self.thing_ids = list(thing_ids or ([thing_id] if thing_id else []))
+        self.thing_id = thing_id or (self.thing_ids[0] if self.thing_ids else None)
         self.max_retries = max_retries
+        self.token_url = token_url or ArduinoConfig.TOKEN_URL
+        self.api_base_url = api_base_url or ArduinoConfig.API_BASE_URL
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
 
-        self._access_token = None
-        self._token_expiry = None
+        self.token_cache = TokenCache()
+        self.rate_limiter = RateLimiter(rate_limit_requests, rate_limit_period)
+        self.circuit_breaker = CircuitBreaker(breaker_failure_threshold, breaker_reset_timeout)
 
+        # One keep-alive pool sized for every worker hitting the API host at once
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'Content-Type': 'application/json'
         })
 
+        self._executor = None
+
     def get_access_token(self):
-        if self._access_token and self._token_expiry:
-            if datetime.utcnow() < self._token_expiry - timedelta(minutes=5):
-                logger.debug("Using cached access token")
-                return self._access_token
+        return self.token_cache.get(self._fetch_access_token)
 
+    def _fetch_access_token(self):
         logger.info("Requesting new access token from Arduino Cloud")
 
         token_data = {
@@ -39,39 +297,32 @@ class ArduinoCloudService:
         }
 
         try:
+            self.rate_limiter.acquire(max_wait=self.timeout)
             response = self.session.post(
-                ArduinoConfig.TOKEN_URL,
+                self.token_url,
                 data=token_data,
                 headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                timeout=ArduinoConfig.DEFAULT_TIMEOUT
+                timeout=self.timeout
             )
 
             response.raise_for_status()
             token_response = response.json()
 
-            self._access_token = token_response['access_token']
-            expires_in = token_response.get('expires_in', 3600)  
-            self._token_expiry = datetime.utcnow() + timedelta(seconds=expires_in)
-
+            expires_in = token_response.get('expires_in', 3600)
             logger.info(f"Access token acquired, expires in {expires_in} seconds")
-            return self._access_token
+            return token_response['access_token'], expires_in
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get access token: {str(e)}")
-            self._access_token = None
-            self._token_expiry = None
+            if is_transient(e):
+                raise
             raise Exception(f"Authentication failed: {str(e)}")
 
-    def get_properties(self):
-        access_token = self.get_access_token()
+    def get_properties(self, thing_id=None):
+        thing_id = thing_id or self.thing_id
+        url = ArduinoConfig.get_properties_url(thing_id, self.api_base_url)
 
-        url = ArduinoConfig.get_properties_url(self.thing_id)
-
-        properties_data = self._request_with_retry(
-            method='GET',
-            url=url,
-            headers={'Authorization': f'Bearer {access_token}'}
-        )
+        properties_data = self._request_with_retry(method='GET', url=url)
 
         properties = {}
         for prop in properties_data:
@@ -80,55 +331,96 @@ class ArduinoCloudService:
             if name is not None and value is not None:
                 properties[name] = value
 
-        logger.info(f"Retrieved {len(properties)} properties from Arduino Cloud")
+        logger.info(f"Retrieved {len(properties)} properties from Arduino Cloud thing {thing_id}")
         logger.debug(f"Properties: {properties}")
 
         return properties
 
+    def get_all_properties(self, thing_ids=None):
+        """
+        Fetch the properties of every Thing concurrently on a bounded thread pool
+
+        Returns:
+            dict: {thing_id: {'properties': dict or None, 'latency_ms': float, 'error': str or None,
+                              'retryable': bool, 'retry_after': float or None}}
+        """
+        thing_ids = list(thing_ids or self.thing_ids)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='arduino-poll')
+
+        futures = {thing_id: self._executor.submit(self._timed_fetch, thing_id) for thing_id in thing_ids}
+        return {thing_id: future.result() for thing_id, future in futures.items()}
+
+    def _timed_fetch(self, thing_id):
+        start = time.perf_counter()
+        try:
+            properties = self.get_properties(thing_id)
+            error = None
+        except Exception as e:
+            properties = None
+            error = e
+            logger.error(f"Failed to fetch thing {thing_id}: {error}")
+
+        return {
+            'properties': properties,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+            'error': str(error) if error else None,
+            'retryable': isinstance(error, RetryableError),
+            'retry_after': getattr(error, 'retry_after', None)
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
+
     def _request_with_retry(self, method, url, **kwargs):
+        """
+        Send a request through the rate limiter and circuit breaker
+
+        Nothing here sleeps on a failure: network errors, server errors and 429s raise
+        RetryableError straight away so the caller can schedule the retry. Only a rejected
+        access token is retried inline, since fetching a new one needs no wait.
+        """
         for attempt in range(self.max_retries):
+            self.circuit_breaker.before_request()
             try:
+                self.rate_limiter.acquire(max_wait=self.timeout)
+                access_token = self.get_access_token()
                 response = self.session.request(
                     method=method,
                     url=url,
-                    timeout=ArduinoConfig.DEFAULT_TIMEOUT,
+                    timeout=self.timeout,
+                    headers={'Authorization': f'Bearer {access_token}'},
                     **kwargs
                 )
-
-                if response.status_code == 429:
-                    retry_after = int(response.headers.get('Retry-After', ArduinoConfig.DEFAULT_RETRY_DELAY))
-                    logger.warning(f"Rate limited, retrying after {retry_after}s")
-                    time.sleep(retry_after)
-                    continue
-
-                if response.status_code == 401:
-                    logger.warning("Authentication failed, clearing token cache")
-                    self._access_token = None
-                    self._token_expiry = None
-                    if attempt < self.max_retries - 1:
-                        continue
-                    else:
-                        raise Exception("Authentication failed after retries")
-
-                response.raise_for_status()
-                return response.json()
-
-            except requests.exceptions.Timeout as e:
-                logger.warning(f"Request timeout (attempt {attempt + 1}/{self.max_retries}): {str(e)}")
-                if attempt < self.max_retries - 1:
-                    delay = ArduinoConfig.DEFAULT_RETRY_DELAY * (2 ** attempt)  
-                    time.sleep(delay)
-                    continue
-                else:
-                    raise Exception(f"Request failed after {self.max_retries} attempts: {str(e)}")
+                if response.status_code >= 500:
+                    response.raise_for_status()
 
             except requests.exceptions.RequestException as e:
-                logger.warning(f"Request failed (attempt {attempt + 1}/{self.max_retries}): {str(e)}")
-                if attempt < self.max_retries - 1:
-                    delay = ArduinoConfig.DEFAULT_RETRY_DELAY * (2 ** attempt)  
-                    time.sleep(delay)
-                    continue
-                else:
-                    raise Exception(f"Request failed after {self.max_retries} attempts: {str(e)}")
-
-        raise Exception("Max retries exceeded")
+                self.circuit_breaker.record_failure(e)
+                logger.warning(f"Request failed: {str(e)}")
+                raise RetryableError(f"Request failed: {str(e)}") from e
+
+            except Exception:
+                self.circuit_breaker.release()
+                raise
+
+            self.circuit_breaker.record_success()
+
+            if response.status_code == 429:
+                retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                logger.warning(f"Rate limited, retry after {retry_after}s")
+                self.rate_limiter.pause(retry_after)
+                raise RateLimited(f"Rate limited by Arduino Cloud for {retry_after}s", retry_after=retry_after)
+
+            if response.status_code == 401:
+                logger.warning("Authentication failed, clearing token cache")
+                self.token_cache.invalidate(access_token)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+        raise Exception("Authentication failed after retries")
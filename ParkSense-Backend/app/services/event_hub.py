@@ -0,0 +1,97 @@
+"""
+Occupancy event hub
+In-process publish/subscribe fan-out of occupancy changes to streaming clients
+"""
+import queue
+import threading
+import logging
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriberLimitReached(Exception):
+    pass
+
+
+class Subscription:
+    __slots__ = ('garage_id', 'queue', 'dropped')
+
+    def __init__(self, garage_id, maxsize):
+        self.garage_id = garage_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        """Enqueue without blocking; a subscriber that falls behind is told to resync"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            try:
+                while True:
+                    self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait({'type': 'resync', 'garage_id': self.garage_id})
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+
+class EventHub:
+
+    def __init__(self, queue_size=100, max_subscribers=5000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._count = 0
+        self.published = 0
+
+    def subscribe(self, garage_id):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise SubscriberLimitReached(f"Subscriber limit of {self.max_subscribers} reached")
+            subscription = Subscription(garage_id, self.queue_size)
+            self._subscribers.setdefault(garage_id, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.garage_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.garage_id]
+
+    def publish(self, garage_id, event):
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(garage_id, ()))
+            self.published += 1
+
+        for subscription in subscribers:
+            subscription.offer(event)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'garages': {garage_id: len(subs) for garage_id, subs in self._subscribers.items()},
+                'published': self.published
+            }
+
+
+def init_event_hub(app):
+    hub = EventHub(
+        queue_size=app.config.get('SSE_QUEUE_SIZE', 100),
+        max_subscribers=app.config.get('SSE_MAX_SUBSCRIBERS', 5000)
+    )
+    app.extensions['event_hub'] = hub
+    return hub
+
+
+def get_event_hub():
+    return current_app.extensions['event_hub']
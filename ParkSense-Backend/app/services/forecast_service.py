@@ -0,0 +1,284 @@
+"""
+Availability forecasts
+Time-of-week occupancy profiles per garage and floor, folded incrementally from
+occupancy_history by a scheduler job and served from memory
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import numpy as np
+from flask import current_app
+from app import db
+from app.models.parking_spot import ParkingSpot
+from app.models.occupancy_history import OccupancyHistory
+from app.models.occupancy_forecast import OccupancyForecast, ForecastWatermark
+from app.services.occupancy_series_service import OccupancySeriesService
+
+EPOCH = datetime(1970, 1, 1)
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+class GarageForecast:
+    """
+    Profiles for one garage as (series, slot) arrays
+
+    Row 0 is the garage-wide series, followed by one row per floor.
+    """
+
+    def __init__(self, garage_id, floors, slots):
+        self.garage_id = garage_id
+        self.floors = [OccupancyForecast.GARAGE_LEVEL] + floors
+        self.rows = {floor_number: row for row, floor_number in enumerate(self.floors)}
+        self.total_spots = np.zeros(len(self.floors), dtype=np.int64)
+        self.occupied = np.zeros((len(self.floors), slots))
+        self.peak = np.zeros((len(self.floors), slots))
+        self.weight = np.zeros((len(self.floors), slots))
+        self.forecast_ids = {}
+        self.processed_until = None
+
+
+class ForecastStore:
+
+    def __init__(self, slot_minutes=15, tz='UTC'):
+        self.slot_minutes = slot_minutes
+        self.slots = MINUTES_PER_WEEK // slot_minutes
+        self.tz = ZoneInfo(tz)
+        self._lock = threading.Lock()
+        self._garages = {}
+
+    def load(self):
+        garages = {}
+        for garage_id in ForecastService.garage_floors():
+            garages[garage_id] = ForecastService.load_garage(self, garage_id)
+        with self._lock:
+            self._garages = garages
+
+    def set(self, forecast):
+        with self._lock:
+            self._garages[forecast.garage_id] = forecast
+
+    def slot_for(self, moment):
+        """Time-of-week slot in the configured timezone for a naive UTC datetime"""
+        local = moment.replace(tzinfo=timezone.utc).astimezone(self.tz)
+        return (local.weekday() * 1440 + local.hour * 60 + local.minute) // self.slot_minutes
+
+    def slot_start(self, moment):
+        seconds = self.slot_minutes * 60
+        offset = int((moment - EPOCH).total_seconds()) // seconds * seconds
+        return EPOCH + timedelta(seconds=offset)
+
+    def get_forecast(self, garage_id, at, count, floor_number=None):
+        """
+        Forecast for `count` slots starting with the one containing `at`
+
+        Cost depends only on `count`, never on how much history the profile was built from.
+
+        Returns:
+            dict: Forecast, or None if the garage or floor is unknown
+        """
+        with self._lock:
+            forecast = self._garages.get(garage_id)
+        if forecast is None:
+            return None
+
+        row = forecast.rows.get(floor_number or OccupancyForecast.GARAGE_LEVEL)
+        if row is None:
+            return None
+
+        total_spots = int(forecast.total_spots[row])
+        start = self.slot_start(at)
+        step = timedelta(minutes=self.slot_minutes)
+        first_slot = self.slot_for(start)
+
+        entries = []
+        for i in range(count):
+            slot = (first_slot + i) % self.slots
+            weight = forecast.weight[row, slot]
+            entry = {
+                'time': (start + i * step).isoformat(),
+                'expected_occupied': None,
+                'expected_available': None,
+                'occupancy_rate': None,
+                'expected_peak': None,
+                'confidence': round(float(weight), 2)
+            }
+            if weight > 0:
+                occupied = forecast.occupied[row, slot] / weight
+                entry['expected_occupied'] = round(float(occupied), 1)
+                entry['expected_available'] = round(float(total_spots - occupied), 1)
+                entry['occupancy_rate'] = round(float(occupied / total_spots * 100), 2) if total_spots else 0
+                entry['expected_peak'] = round(float(forecast.peak[row, slot] / weight), 1)
+            entries.append(entry)
+
+        return {
+            'garage_id': garage_id,
+            'floor_number': floor_number,
+            'total_spots': total_spots,
+            'slot_minutes': self.slot_minutes,
+            'timezone': str(self.tz),
+            'history_through': forecast.processed_until.isoformat() if forecast.processed_until else None,
+            'forecast': entries
+        }
+
+
+class ForecastService:
+
+    @staticmethod
+    def garage_floors():
+        floors = {}
+        rows = db.session.query(ParkingSpot.garage_id, ParkingSpot.floor_number).distinct().order_by(
+            ParkingSpot.garage_id, ParkingSpot.floor_number
+        )
+        for garage_id, floor_number in rows:
+            floors.setdefault(garage_id, []).append(floor_number)
+        return floors
+
+    @staticmethod
+    def load_garage(store, garage_id, floors=None):
+        if floors is None:
+            floors = ForecastService.garage_floors().get(garage_id, [])
+        forecast = GarageForecast(garage_id, floors, store.slots)
+
+        for row in OccupancyForecast.query.filter_by(garage_id=garage_id):
+            index = forecast.rows.get(row.floor_number)
+            if index is None or row.slot >= store.slots:
+                continue
+            forecast.total_spots[index] = row.total_spots
+            forecast.occupied[index, row.slot] = row.weighted_occupied
+            forecast.peak[index, row.slot] = row.weighted_peak
+            forecast.weight[index, row.slot] = row.weight
+            forecast.forecast_ids[(row.floor_number, row.slot)] = row.forecast_id
+
+        watermark = db.session.get(ForecastWatermark, garage_id)
+        forecast.processed_until = watermark.processed_until if watermark else None
+        return forecast
+
+    @staticmethod
+    def refresh(store, now=None, lookback_days=28, decay=0.8, max_span_days=7):
+        """
+        Fold completed slots since each garage's watermark into its profiles
+
+        Each slot keeps exponentially decayed sums, so an observation from k weeks ago
+        counts decay**k as much as this week's and the profile follows changing demand.
+
+        Returns:
+            dict: Number of slots folded per garage
+        """
+        now = now or datetime.utcnow()
+        end = store.slot_start(now)
+        step = store.slot_minutes * 60
+        folded = {}
+
+        for garage_id, floors in ForecastService.garage_floors().items():
+            forecast = ForecastService.load_garage(store, garage_id, floors)
+
+            start = forecast.processed_until
+            if start is None:
+                first = db.session.query(db.func.min(OccupancyHistory.timestamp)).filter(
+                    OccupancyHistory.garage_id == garage_id
+                ).scalar()
+                start = store.slot_start(max(first or end, now - timedelta(days=lookback_days)))
+
+            touched = np.zeros(store.slots, dtype=bool)
+            while start < end:
+                chunk_end = min(end, start + timedelta(days=max_span_days))
+                touched |= ForecastService._fold(store, forecast, start, chunk_end, step, decay)
+                start = chunk_end
+
+            forecast.processed_until = max(start, end)
+            ForecastService._save(forecast, touched)
+            db.session.commit()
+            store.set(forecast)
+            folded[garage_id] = int(touched.sum())
+
+        return folded
+
+    @staticmethod
+    def _fold(store, forecast, start, end, step, decay):
+        averages = []
+        peaks = []
+        for row, floor_number in enumerate(forecast.floors):
+            series = OccupancySeriesService.load(
+                forecast.garage_id, start, end, step,
+                floor_number if floor_number != OccupancyForecast.GARAGE_LEVEL else None
+            )
+            total_spots, _, avg, peak = series
+            forecast.total_spots[row] = total_spots
+            averages.append(avg)
+            peaks.append(peak)
+
+        averages = np.vstack(averages)
+        peaks = np.vstack(peaks)
+        buckets = averages.shape[1]
+        slots = np.array([store.slot_for(start + timedelta(seconds=i * step)) for i in range(buckets)])
+
+        # Rank each bucket among the buckets of its slot, oldest first, so the newest
+        # observation of a slot gets weight 1 and older ones decay**(newer count)
+        counts = np.bincount(slots, minlength=store.slots)
+        order = np.argsort(slots, kind='stable')
+        first_of_slot = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        rank = np.empty(buckets, dtype=np.int64)
+        rank[order] = np.arange(buckets) - first_of_slot[slots[order]]
+        weights = decay ** (counts[slots] - 1 - rank)
+
+        factor = decay ** counts
+        forecast.occupied *= factor
+        forecast.peak *= factor
+        forecast.weight *= factor
+        np.add.at(forecast.occupied, (slice(None), slots), averages * weights)
+        np.add.at(forecast.peak, (slice(None), slots), peaks * weights)
+        np.add.at(forecast.weight, (slice(None), slots), np.broadcast_to(weights, averages.shape))
+
+        return counts > 0
+
+    @staticmethod
+    def _save(forecast, touched):
+        table = OccupancyForecast.__table__
+        inserts = []
+        updates = []
+        for slot in np.flatnonzero(touched).tolist():
+            for row, floor_number in enumerate(forecast.floors):
+                values = {
+                    'total_spots': int(forecast.total_spots[row]),
+                    'weighted_occupied': float(forecast.occupied[row, slot]),
+                    'weighted_peak': float(forecast.peak[row, slot]),
+                    'weight': float(forecast.weight[row, slot])
+                }
+                forecast_id = forecast.forecast_ids.get((floor_number, slot))
+                if forecast_id is None:
+                    inserts.append(dict(values, garage_id=forecast.garage_id, floor_number=floor_number, slot=slot))
+                else:
+                    updates.append({f'b_{key}': value for key, value in dict(values, forecast_id=forecast_id).items()})
+
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(
+                table.update().where(table.c.forecast_id == db.bindparam('b_forecast_id')).values(
+                    total_spots=db.bindparam('b_total_spots'),
+                    weighted_occupied=db.bindparam('b_weighted_occupied'),
+                    weighted_peak=db.bindparam('b_weighted_peak'),
+                    weight=db.bindparam('b_weight')
+                ),
+                updates
+            )
+
+        watermark = db.session.get(ForecastWatermark, forecast.garage_id)
+        if watermark is None:
+            db.session.add(ForecastWatermark(garage_id=forecast.garage_id, processed_until=forecast.processed_until))
+        else:
+            watermark.processed_until = forecast.processed_until
+
+
+def init_forecast_store(app):
+    store = ForecastStore(
+        slot_minutes=app.config.get('FORECAST_SLOT_MINUTES', 15),
+        tz=app.config.get('FORECAST_TIMEZONE', 'UTC')
+    )
+    store.load()
+    app.extensions['forecast_store'] = store
+    return store
+
+
+def get_forecast_store():
+    return current_app.extensions['forecast_store']
@@ -0,0 +1,258 @@
+"""
+Occupancy history retention
+Moves transitions older than the retention window out of occupancy_history into
+gzip-compressed, run-length-encoded archive files that can still be queried
+"""
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from app import db
+from app.models.occupancy_history import OccupancyHistory
+from app.models.occupancy_rollup import RollupWatermark
+from app.utils.batching import chunked
+
+logger = logging.getLogger(__name__)
+
+# Consecutive space_ids stored per gzip member, the unit a one-spot lookup decompresses
+BLOCK_SPOTS = 64
+
+
+class HistoryArchiveService:
+
+    @staticmethod
+    def run(archive_dir, retention_days=30, batch_size=5000, max_batches=20, require_rollups=True, now=None):
+        """
+        Archive and delete history rows older than the retention window
+
+        Each batch is written to disk and deleted in its own short transaction, so the
+        ingestion path never waits on more than one batch. Rows are only archived once
+        the rollup job has applied them, and the newest row is always kept so ids keep
+        increasing.
+
+        Returns:
+            dict: Summary with the number of rows archived and whether more remain
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=retention_days)
+        upper_id = HistoryArchiveService._archivable_until(require_rollups)
+
+        summary = {
+            'archived_rows': 0,
+            'batches': 0,
+            'cutoff': cutoff.isoformat(),
+            'remaining': False
+        }
+        if upper_id is None:
+            return summary
+
+        table = OccupancyHistory.__table__
+        for _ in range(max_batches):
+            rows = db.session.query(
+                OccupancyHistory.history_id,
+                OccupancyHistory.space_id,
+                OccupancyHistory.was_occupied,
+                OccupancyHistory.timestamp
+            ).filter(
+                OccupancyHistory.timestamp < cutoff,
+                OccupancyHistory.history_id <= upper_id
+            ).order_by(OccupancyHistory.history_id).limit(batch_size).all()
+
+            if not rows:
+                db.session.commit()
+                return summary
+
+            HistoryArchiveService._write_batch(archive_dir, rows)
+
+            for ids in chunked([row.history_id for row in rows]):
+                db.session.execute(table.delete().where(table.c.history_id.in_(ids)))
+            db.session.commit()
+
+            summary['archived_rows'] += len(rows)
+            summary['batches'] += 1
+            if len(rows) < batch_size:
+                return summary
+
+        summary['remaining'] = True
+        return summary
+
+    @staticmethod
+    def _archivable_until(require_rollups):
+        max_id = db.session.query(db.func.max(OccupancyHistory.history_id)).scalar()
+        if max_id is None:
+            return None
+        upper_id = max_id - 1
+
+        if require_rollups:
+            rolled_up = db.session.query(db.func.min(RollupWatermark.last_history_id)).scalar()
+            if rolled_up is None:
+                return None
+            upper_id = min(upper_id, rolled_up)
+
+        return upper_id
+
+    @staticmethod
+    def _write_batch(archive_dir, rows):
+        """
+        Append gzip members for each day touched by the batch, plus their index entries
+
+        Spots are split into blocks of BLOCK_SPOTS consecutive space_ids, one gzip member
+        each. A member starts with a header naming the history_id range and space_id range
+        it holds, followed by one line per spot with its runs as [timestamp, occupied]
+        pairs. Consecutive transitions to the same state are merged.
+
+        Each day file has a sidecar index with one line per member giving its byte offset,
+        length and ranges, so a one-spot lookup only decompresses the block holding it.
+        Members are synced before their index lines are written; a crash in between leaves
+        members the index never points at, and the batch is written again on the next run.
+        """
+        os.makedirs(archive_dir, exist_ok=True)
+
+        days = defaultdict(lambda: defaultdict(list))
+        for row in rows:
+            days[row.timestamp.date()][row.space_id].append((row.timestamp, row.was_occupied))
+
+        history_ids = [rows[0].history_id, rows[-1].history_id]
+
+        for day, spots in days.items():
+            blocks = defaultdict(list)
+            for space_id in sorted(spots):
+                runs = []
+                for timestamp, was_occupied in sorted(spots[space_id]):
+                    if runs and runs[-1][1] == int(was_occupied):
+                        continue
+                    runs.append([timestamp.isoformat(), int(was_occupied)])
+                blocks[space_id // BLOCK_SPOTS].append(
+                    json.dumps({'space_id': space_id, 'runs': runs}, separators=(',', ':'))
+                )
+
+            path = HistoryArchiveService._day_path(archive_dir, day)
+            index_path = HistoryArchiveService._index_path(path)
+            index = []
+            with open(path, 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                if offset and not os.path.exists(index_path):
+                    # Written before files were indexed, covered by one entry that is read in full
+                    index.append({'offset': 0, 'length': offset})
+
+                for block, lines in blocks.items():
+                    space_ids = [block * BLOCK_SPOTS, (block + 1) * BLOCK_SPOTS - 1]
+                    header = json.dumps({'history_ids': history_ids, 'space_ids': space_ids, 'rows': len(rows)})
+                    member = gzip.compress(('\n'.join([header] + lines) + '\n').encode('utf-8'))
+                    f.write(member)
+                    index.append({
+                        'offset': offset,
+                        'length': len(member),
+                        'history_ids': history_ids,
+                        'space_ids': space_ids
+                    })
+                    offset += len(member)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with open(index_path, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        # Close off a line torn by a crash so it cannot swallow the next entry
+                        f.write(b'\n')
+                lines = [json.dumps(entry, separators=(',', ':')) + '\n' for entry in index]
+                f.write(''.join(lines).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _day_path(archive_dir, day):
+        return os.path.join(archive_dir, f'occupancy_history-{day.isoformat()}.jsonl.gz')
+
+    @staticmethod
+    def _index_path(path):
+        return path[:-len('.jsonl.gz')] + '.idx.jsonl'
+
+    @staticmethod
+    def _members_for(path, space_id):
+        """(offset, length) of the members that may hold space_id, None to read the whole file"""
+        index_path = HistoryArchiveService._index_path(path)
+        if not os.path.exists(index_path):
+            return None
+
+        members = []
+        seen = set()
+        with open(index_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write; its batch was archived again
+                    continue
+                space_ids = entry.get('space_ids')
+                if space_ids is not None:
+                    if not space_ids[0] <= space_id <= space_ids[1]:
+                        continue
+                    # A batch rewritten after a crash before its delete committed
+                    key = (tuple(entry['history_ids']), tuple(space_ids))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                members.append((entry['offset'], entry['length']))
+        return members
+
+    @staticmethod
+    def _read_spot_runs(lines, space_id, start, end, entries):
+        seen = set()
+        skip = False
+        for line in lines:
+            record = json.loads(line)
+            if 'history_ids' in record:
+                # A batch rewritten after a crash before its delete committed
+                key = (tuple(record['history_ids']), tuple(record.get('space_ids') or ()))
+                skip = key in seen
+                seen.add(key)
+                continue
+            if skip or record['space_id'] != space_id:
+                continue
+            for timestamp, was_occupied in record['runs']:
+                timestamp = datetime.fromisoformat(timestamp)
+                if start <= timestamp < end:
+                    entries.add((timestamp, bool(was_occupied)))
+
+    @staticmethod
+    def get_spot_history(archive_dir, space_id, start, end):
+        """
+        Archived transitions for one spot in [start, end), newest first
+
+        Returns entries shaped like OccupancyHistory.to_dict() with history_id None
+        """
+        entries = set()
+        day = start.date()
+        while day <= end.date():
+            path = HistoryArchiveService._day_path(archive_dir, day)
+            day += timedelta(days=1)
+            if not os.path.exists(path):
+                continue
+
+            members = HistoryArchiveService._members_for(path, space_id)
+            if members is None:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    HistoryArchiveService._read_spot_runs(f, space_id, start, end, entries)
+                continue
+
+            with open(path, 'rb') as f:
+                for offset, length in members:
+                    f.seek(offset)
+                    lines = gzip.decompress(f.read(length)).decode('utf-8').splitlines()
+                    HistoryArchiveService._read_spot_runs(lines, space_id, start, end, entries)
+
+        return [
+            {
+                'history_id': None,
+                'space_id': space_id,
+                'was_occupied': was_occupied,
+                'timestamp': timestamp.isoformat()
+            }
+            for timestamp, was_occupied in sorted(entries, reverse=True)
+        ]
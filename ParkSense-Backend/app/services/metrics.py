@@ -0,0 +1,252 @@
+"""
+Metrics
+Request, SQL, scheduler job and cache instrumentation served as Prometheus text at /metrics
+
+Counters and histograms are kept in one shard per thread, so recording never takes a lock;
+a scrape sums the shards. Each process serves its own numbers.
+"""
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app
+from app import db
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class _Shard:
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}
+        # (name, labels) -> per-bucket counts with the +Inf bucket last, then sum, then count
+        self.histograms = {}
+
+
+class Metrics:
+    """
+    Labels are tuples of (name, value) pairs in a fixed order per metric.
+    """
+
+    def __init__(self, max_shards=256):
+        self.max_shards = max_shards
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._meta = {}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+
+    def add_collector(self, collect):
+        """collect() -> [(name, kind, help, [(labels, value)])], called on every scrape"""
+        self._collectors.append(collect)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+                if len(self._shards) > self.max_shards:
+                    self._retire_dead()
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        buckets = self._meta[name][2]
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(buckets) + 3)
+        counts[bisect_left(buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def _retire_dead(self):
+        """Fold shards of finished threads into one, must hold the lock"""
+        live = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                self._merge(self._retired, shard)
+        self._shards = live
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, value in dict(shard.counters).items():
+            target.counters[key] = target.counters.get(key, 0) + value
+        for key, counts in dict(shard.histograms).items():
+            total = target.histograms.get(key)
+            if total is None:
+                target.histograms[key] = list(counts)
+            else:
+                for i, value in enumerate(list(counts)):
+                    total[i] += value
+
+    def snapshot(self):
+        with self._lock:
+            self._retire_dead()
+            total = _Shard(None)
+            self._merge(total, self._retired)
+            for shard in self._shards:
+                self._merge(total, shard)
+        return total
+
+    # Requests
+
+    def start_request(self):
+        return time.perf_counter(), getattr(self._local, 'queries', 0), getattr(self._local, 'query_seconds', 0.0)
+
+    def finish_request(self, started, request, response):
+        start, queries, query_seconds = started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+
+        self.observe('parksense_http_request_duration_seconds', labels, time.perf_counter() - start)
+        self.inc('parksense_http_requests_total', labels + (('status', str(response.status_code)),))
+        if response.content_length is not None:
+            self.observe('parksense_http_response_size_bytes', labels, response.content_length)
+        self.observe('parksense_http_request_queries', labels, getattr(self._local, 'queries', 0) - queries)
+        self.observe('parksense_http_request_query_seconds', labels,
+                     getattr(self._local, 'query_seconds', 0.0) - query_seconds)
+
+    # SQL, from engine events
+
+    # The start time lives on the statement's execution context rather than the connection,
+    # so a statement that raises leaves nothing behind for the next one to pop
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        local = self._local
+        local.queries = getattr(local, 'queries', 0) + 1
+        local.query_seconds = getattr(local, 'query_seconds', 0.0) + elapsed
+        self.inc('parksense_db_queries_total')
+        self.inc('parksense_db_query_seconds_total', value=elapsed)
+
+    def instrument_engine(self, engine):
+        db.event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        db.event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # Exposition
+
+    def render(self):
+        total = self.snapshot()
+        families = {}
+        for (name, labels), value in total.counters.items():
+            families.setdefault(name, []).append((labels, value))
+        for (name, labels), counts in total.histograms.items():
+            families.setdefault(name, []).append((labels, counts))
+
+        lines = []
+        for name in sorted(families):
+            kind, help_text, buckets = self._meta.get(name, ('untyped', '', None))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(families[name], key=lambda sample: sample[0]):
+                if kind != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _response_cache_samples(app):
+    cache = app.extensions.get('response_cache')
+    if cache is None:
+        return []
+    stats = cache.get_stats()
+    return [
+        ('parksense_response_cache_hits_total', 'counter', 'Response cache lookups served from the cache',
+         [((), stats['hits'])]),
+        ('parksense_response_cache_misses_total', 'counter', 'Response cache lookups that built a response',
+         [((), stats['misses'])]),
+        ('parksense_response_cache_hit_ratio', 'gauge', 'Share of response cache lookups that hit',
+         [((), stats['hit_rate'])]),
+        ('parksense_response_cache_invalidations_total', 'counter', 'Entries dropped by occupancy changes',
+         [((), stats['invalidations'])]),
+        ('parksense_response_cache_evictions_total', 'counter', 'Entries dropped for space',
+         [((), stats['evictions'])]),
+        ('parksense_response_cache_entries', 'gauge', 'Entries held', [((), stats['entries'])]),
+        ('parksense_response_cache_bytes', 'gauge', 'Bytes held, gzip copies included', [((), stats['bytes'])]),
+    ]
+
+
+def init_metrics(app):
+    metrics = None
+    if app.config.get('METRICS_ENABLED', True):
+        metrics = Metrics()
+        metrics.describe('parksense_http_requests_total', 'counter', 'API requests by route, method and status')
+        metrics.describe('parksense_http_request_duration_seconds', 'histogram', 'API request latency',
+                         LATENCY_BUCKETS)
+        metrics.describe('parksense_http_response_size_bytes', 'histogram', 'API response body size', SIZE_BUCKETS)
+        metrics.describe('parksense_http_request_queries', 'histogram', 'SQL statements per API request',
+                         QUERY_BUCKETS)
+        metrics.describe('parksense_http_request_query_seconds', 'histogram', 'SQL time per API request',
+                         LATENCY_BUCKETS)
+        metrics.describe('parksense_db_queries_total', 'counter', 'SQL statements executed')
+        metrics.describe('parksense_db_query_seconds_total', 'counter', 'Time spent executing SQL')
+        metrics.describe('parksense_job_duration_seconds', 'histogram', 'Scheduler job run time', JOB_BUCKETS)
+        metrics.describe('parksense_job_failures_total', 'counter', 'Scheduler job runs that raised')
+        metrics.describe('parksense_poll_stage_seconds', 'histogram', 'Arduino Cloud poll time per stage',
+                         JOB_BUCKETS)
+        metrics.describe('parksense_polls_total', 'counter', 'Arduino Cloud polls by outcome')
+
+        metrics.instrument_engine(db.engine)
+        metrics.add_collector(lambda: _response_cache_samples(app))
+        app.add_url_rule('/metrics', 'metrics', lambda: Response(metrics.render(), content_type=CONTENT_TYPE))
+    app.extensions['metrics'] = metrics
+    return metrics
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
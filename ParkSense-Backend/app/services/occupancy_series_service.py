@@ -0,0 +1,139 @@
+"""
+Occupancy time series
+Resamples a garage's or floor's occupancy_history transitions onto a fixed step
+with NumPy, one cumulative sum over the whole range instead of a loop per row
+"""
+import numpy as np
+from app import db
+from app.models.parking_spot import ParkingSpot
+from app.models.occupancy_history import OccupancyHistory
+
+
+class OccupancySeriesService:
+
+    @staticmethod
+    def get_series(garage_id, start, end, step_seconds, floor_number=None):
+        """
+        Time-weighted average and peak occupancy for each step in [start, end)
+
+        Returns:
+            dict: Columnar series, or None if the garage or floor has no spots
+        """
+        series = OccupancySeriesService.load(garage_id, start, end, step_seconds, floor_number)
+        if series is None:
+            return None
+        total_spots, transitions, avg, peak = series
+
+        offsets = np.arange(len(avg), dtype=np.int64) * int(step_seconds * 1_000_000)
+        bucket_starts = np.datetime64(start, 'us') + offsets.astype('timedelta64[us]')
+        return {
+            'garage_id': garage_id,
+            'floor_number': floor_number,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'step_seconds': step_seconds,
+            'total_spots': total_spots,
+            'transitions': transitions,
+            'timestamps': np.datetime_as_string(bucket_starts, unit='s').tolist(),
+            'occupied_avg': np.round(avg, 2).tolist(),
+            'occupied_peak': peak.tolist(),
+            'occupancy_rate': np.round(avg / total_spots * 100, 2).tolist()
+        }
+
+    @staticmethod
+    def load(garage_id, start, end, step_seconds, floor_number=None):
+        """
+        Resampled occupancy as arrays
+
+        The level at `start` is the current occupancy minus the net of every transition
+        since, so only transitions inside the range are loaded row by row.
+
+        Returns:
+            tuple: (total_spots, transition count, average array, peak array), or None
+                if the garage or floor has no spots
+        """
+        spot_filters = [ParkingSpot.garage_id == garage_id]
+        history_filters = [OccupancyHistory.garage_id == garage_id]
+        if floor_number is not None:
+            spot_filters.append(ParkingSpot.floor_number == floor_number)
+            history_filters.append(OccupancyHistory.floor_number == floor_number)
+
+        delta = db.case((OccupancyHistory.was_occupied, 1), else_=-1)
+        after_end = db.session.query(db.func.coalesce(db.func.sum(delta), 0)).filter(
+            *history_filters, OccupancyHistory.timestamp >= end
+        ).scalar_subquery()
+
+        total_spots, occupied_now, net_after_end = db.session.query(
+            db.func.count(ParkingSpot.space_id),
+            db.func.coalesce(db.func.sum(db.case((ParkingSpot.is_occupied, 1), else_=0)), 0),
+            after_end
+        ).filter(*spot_filters).one()
+
+        if not total_spots:
+            return None
+
+        # Offsets come back as plain numbers, so the DBAPI rows go straight into an array
+        # without building a datetime or a Row per transition
+        result = db.session.connection().execute(
+            db.select(OccupancySeriesService._seconds_since(OccupancyHistory.timestamp, start), delta).where(
+                *history_filters,
+                OccupancyHistory.timestamp >= start,
+                OccupancyHistory.timestamp < end
+            ).order_by(OccupancyHistory.timestamp)
+        )
+        changes = np.array(result.cursor.fetchall(), dtype=np.float64).reshape(-1, 2)
+        result.close()
+
+        times = changes[:, 0]
+        deltas = changes[:, 1].astype(np.int64)
+
+        level_at_start = int(occupied_now) - int(net_after_end) - int(deltas.sum())
+        avg, peak = OccupancySeriesService.resample(
+            times, deltas, level_at_start, (end - start).total_seconds(), step_seconds
+        )
+
+        return total_spots, len(deltas), avg, peak
+
+    @staticmethod
+    def _seconds_since(column, start):
+        if db.engine.dialect.name == 'sqlite':
+            return (db.func.julianday(column) - db.func.julianday(start)) * 86400.0
+        return db.func.extract('epoch', column - start)
+
+    @staticmethod
+    def resample(times, deltas, initial_level, span, step):
+        """
+        Resample a step function given as sorted change times and deltas
+
+        Args:
+            times: Seconds since the start of the range, sorted ascending
+            deltas: Change in level at each time
+            initial_level: Level at time 0
+            span: Length of the range in seconds
+            step: Bucket width in seconds; the last bucket may be shorter
+
+        Returns:
+            tuple: (time-weighted average, peak) per bucket as NumPy arrays
+        """
+        edges = np.append(np.arange(0, span, step, dtype=np.float64), span)
+        widths = np.diff(edges)
+
+        # Level after each change, and the running area under the curve at each change
+        levels = initial_level + np.concatenate(([0], np.cumsum(deltas)))
+        points = np.concatenate(([0.0], times))
+        area = np.concatenate(([0.0], np.cumsum(levels[:-1] * np.diff(points))))
+
+        last_change = np.searchsorted(points, edges, side='right') - 1
+        area_at_edges = area[last_change] + levels[last_change] * (edges - points[last_change])
+        avg = np.diff(area_at_edges) / widths
+
+        # Peak is the level entering the bucket or after any change inside it
+        first = last_change[:-1]
+        peak = levels[first].copy()
+        inside = last_change[1:] > first
+        if inside.any():
+            # The sentinel keeps first + 1 in bounds for trailing buckets with no changes
+            segment_max = np.maximum.reduceat(np.append(levels, levels[-1]), first + 1)
+            peak[inside] = np.maximum(peak[inside], segment_max[inside])
+
+        return avg, peak
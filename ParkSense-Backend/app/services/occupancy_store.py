@@ -0,0 +1,522 @@
+"""
+In-memory occupancy store
+Process-resident per-garage, per-floor spot state with precomputed counters
+"""
+import base64
+import threading
+import logging
+import uuid
+import zlib
+from array import array
+from collections import deque
+from flask import current_app
+from app import db
+from app.models.parking_garage import ParkingGarage
+from app.models.parking_spot import ParkingSpot
+from app.models.sensor import Sensor
+from app.models.occupancy_history import OccupancyHistory
+
+logger = logging.getLogger(__name__)
+
+
+class FloorState:
+    __slots__ = ('floor_number', 'space_ids', 'spot_numbers', 'spot_types',
+                 'bits', 'last_updated', 'sensor_status', 'occupied_count', 'version', 'seq')
+
+    def __init__(self, floor_number, seq=0):
+        self.floor_number = floor_number
+        self.space_ids = array('l')
+        self.spot_numbers = []
+        self.spot_types = []
+        # Occupancy bitset, spot i is bit (i % 8) of byte i // 8
+        self.bits = bytearray()
+        self.last_updated = []
+        self.sensor_status = []
+        self.occupied_count = 0
+        self.version = 0
+        # Sequence number of the floor's latest change, a valid since for the changes feed
+        self.seq = seq
+
+    @property
+    def total_spots(self):
+        return len(self.space_ids)
+
+    def is_occupied(self, index):
+        return (self.bits[index >> 3] >> (index & 7)) & 1
+
+    def set_occupied(self, index, is_occupied):
+        if is_occupied:
+            self.bits[index >> 3] |= 1 << (index & 7)
+        else:
+            self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def append_spot(self, space_id, spot_number, spot_type, is_occupied, last_updated, sensor_status):
+        index = self.total_spots
+        if index & 7 == 0:
+            self.bits.append(0)
+        self.space_ids.append(space_id)
+        self.spot_numbers.append(spot_number)
+        self.spot_types.append(spot_type)
+        self.last_updated.append(last_updated)
+        self.sensor_status.append(sensor_status)
+        if is_occupied:
+            self.set_occupied(index, True)
+            self.occupied_count += 1
+        return index
+
+    def counts(self):
+        return {
+            'floor_number': self.floor_number,
+            'total_spots': self.total_spots,
+            'available_spots': self.total_spots - self.occupied_count,
+            'occupied_spots': self.occupied_count
+        }
+
+    def spot_dict(self, garage_id, index, fields=None):
+        if fields is not None:
+            spot = self.spot_dict(garage_id, index)
+            return {field: spot[field] for field in fields}
+        return {
+            'space_id': self.space_ids[index],
+            'garage_id': garage_id,
+            'floor_number': self.floor_number,
+            'spot_number': self.spot_numbers[index],
+            'is_occupied': bool(self.is_occupied(index)),
+            'spot_type': self.spot_types[index],
+            'last_updated': self.last_updated[index].isoformat(),
+            'sensor_status': self.sensor_status[index]
+        }
+
+
+class GarageState:
+    __slots__ = ('garage_id', 'name', 'address', 'total_floors', 'total_spaces', 'open_spaces',
+                 'latitude', 'longitude', 'created_at', 'updated_at', 'floors', 'change_log', 'log_floor',
+                 'version', 'layout_version')
+
+    def __init__(self, garage, log_size, seq):
+        self.garage_id = garage.garage_id
+        self.name = garage.name
+        self.address = garage.address
+        self.total_floors = garage.total_floors
+        self.total_spaces = garage.total_spaces
+        self.open_spaces = garage.open_spaces
+        self.latitude = garage.latitude
+        self.longitude = garage.longitude
+        self.created_at = garage.created_at
+        self.updated_at = garage.updated_at
+        self.floors = {}
+        # (seq, space_id) of recent changes; deltas can be served for any since >= log_floor
+        self.change_log = deque(maxlen=log_size)
+        self.log_floor = seq
+        self.version = 0
+        self.layout_version = None
+
+    def compute_layout_version(self):
+        checksum = 0
+        for floor in self.floors.values():
+            checksum = zlib.crc32(str(floor.floor_number).encode(), checksum)
+            checksum = zlib.crc32(floor.space_ids.tobytes(), checksum)
+            checksum = zlib.crc32('\0'.join(floor.spot_numbers).encode(), checksum)
+            checksum = zlib.crc32('\0'.join(floor.spot_types).encode(), checksum)
+        return f"{self.garage_id}.{checksum:08x}"
+
+    @property
+    def seq(self):
+        """Sequence number of the garage's latest change, a valid since for the changes feed"""
+        return self.change_log[-1][0] if self.change_log else self.log_floor
+
+    def record_change(self, seq, space_id):
+        if len(self.change_log) == self.change_log.maxlen:
+            self.log_floor = self.change_log[0][0]
+        self.change_log.append((seq, space_id))
+
+    def to_dict(self):
+        return {
+            'garage_id': self.garage_id,
+            'name': self.name,
+            'address': self.address,
+            'total_floors': self.total_floors,
+            'total_spaces': self.total_spaces,
+            'open_spaces': self.open_spaces,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'occupancy_rate': round((1 - self.open_spaces / self.total_spaces) * 100, 2) if self.total_spaces > 0 else 0,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
+class OccupancyStore:
+
+    def __init__(self, change_log_size=10000):
+        self.change_log_size = change_log_size
+        self._lock = threading.Lock()
+        self._garages = {}
+        self._spot_index = {}
+        self._seq = 0
+        self._version = 0
+        # Versions restart at zero on every load, so ETags also carry the load epoch
+        self.epoch = uuid.uuid4().hex[:8]
+        self._loaded = False
+
+    def load(self):
+        garages = {}
+        spot_index = {}
+
+        # Every published change also writes a history row, so seeding from the
+        # newest history id keeps sequence numbers moving forward across restarts
+        max_history_id = db.session.query(db.func.max(OccupancyHistory.history_id)).scalar() or 0
+        with self._lock:
+            seq = self._seq = max(self._seq, max_history_id)
+
+        for garage in ParkingGarage.query.order_by(ParkingGarage.garage_id).all():
+            garages[garage.garage_id] = GarageState(garage, self.change_log_size, seq)
+
+        rows = db.session.query(
+            ParkingSpot.space_id,
+            ParkingSpot.garage_id,
+            ParkingSpot.floor_number,
+            ParkingSpot.spot_number,
+            ParkingSpot.spot_type,
+            ParkingSpot.is_occupied,
+            ParkingSpot.last_updated,
+            Sensor.status
+        ).outerjoin(Sensor, Sensor.parking_space_id == ParkingSpot.space_id).order_by(
+            ParkingSpot.garage_id, ParkingSpot.floor_number, ParkingSpot.space_id
+        ).all()
+
+        for space_id, garage_id, floor_number, spot_number, spot_type, is_occupied, last_updated, sensor_status in rows:
+            garage = garages.get(garage_id)
+            if garage is None:
+                continue
+
+            floor = garage.floors.get(floor_number)
+            if floor is None:
+                floor = garage.floors[floor_number] = FloorState(floor_number, seq)
+
+            index = floor.append_spot(space_id, spot_number, spot_type, is_occupied,
+                                      last_updated, sensor_status or 'no_sensor')
+            spot_index[space_id] = (garage_id, floor_number, index)
+
+        for garage in garages.values():
+            garage.layout_version = garage.compute_layout_version()
+
+        with self._lock:
+            self._garages = garages
+            self._spot_index = spot_index
+            self._version = 0
+            self.epoch = uuid.uuid4().hex[:8]
+            self._loaded = True
+
+        logger.info(f"Occupancy store loaded: {len(garages)} garages, {len(spot_index)} spots")
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def get_all_garages(self):
+        self.ensure_loaded()
+        with self._lock:
+            return [garage.to_dict() for garage in self._garages.values()]
+
+    def get_garage(self, garage_id):
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            return garage.to_dict() if garage else None
+
+    def get_garage_availability(self, garage_id, fields=None):
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            if garage is None:
+                return None
+
+            floors = []
+            for floor in garage.floors.values():
+                data = floor.counts()
+                data['spots'] = [floor.spot_dict(garage_id, i, fields) for i in range(floor.total_spots)]
+                floors.append(data)
+
+            return {
+                'garage': garage.to_dict(),
+                'floors': floors,
+                'seq': garage.seq
+            }
+
+    def get_layout(self, garage_id):
+        """Static spot layout, the index space used by the occupancy bitmaps"""
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            if garage is None:
+                return None
+
+            return {
+                'garage_id': garage_id,
+                'layout_version': garage.layout_version,
+                'floors': [
+                    {
+                        'floor_number': floor.floor_number,
+                        'total_spots': floor.total_spots,
+                        'space_ids': floor.space_ids.tolist(),
+                        'spot_numbers': list(floor.spot_numbers),
+                        'spot_types': list(floor.spot_types)
+                    }
+                    for floor in garage.floors.values()
+                ]
+            }
+
+    def get_layout_version(self, garage_id):
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            return garage.layout_version if garage else None
+
+    def get_occupancy_bitmap(self, garage_id, floor_number=None):
+        """
+        Occupancy as one base64 bitset per floor, indexed like the layout
+
+        Returns:
+            dict: Bitmap payload, or None if the garage or floor is unknown
+        """
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            if garage is None:
+                return None
+
+            if floor_number is None:
+                floors = list(garage.floors.values())
+            elif floor_number in garage.floors:
+                floors = [garage.floors[floor_number]]
+            else:
+                return None
+
+            bitmaps = []
+            for floor in floors:
+                data = floor.counts()
+                data['occupied'] = base64.b64encode(floor.bits).decode('ascii')
+                bitmaps.append(data)
+
+            return {
+                'garage_id': garage_id,
+                'layout_version': garage.layout_version,
+                'bit_order': 'lsb0',
+                'open_spaces': garage.open_spaces,
+                'seq': garage.seq if floor_number is None else floors[0].seq,
+                'floors': bitmaps
+            }
+
+    def get_floor_counts(self, garage_id):
+        """Per-floor counts and the garage seq they reflect, read together under the lock"""
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            if garage is None:
+                return None
+            return {
+                'garage_id': garage_id,
+                'seq': garage.seq,
+                'floors': [floor.counts() for floor in garage.floors.values()]
+            }
+
+    def get_floor_availability(self, garage_id, floor_number, fields=None):
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            floor = garage.floors.get(floor_number) if garage else None
+            if floor is None:
+                return None
+
+            available = []
+            occupied = []
+            for i in range(floor.total_spots):
+                if floor.is_occupied(i):
+                    occupied.append(floor.spot_dict(garage_id, i, fields))
+                else:
+                    available.append(floor.spot_dict(garage_id, i, fields))
+
+            data = floor.counts()
+            data['available'] = available
+            data['occupied'] = occupied
+            data['seq'] = floor.seq
+            return data
+
+    def apply_change(self, space_id, is_occupied, last_updated, open_spaces, garage_updated_at):
+        """
+        Apply a committed occupancy change
+
+        Writers publish after their own commit, so changes can arrive out of commit order.
+        A spot change older than the spot's current state, or garage counts older than the
+        garage's, are ignored rather than allowed to overwrite newer state.
+
+        Returns:
+            dict: Change event with the new floor counts, or None if the spot is unknown
+                  or the change is stale
+        """
+        with self._lock:
+            location = self._spot_index.get(space_id)
+            if location is None:
+                self._loaded = False
+                return None
+
+            garage_id, floor_number, index = location
+            garage = self._garages[garage_id]
+            floor = garage.floors[floor_number]
+
+            if last_updated < floor.last_updated[index]:
+                return None
+
+            if floor.is_occupied(index) != is_occupied:
+                floor.set_occupied(index, is_occupied)
+                floor.occupied_count += 1 if is_occupied else -1
+            floor.last_updated[index] = last_updated
+
+            if garage_updated_at >= garage.updated_at:
+                garage.open_spaces = open_spaces
+                garage.updated_at = garage_updated_at
+
+            self._seq += 1
+            garage.record_change(self._seq, space_id)
+            floor.seq = self._seq
+            self._bump_versions(garage, floor)
+
+            return {
+                'seq': self._seq,
+                'garage_id': garage_id,
+                'space_id': space_id,
+                'floor_number': floor_number,
+                'spot_type': floor.spot_types[index],
+                'is_occupied': bool(is_occupied),
+                'last_updated': last_updated.isoformat(),
+                'floor': floor.counts(),
+                'open_spaces': garage.open_spaces
+            }
+
+    def get_changes(self, garage_id, since):
+        """
+        Spots changed after sequence number since, in their current state
+
+        Returns:
+            dict: Delta payload, with resync=True when since is outside the retained log,
+                  or None if the garage is unknown
+        """
+        self.ensure_loaded()
+        with self._lock:
+            garage = self._garages.get(garage_id)
+            if garage is None:
+                return None
+
+            if since is None or since < garage.log_floor or since > self._seq:
+                return {
+                    'garage_id': garage_id,
+                    'since': since,
+                    'seq': self._seq,
+                    'resync': True
+                }
+
+            changed = {}
+            for seq, space_id in reversed(garage.change_log):
+                if seq <= since:
+                    break
+                changed.setdefault(space_id, seq)
+
+            changes = []
+            floors = set()
+            for space_id in sorted(changed, key=changed.get):
+                _, floor_number, index = self._spot_index[space_id]
+                floor = garage.floors[floor_number]
+                floors.add(floor_number)
+                changes.append({
+                    'space_id': space_id,
+                    'floor_number': floor_number,
+                    'is_occupied': bool(floor.is_occupied(index)),
+                    'last_updated': floor.last_updated[index].isoformat()
+                })
+
+            return {
+                'garage_id': garage_id,
+                'since': since,
+                'seq': self._seq,
+                'resync': False,
+                'open_spaces': garage.open_spaces,
+                'floors': [garage.floors[floor_number].counts() for floor_number in sorted(floors)],
+                'changes': changes
+            }
+
+    def set_sensor_status(self, space_id, status):
+        """
+        Returns:
+            dict: Location of the spot if its sensor status changed, otherwise None
+        """
+        with self._lock:
+            location = self._spot_index.get(space_id)
+            if location is None:
+                return None
+            garage_id, floor_number, index = location
+            garage = self._garages[garage_id]
+            floor = garage.floors[floor_number]
+            if floor.sensor_status[index] == status:
+                return None
+
+            floor.sensor_status[index] = status
+            self._bump_versions(garage, floor)
+            return {
+                'garage_id': garage_id,
+                'floor_number': floor_number,
+                'spot_type': floor.spot_types[index]
+            }
+
+    def _bump_versions(self, garage, floor):
+        self._version += 1
+        garage.version += 1
+        floor.version += 1
+
+    def get_version_tag(self, garage_id=None, floor_number=None):
+        """
+        Opaque version string for the whole store, one garage, or one floor
+
+        Returns:
+            str: Version tag that changes whenever the scoped data changes, or None if unknown
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if garage_id is None:
+                return f"{self.epoch}.all.{self._version}"
+
+            garage = self._garages.get(garage_id)
+            if garage is None:
+                return None
+
+            if floor_number is None:
+                return f"{self.epoch}.g{garage_id}.{garage.version}"
+
+            floor = garage.floors.get(floor_number)
+            if floor is None:
+                return None
+            return f"{self.epoch}.g{garage_id}f{floor_number}.{floor.version}"
+
+
+def init_occupancy_store(app):
+    """
+    Create the occupancy store and load it from the database
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        OccupancyStore: The loaded store
+    """
+    store = OccupancyStore(change_log_size=app.config.get('CHANGE_LOG_SIZE', 10000))
+    store.load()
+    app.extensions['occupancy_store'] = store
+    return store
+
+
+def get_occupancy_store():
+    return current_app.extensions['occupancy_store']
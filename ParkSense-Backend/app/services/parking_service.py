@@ -1,83 +1,64 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
-from sqlalchemy.orm import joinedload
+from flask import current_app
+from sqlalchemy import bindparam
 from app import db
 from app.models.parking_garage import ParkingGarage
 from app.models.parking_spot import ParkingSpot
 from app.models.sensor import Sensor
 from app.models.occupancy_history import OccupancyHistory
+from app.services.occupancy_store import get_occupancy_store
+from app.services.event_hub import get_event_hub
+from app.services.response_cache import get_response_cache, change_tags
+from app.services.history_archive_service import HistoryArchiveService
+from app.utils.batching import chunked
+
+SPOT_FIELDS = (
+    'space_id', 'garage_id', 'floor_number', 'spot_number',
+    'is_occupied', 'spot_type', 'last_updated', 'sensor_status'
+)
 
 class ParkingService:
 
     @staticmethod
     def get_all_garages():
-        garages = ParkingGarage.query.all()
-        return [garage.to_dict() for garage in garages]
+        return get_occupancy_store().get_all_garages()
 
     @staticmethod
     def get_garage_by_id(garage_id):
-        garage = ParkingGarage.query.get(garage_id)
-        if not garage:
-            return None
-        return garage.to_dict()
+        return get_occupancy_store().get_garage(garage_id)
 
     @staticmethod
-    def get_garage_availability(garage_id):
-        garage = ParkingGarage.query.get(garage_id)
-        if not garage:
-            return None
+    def get_garage_availability(garage_id, fields=None):
+        return get_occupancy_store().get_garage_availability(garage_id, fields)
 
-        spots = ParkingSpot.query.options(
-            db.joinedload(ParkingSpot.sensor)
-        ).filter_by(garage_id=garage_id).all()
-
-        availability_by_floor = {}
-        for spot in spots:
-            floor = spot.floor_number
-            if floor not in availability_by_floor:
-                availability_by_floor[floor] = {
-                    'floor_number': floor,
-                    'total_spots': 0,
-                    'available_spots': 0,
-                    'occupied_spots': 0,
-                    'spots': []
-                }
-
-            availability_by_floor[floor]['total_spots'] += 1
-            if spot.is_occupied:
-                availability_by_floor[floor]['occupied_spots'] += 1
-            else:
-                availability_by_floor[floor]['available_spots'] += 1
-
-            availability_by_floor[floor]['spots'].append(spot.to_dict())
+    @staticmethod
+    def get_floor_availability(garage_id, floor_number, fields=None):
+        return get_occupancy_store().get_floor_availability(garage_id, floor_number, fields)
 
-        return {
-            'garage': garage.to_dict(),
-            'floors': list(availability_by_floor.values())
-        }
+    @staticmethod
+    def get_layout(garage_id):
+        return get_occupancy_store().get_layout(garage_id)
 
     @staticmethod
-    def get_floor_availability(garage_id, floor_number):
-        spots = ParkingSpot.query.options(
-            db.joinedload(ParkingSpot.sensor)
-        ).filter_by(
-            garage_id=garage_id,
-            floor_number=floor_number
-        ).all()
+    def get_layout_version(garage_id):
+        return get_occupancy_store().get_layout_version(garage_id)
 
-        if not spots:
-            return None
+    @staticmethod
+    def get_occupancy_bitmap(garage_id, floor_number=None):
+        return get_occupancy_store().get_occupancy_bitmap(garage_id, floor_number)
 
-        available = [s.to_dict() for s in spots if not s.is_occupied]
-        occupied = [s.to_dict() for s in spots if s.is_occupied]
+    @staticmethod
+    def get_floor_counts(garage_id):
+        return get_occupancy_store().get_floor_counts(garage_id)
 
-        return {
-            'floor_number': floor_number,
-            'total_spots': len(spots),
-            'available_spots': len(available),
-            'occupied_spots': len(occupied),
-            'available': available,
-            'occupied': occupied
-        }
+    @staticmethod
+    def get_changes_since(garage_id, since):
+        return get_occupancy_store().get_changes(garage_id, since)
+
+    @staticmethod
+    def get_version_tag(garage_id=None, floor_number=None):
+        return get_occupancy_store().get_version_tag(garage_id, floor_number)
 
     @staticmethod
     def get_spot_by_id(space_id):
@@ -92,46 +73,252 @@ class ParkingService:
         if not spot:
             return None
 
-        if spot.is_occupied != is_occupied:
-            spot.is_occupied = is_occupied
-            spot.last_updated = datetime.utcnow()
+        change = ParkingService.apply_occupancy(spot, is_occupied)
+        if change:
+            db.session.commit()
+            ParkingService.publish_changes([change])
+
+        return spot.to_dict()
+
+    @staticmethod
+    def apply_occupancy(spot, is_occupied, timestamp=None):
+        """
+        Stage an occupancy transition in the current session without committing
+
+        Returns:
+            dict: Pending change to pass to publish_changes after commit, or None if unchanged
+        """
+        if spot.is_occupied == is_occupied:
+            return None
+
+        timestamp = timestamp or datetime.utcnow()
+        spot.is_occupied = is_occupied
+        spot.last_updated = timestamp
+
+        garage = spot.garage
+        if is_occupied:
+            garage.open_spaces = max(0, garage.open_spaces - 1)
+        else:
+            garage.open_spaces = min(garage.total_spaces, garage.open_spaces + 1)
+        garage.updated_at = datetime.utcnow()
+
+        history = OccupancyHistory(
+            space_id=spot.space_id,
+            garage_id=spot.garage_id,
+            floor_number=spot.floor_number,
+            was_occupied=is_occupied,
+            timestamp=timestamp
+        )
+        db.session.add(history)
+
+        return {
+            'space_id': spot.space_id,
+            'is_occupied': is_occupied,
+            'last_updated': spot.last_updated,
+            'open_spaces': garage.open_spaces,
+            'garage_updated_at': garage.updated_at
+        }
+
+    @staticmethod
+    def apply_occupancy_bulk(updates):
+        """
+        Stage many occupancy updates with one spot lookup and bulk statements, without committing
+
+        Args:
+            updates: Iterable of (space_id, is_occupied, timestamp) in the order they happened;
+                one older than the spot's last_updated is skipped, as the occupancy store would
+
+        Returns:
+            list: Pending changes to pass to publish_changes after commit
+        """
+        updates = list(updates)
+
+        state = {}
+        for chunk in chunked({space_id for space_id, _, _ in updates}):
+            rows = db.session.query(
+                ParkingSpot.space_id,
+                ParkingSpot.garage_id,
+                ParkingSpot.is_occupied,
+                ParkingSpot.floor_number,
+                ParkingSpot.last_updated
+            ).filter(ParkingSpot.space_id.in_(chunk))
+            for space_id, garage_id, is_occupied, floor_number, last_updated in rows:
+                state[space_id] = [garage_id, is_occupied, None, floor_number, last_updated]
+
+        history_rows = []
+        deltas = defaultdict(int)
+        for space_id, is_occupied, timestamp in updates:
+            spot = state.get(space_id)
+            if spot is None or spot[1] == is_occupied or (spot[4] is not None and timestamp < spot[4]):
+                continue
+
+            spot[1] = is_occupied
+            spot[2] = spot[4] = timestamp
+            deltas[spot[0]] += -1 if is_occupied else 1
+            history_rows.append({
+                'space_id': space_id,
+                'garage_id': spot[0],
+                'floor_number': spot[3],
+                'was_occupied': is_occupied,
+                'timestamp': timestamp
+            })
 
-            garage = spot.garage
-            if is_occupied:
-                garage.open_spaces = max(0, garage.open_spaces - 1)
-            else:
-                garage.open_spaces = min(garage.total_spaces, garage.open_spaces + 1)
-            garage.updated_at = datetime.utcnow()
+        if not history_rows:
+            return []
 
-            history = OccupancyHistory(
-                space_id=space_id,
-                was_occupied=is_occupied
+        changed = {space_id: spot for space_id, spot in state.items() if spot[2] is not None}
+
+        spot_table = ParkingSpot.__table__
+        db.session.execute(
+            spot_table.update()
+            .where(spot_table.c.space_id == bindparam('b_space_id'))
+            .values(is_occupied=bindparam('b_is_occupied'), last_updated=bindparam('b_last_updated')),
+            [
+                {'b_space_id': space_id, 'b_is_occupied': spot[1], 'b_last_updated': spot[2]}
+                for space_id, spot in changed.items()
+            ]
+        )
+        db.session.execute(OccupancyHistory.__table__.insert(), history_rows)
+
+        now = datetime.utcnow()
+        garages = ParkingGarage.query.filter(ParkingGarage.garage_id.in_(list(deltas))).all()
+        for garage in garages:
+            garage.open_spaces = max(0, min(garage.total_spaces, garage.open_spaces + deltas[garage.garage_id]))
+            garage.updated_at = now
+        garages = {garage.garage_id: garage for garage in garages}
+
+        return [
+            {
+                'space_id': space_id,
+                'is_occupied': spot[1],
+                'last_updated': spot[2],
+                'open_spaces': garages[spot[0]].open_spaces,
+                'garage_updated_at': now
+            }
+            for space_id, spot in changed.items()
+        ]
+
+    @staticmethod
+    def publish_changes(changes):
+        """Push committed occupancy changes into the occupancy store, response cache and stream subscribers"""
+        store = get_occupancy_store()
+        hub = get_event_hub()
+        stale = set()
+        events = []
+        for change in changes:
+            event = store.apply_change(
+                change['space_id'],
+                change['is_occupied'],
+                change['last_updated'],
+                change['open_spaces'],
+                change['garage_updated_at']
             )
-            db.session.add(history)
+            if event:
+                stale.update(change_tags(event['garage_id'], event['floor_number'], event['spot_type']))
+                events.append(event)
 
-            db.session.commit()
+        get_response_cache().invalidate(stale)
+        for event in events:
+            hub.publish(event['garage_id'], event)
+        return events
 
-        return spot.to_dict()
+    @staticmethod
+    def publish_sensor_status(space_id, status):
+        location = get_occupancy_store().set_sensor_status(space_id, status)
+        if location:
+            get_response_cache().invalidate(
+                change_tags(location['garage_id'], location['floor_number'], location['spot_type'])
+            )
 
     @staticmethod
-    def get_available_spots_by_type(garage_id, spot_type):
-        spots = ParkingSpot.query.options(
-            db.joinedload(ParkingSpot.sensor)
-        ).filter_by(
-            garage_id=garage_id,
+    def get_available_spots_by_type(garage_id, spot_type, fields=None, after=None, limit=50):
+        return ParkingService.list_spots(
+            garage_id,
             spot_type=spot_type,
-            is_occupied=False
-        ).all()
+            available_only=True,
+            fields=fields,
+            after=after,
+            limit=limit
+        )
+
+    @staticmethod
+    def list_spots(garage_id, floor_number=None, spot_type=None, available_only=False,
+                   fields=None, after=None, limit=50):
+        """
+        Keyset-paginated spot listing that selects only the requested columns
+
+        Args:
+            fields: Subset of SPOT_FIELDS to return, all of them if None
+            after: Return spots with space_id greater than this cursor
+            limit: Maximum number of spots to return, all of them if None
+
+        Returns:
+            tuple: (list of spot dicts, next cursor or None on the last page)
+        """
+        fields = fields or SPOT_FIELDS
+
+        columns = [ParkingSpot.space_id]
+        columns += [getattr(ParkingSpot, field) for field in fields if field not in ('space_id', 'sensor_status')]
+        query = db.session.query(*columns)
 
-        return [spot.to_dict() for spot in spots]
+        if 'sensor_status' in fields:
+            query = query.add_columns(Sensor.status.label('sensor_status')).outerjoin(
+                Sensor, Sensor.parking_space_id == ParkingSpot.space_id
+            )
+
+        query = query.filter(ParkingSpot.garage_id == garage_id)
+        if floor_number is not None:
+            query = query.filter(ParkingSpot.floor_number == floor_number)
+        if spot_type is not None:
+            query = query.filter(ParkingSpot.spot_type == spot_type)
+        if available_only:
+            query = query.filter(ParkingSpot.is_occupied == False)
+        if after is not None:
+            query = query.filter(ParkingSpot.space_id > after)
+
+        query = query.order_by(ParkingSpot.space_id)
+        if limit is None:
+            rows = query.all()
+            next_cursor = None
+        else:
+            rows = query.limit(limit + 1).all()
+            next_cursor = rows[limit - 1].space_id if len(rows) > limit else None
+
+        spots = []
+        for row in rows[:limit]:
+            values = row._asdict()
+            if 'last_updated' in values:
+                values['last_updated'] = values['last_updated'].isoformat()
+            if 'sensor_status' in values:
+                values['sensor_status'] = values['sensor_status'] or 'no_sensor'
+            spots.append({field: values[field] for field in fields})
+
+        return spots, next_cursor
 
     @staticmethod
-    def get_occupancy_history(space_id, hours=24):
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
+    def get_occupancy_history(space_id, hours=24, start=None, end=None):
+        """
+        Transitions for one spot, newest first
+
+        Covers the last `hours` unless start is given, optionally ending before end.
+        Ranges reaching past the retention window also read the history archive.
+        """
+        start = start or datetime.utcnow() - timedelta(hours=hours)
 
-        history = OccupancyHistory.query.filter(
+        query = OccupancyHistory.query.filter(
             OccupancyHistory.space_id == space_id,
-            OccupancyHistory.timestamp >= cutoff
-        ).order_by(OccupancyHistory.timestamp.desc()).all()
+            OccupancyHistory.timestamp >= start
+        )
+        if end is not None:
+            query = query.filter(OccupancyHistory.timestamp < end)
+        history = [h.to_dict() for h in query.order_by(OccupancyHistory.timestamp.desc()).all()]
+
+        # Older transitions may already have been moved to the archive
+        retention_cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('HISTORY_RETENTION_DAYS', 30))
+        if start < retention_cutoff:
+            archive_end = datetime.fromisoformat(history[-1]['timestamp']) if history else end or retention_cutoff
+            history.extend(HistoryArchiveService.get_spot_history(
+                current_app.config['HISTORY_ARCHIVE_DIR'], space_id, start, archive_end
+            ))
 
-        return [h.to_dict() for h in history]
+        return history
@@ -1,5 +1,9 @@
 import logging
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
+from app import db
+from app.services.sensor_service import SensorService
 from config.arduino_config import ArduinoConfig
 
 logger = logging.getLogger(__name__)
@@ -9,7 +13,6 @@ class PollingService:
     def __init__(self, app, arduino_service):
         self.app = app
         self.arduino_service = arduino_service
-        self.sensor_mapping = app.config['ARDUINO_SENSOR_MAPPING']
         self.occupied_distance = app.config.get('ARDUINO_OCCUPIED_DISTANCE', 15.0)
         self.available_distance = app.config.get('ARDUINO_AVAILABLE_DISTANCE', 100.0)
 
@@ -19,50 +22,161 @@ class PollingService:
         self.successful_polls = 0
         self.failed_polls = 0
 
-    def poll_and_update(self):
-        logger.info("Starting Arduino Cloud poll...")
+        # Property values already written to the database, keyed by (thing_id, property name)
+        self._last_applied = {}
+        self.full_sync_interval = app.config.get('ARDUINO_FULL_SYNC_INTERVAL', 60)
+        self._polls_since_full_sync = 0
+        self.last_poll_changed = 0
+        self.last_poll_writes_avoided = 0
+        self.total_writes_avoided = 0
+        self.last_poll_duration_ms = None
+        self.last_poll_stages = {}
+        # Unmapped (thing_id, property name) pairs already warned about, cleared when mappings change
+        self._unmapped = set()
+        self._mappings_version = None
+
+        self.thing_stats = {thing_id: self._new_thing_stats() for thing_id in arduino_service.thing_ids}
+
+        # Adaptive interval: poll often enough that about target_churn of the properties
+        # change between polls, given the observed rate of change
+        self.adaptive = app.config.get('ARDUINO_ADAPTIVE_POLL', True)
+        self.base_interval = app.config.get('ARDUINO_POLL_INTERVAL', 5)
+        self.configured_min_interval = app.config.get('ARDUINO_POLL_MIN_INTERVAL', 2)
+        self.min_interval = self._min_interval_for(len(arduino_service.thing_ids))
+        self.max_interval = max(self.min_interval, app.config.get('ARDUINO_POLL_MAX_INTERVAL', 60))
+        self.backoff = app.config.get('ARDUINO_POLL_BACKOFF', 1.5)
+        self.target_churn = app.config.get('ARDUINO_POLL_TARGET_CHURN', 0.01)
+        self.interval = min(max(self.base_interval, self.min_interval), self.max_interval)
+        self.churn = 0.0
+
+        # Failed Things are retried by a one-off scheduler job instead of sleeping in this one
+        self.max_retries = app.config.get('ARDUINO_MAX_RETRIES', 3)
+        self.retry_delay = ArduinoConfig.DEFAULT_RETRY_DELAY
+        self.retry_attempt = 0
+        self.pending_retry = None
+        self.retries_scheduled = 0
+        self._poll_lock = threading.Lock()
+
+    def poll_and_update(self, thing_ids=None):
+        """
+        Poll every Thing, or only `thing_ids` when retrying the ones that failed
+
+        Returns:
+            dict: Poll summary; 'retry' holds the Things worth another try before the
+                next regular poll and how long to wait, or None
+        """
+        if not self._poll_lock.acquire(blocking=False):
+            logger.info("Arduino Cloud poll already running, skipping")
+            return {
+                'success': False,
+                'skipped': True,
+                'error': 'Poll already running',
+                'sensors_updated': 0,
+                'retry': None
+            }
+
+        try:
+            return self._poll(thing_ids)
+        finally:
+            self._poll_lock.release()
+
+    def _poll(self, thing_ids):
+        is_retry = thing_ids is not None
+        start = time.perf_counter()
+        retry = None
 
         with self.app.app_context():
             try:
-                properties = self.arduino_service.get_properties()
+                if not is_retry:
+                    self.mappings.refresh()
+                    self._reset_unmapped_on_reload()
+                    thing_ids = self._thing_ids()
+                    self.min_interval = self._min_interval_for(len(thing_ids))
+                logger.info(f"Starting Arduino Cloud {'retry ' if is_retry else ''}poll of {len(thing_ids)} things...")
+
+                fetched = self.arduino_service.get_all_properties(thing_ids)
+                fetched_at = time.perf_counter()
+                self._record_thing_stats(fetched)
+
+                failed = {thing_id: poll['error'] for thing_id, poll in fetched.items() if poll['error']}
+                retry = self._plan_retry(
+                    {thing_id: poll['retry_after'] for thing_id, poll in fetched.items() if poll['retryable']},
+                    is_retry
+                )
+                if failed and len(failed) == len(fetched):
+                    raise Exception('; '.join(f"{thing_id}: {error}" for thing_id, error in failed.items()))
 
-                if not properties:
+                if not any(poll['properties'] for poll in fetched.values()):
                     logger.warning("No properties returned from Arduino Cloud")
                     self._update_status(success=False, error="No properties returned")
                     return {
                         'success': False,
                         'error': 'No properties returned',
-                        'sensors_updated': 0
+                        'sensors_updated': 0,
+                        'retry': retry
                     }
 
-                results = []
-                for property_name, is_available in properties.items():
-                    sensor_id = self.sensor_mapping.get(property_name)
+                if not is_retry:
+                    self._polls_since_full_sync += 1
+                    if self._polls_since_full_sync >= self.full_sync_interval:
+                        self._last_applied.clear()
+                        self._polls_since_full_sync = 0
 
-                    if sensor_id is None:
-                        logger.warning(f"Unknown property name: {property_name}, skipping")
-                        continue
+                full_sync = not self._last_applied
+                readings = []
+                snapshot = {}
+                unchanged = 0
+                for thing_id, poll in fetched.items():
+                    if poll['properties']:
+                        thing_readings, thing_snapshot, thing_unchanged = self._diff_properties(thing_id, poll['properties'])
+                        readings.extend(thing_readings)
+                        snapshot.update(thing_snapshot)
+                        unchanged += thing_unchanged
+                diffed_at = time.perf_counter()
 
-                    try:
-                        result = self._submit_sensor_reading(sensor_id, is_available)
-                        results.append(result)
-                        logger.debug(f"Updated sensor {sensor_id} ({property_name}): available={is_available}")
+                results = []
+                if readings:
+                    results = SensorService.process_sensor_readings(readings, debounce=False)
+                    for key, result in zip(snapshot, results):
+                        if result['success']:
+                            self._last_applied[key] = snapshot[key]
+                        else:
+                            logger.error(f"Failed to update sensor {result['sensor_id']}: {result['error']}")
 
-                    except Exception as e:
-                        logger.error(f"Failed to update sensor {sensor_id}: {str(e)}")
-                        continue
+                if not full_sync and not is_retry:
+                    self._adapt_interval(len(readings), len(readings) + unchanged)
 
-                self._update_status(success=True)
-                logger.info(f"Poll completed successfully: {len(results)} sensors updated")
+                self.last_poll_changed = len(readings)
+                self.last_poll_writes_avoided = unchanged
+                self.total_writes_avoided += unchanged
+                done_at = time.perf_counter()
+                self.last_poll_duration_ms = round((done_at - start) * 1000, 2)
+                self.last_poll_stages = {
+                    'fetch_ms': round((fetched_at - start) * 1000, 2),
+                    'diff_ms': round((diffed_at - fetched_at) * 1000, 2),
+                    'apply_ms': round((done_at - diffed_at) * 1000, 2)
+                }
+                metrics = self.app.extensions.get('metrics')
+                if metrics is not None:
+                    for stage, ms in self.last_poll_stages.items():
+                        metrics.observe('parksense_poll_stage_seconds', (('stage', stage[:-3]),), ms / 1000)
+
+                self._update_status(success=True, error='; '.join(failed.values()) if failed else None)
+                logger.info(f"Poll completed in {self.last_poll_duration_ms} ms: {len(results)} sensors updated, "
+                            f"{unchanged} unchanged, {len(failed)} things failed")
 
                 return {
                     'success': True,
                     'sensors_updated': len(results),
+                    'writes_avoided': unchanged,
+                    'failed_things': failed,
+                    'retry': retry,
                     'results': results,
                     'timestamp': datetime.utcnow().isoformat()
                 }
 
             except Exception as e:
+                db.session.rollback()
                 logger.error(f"Poll failed: {str(e)}")
                 self._update_status(success=False, error=str(e))
 
@@ -70,36 +184,185 @@ class PollingService:
                     'success': False,
                     'error': str(e),
                     'sensors_updated': 0,
+                    'retry': retry,
                     'timestamp': datetime.utcnow().isoformat()
                 }
 
-    def _submit_sensor_reading(self, sensor_id, is_available):
-        distance = self.available_distance if is_available else self.occupied_distance
+    def _plan_retry(self, retryable, is_retry):
+        """
+        Decide whether Things that failed transiently get another try before the next regular poll
+
+        The delay doubles with each attempt and never undercuts a Retry-After or the time
+        left until the circuit breaker probes again. A retry that would land after the next
+        regular poll is dropped, since that poll covers the same Things.
+
+        Returns:
+            dict: {'thing_ids', 'attempt', 'delay_seconds', 'run_at'}, or None
+        """
+        attempt = self.retry_attempt + 1 if is_retry else 1
+        self.pending_retry = None
+        self.retry_attempt = 0
+        if not retryable or attempt > self.max_retries:
+            return None
+
+        delay = max([self.retry_delay * 2 ** (attempt - 1)] + [d for d in retryable.values() if d])
+        if delay >= self.interval:
+            return None
+
+        self.retry_attempt = attempt
+        self.retries_scheduled += 1
+        self.pending_retry = {
+            'thing_ids': sorted(retryable),
+            'attempt': attempt,
+            'delay_seconds': round(delay, 2),
+            'run_at': (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+        }
+        return self.pending_retry
 
-        from app.services.sensor_service import SensorService
+    def _adapt_interval(self, changed, mapped):
+        """
+        Pick the next poll interval from the observed churn
 
-        result = SensorService.process_sensor_reading(sensor_id, distance)
+        churn is an EWMA of the share of properties changing per second. The interval
+        is the one at which target_churn of them would change between polls, shrinking
+        at once when churn rises but growing by at most the backoff factor per poll.
+        Full resyncs rewrite every property, so the caller does not count them.
+        """
+        if not self.adaptive or not mapped:
+            return self.interval
 
-        return result
+        self.churn = 0.7 * self.churn + 0.3 * (changed / mapped / self.interval)
+        desired = self.target_churn / self.churn if self.churn else self.max_interval
+        desired = min(desired, self.interval * self.backoff)
+        self.interval = min(self.max_interval, max(self.min_interval, desired))
+        return self.interval
+
+    @property
+    def mappings(self):
+        return self.app.extensions['sensor_mappings']
+
+    def _thing_ids(self):
+        """Configured Things plus any that only appear in the sensor_mapping table"""
+        thing_ids = list(self.arduino_service.thing_ids)
+        configured = set(thing_ids)
+        thing_ids.extend(thing_id for thing_id in self.mappings.thing_ids() if thing_id not in configured)
+        return thing_ids
+
+    def _min_interval_for(self, thing_count):
+        # Never poll faster than the rate limit allows for one request per Thing
+        return max(self.configured_min_interval, thing_count / self.arduino_service.rate_limiter.rate)
+
+    def _mapping_for(self, thing_id):
+        return self.mappings.mapping_for(thing_id)
+
+    def _reset_unmapped_on_reload(self):
+        stats = self.mappings.get_stats()
+        version = (stats['full_loads'], stats['incremental_loads'])
+        if version != self._mappings_version:
+            self._mappings_version = version
+            self._unmapped.clear()
+
+    def _diff_properties(self, thing_id, properties):
+        """
+        Compare one Thing's fetched properties against the last applied snapshot
+
+        Returns:
+            tuple: (readings for changed sensors, {(thing_id, property_name): value} in the same order,
+                    number of mapped properties left untouched)
+        """
+        mapping = self._mapping_for(thing_id)
+        now = datetime.utcnow()
+        readings = []
+        snapshot = {}
+        unchanged = 0
+
+        for property_name, is_available in properties.items():
+            sensor_id = mapping.get(property_name)
+
+            if sensor_id is None:
+                if (thing_id, property_name) not in self._unmapped:
+                    self._unmapped.add((thing_id, property_name))
+                    logger.warning(f"Unknown property name: {property_name} on thing {thing_id}, skipping")
+                continue
+
+            key = (thing_id, property_name)
+            if self._last_applied.get(key) == is_available:
+                unchanged += 1
+                continue
+
+            readings.append({
+                'sensor_id': sensor_id,
+                'distance': self.available_distance if is_available else self.occupied_distance,
+                'timestamp': now
+            })
+            snapshot[key] = is_available
+
+        return readings, snapshot, unchanged
+
+    @staticmethod
+    def _new_thing_stats():
+        return {
+            'last_latency_ms': None,
+            'avg_latency_ms': None,
+            'last_property_count': 0,
+            'successful_polls': 0,
+            'failed_polls': 0,
+            'last_error': None
+        }
+
+    def _record_thing_stats(self, fetched):
+        for thing_id, poll in fetched.items():
+            stats = self.thing_stats.setdefault(thing_id, self._new_thing_stats())
+            latency = poll['latency_ms']
+            stats['last_latency_ms'] = latency
+            previous = stats['avg_latency_ms']
+            stats['avg_latency_ms'] = latency if previous is None else round(0.8 * previous + 0.2 * latency, 2)
+            stats['last_error'] = poll['error']
+            if poll['error']:
+                stats['failed_polls'] += 1
+            else:
+                stats['successful_polls'] += 1
+                stats['last_property_count'] = len(poll['properties'])
 
     def _update_status(self, success, error=None):
         self.last_poll_time = datetime.utcnow()
         self.last_poll_success = success
-        self.last_error = error if not success else None
+        self.last_error = error
 
         if success:
             self.successful_polls += 1
         else:
             self.failed_polls += 1
 
+        metrics = self.app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.inc('parksense_polls_total', (('result', 'success' if success else 'failed'),))
+
     def get_status(self):
         return {
             'enabled': self.app.config.get('ARDUINO_POLL_ENABLED', False),
-            'interval_seconds': self.app.config.get('ARDUINO_POLL_INTERVAL', 5),
+            'interval_seconds': round(self.interval, 2),
+            'adaptive_interval': self.adaptive,
+            'min_interval_seconds': round(self.min_interval, 2),
+            'max_interval_seconds': self.max_interval,
+            'churn': round(self.churn, 6),
+            'target_churn': self.target_churn,
+            'rate_limiter': self.arduino_service.rate_limiter.get_stats(),
+            'circuit_breaker': self.arduino_service.circuit_breaker.get_stats(),
+            'pending_retry': self.pending_retry,
+            'retries_scheduled': self.retries_scheduled,
             'last_poll_time': self.last_poll_time.isoformat() if self.last_poll_time else None,
             'last_poll_success': self.last_poll_success,
             'last_error': self.last_error,
             'successful_polls': self.successful_polls,
             'failed_polls': self.failed_polls,
-            'sensor_count': len(self.sensor_mapping)
+            'sensor_count': len(self.mappings),
+            'sensor_mappings': self.mappings.get_stats(),
+            'unmapped_properties': len(self._unmapped),
+            'last_poll_changed': self.last_poll_changed,
+            'last_poll_writes_avoided': self.last_poll_writes_avoided,
+            'total_writes_avoided': self.total_writes_avoided,
+            'last_poll_duration_ms': self.last_poll_duration_ms,
+            'last_poll_stages': self.last_poll_stages,
+            'things': self.thing_stats
         }
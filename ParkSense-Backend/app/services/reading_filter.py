@@ -0,0 +1,171 @@
+"""
+Sensor reading filter
+Debounces occupancy changes from noisy distance readings with a per-sensor ring
+buffer, a hysteresis band around the occupied threshold and a minimum dwell
+"""
+import threading
+from array import array
+from datetime import datetime
+from flask import current_app
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class ReadingFilter:
+    """
+    Ring buffers for every sensor packed into flat arrays
+
+    A spot changes state only once the median of its sensor's recent readings has stayed
+    on the far side of the hysteresis band for `min_dwell_seconds`. The caller passes the
+    committed state with every reading, so spots changed by other paths never leave the
+    filter out of date. A sensor that goes quiet while a change is pending is settled
+    by a periodic sweep through `due` and `settle`.
+    """
+
+    def __init__(self, threshold=30, hysteresis=5, window=10, min_dwell_seconds=5):
+        if not 1 <= window <= 255:
+            raise ValueError('window must be between 1 and 255 readings')
+
+        self.threshold = threshold
+        self.low = threshold - hysteresis
+        self.high = threshold + hysteresis
+        self.window = window
+        self.min_dwell = min_dwell_seconds
+        self._lock = threading.Lock()
+
+        self._slots = {}
+        self._readings = array('f')
+        self._head = bytearray()
+        self._count = bytearray()
+        # When the median first crossed the band away from the committed state, 0 if it has not
+        self._pending_since = array('d')
+        self._pending = set()
+
+        self.readings = 0
+        self.raw_changes = 0
+        self.state_changes = 0
+        self.suppressed = 0
+
+    def _slot(self, sensor_id):
+        slot = self._slots.get(sensor_id)
+        if slot is None:
+            slot = self._slots[sensor_id] = len(self._head)
+            self._readings.extend([0.0] * self.window)
+            self._head.append(0)
+            self._count.append(0)
+            self._pending_since.append(0.0)
+        return slot
+
+    def update(self, sensor_id, distance, is_occupied, timestamp):
+        """
+        Add a reading and decide the spot's state
+
+        Args:
+            is_occupied: State currently committed for the sensor's spot
+            timestamp: When the reading was taken, naive UTC
+
+        Returns:
+            bool: State to apply
+        """
+        moment = (timestamp - EPOCH).total_seconds()
+        with self._lock:
+            slot = self._slot(sensor_id)
+            base = slot * self.window
+            self._readings[base + self._head[slot]] = distance
+            self._head[slot] = (self._head[slot] + 1) % self.window
+            self._count[slot] = min(self._count[slot] + 1, self.window)
+
+            state = self._decide(sensor_id, slot, is_occupied, moment)
+
+            self.readings += 1
+            raw_change = (distance < self.threshold) != is_occupied
+            if raw_change:
+                self.raw_changes += 1
+                if state == is_occupied:
+                    self.suppressed += 1
+            if state != is_occupied:
+                self.state_changes += 1
+            return state
+
+    def due(self, timestamp):
+        """Sensors whose pending change has waited out the dwell without a newer reading"""
+        moment = (timestamp - EPOCH).total_seconds()
+        with self._lock:
+            return [
+                sensor_id for sensor_id in self._pending
+                if moment - self._pending_since[self._slots[sensor_id]] >= self.min_dwell
+            ]
+
+    def settle(self, sensor_id, is_occupied, timestamp):
+        """
+        Decide the spot's state from the readings already held, without adding one
+
+        Returns:
+            bool: State to apply
+        """
+        moment = (timestamp - EPOCH).total_seconds()
+        with self._lock:
+            slot = self._slots.get(sensor_id)
+            if slot is None:
+                return is_occupied
+            state = self._decide(sensor_id, slot, is_occupied, moment)
+            if state != is_occupied:
+                self.state_changes += 1
+            return state
+
+    def _decide(self, sensor_id, slot, is_occupied, moment):
+        """Apply the band and dwell to the slot's median, must hold the lock"""
+        base = slot * self.window
+        count = self._count[slot]
+        recent = sorted(self._readings[base:base + count])
+        middle = count // 2
+        median = recent[middle] if count % 2 else (recent[middle - 1] + recent[middle]) / 2
+
+        if (median > self.high) if is_occupied else (median < self.low):
+            since = self._pending_since[slot] or moment
+            if moment - since < self.min_dwell:
+                self._pending_since[slot] = since
+                self._pending.add(sensor_id)
+                return is_occupied
+            is_occupied = not is_occupied
+
+        self._pending_since[slot] = 0.0
+        self._pending.discard(sensor_id)
+        return is_occupied
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'sensors': len(self._slots),
+                'pending_changes': len(self._pending),
+                'window': self.window,
+                'hysteresis_band': [self.low, self.high],
+                'min_dwell_seconds': self.min_dwell,
+                'readings': self.readings,
+                'raw_state_changes': self.raw_changes,
+                'state_changes': self.state_changes,
+                'suppressed_writes': self.suppressed,
+                # Share of the writes an unfiltered threshold would have made that were held back
+                'suppressed_write_rate': round(self.suppressed / self.raw_changes, 4) if self.raw_changes else 0.0,
+                'buffer_bytes': (self._readings.itemsize * len(self._readings) + len(self._head) + len(self._count)
+                                 + self._pending_since.itemsize * len(self._pending_since))
+            }
+
+
+def init_reading_filter(app):
+    from app.services.sensor_service import SensorService
+
+    reading_filter = None
+    if app.config.get('SENSOR_FILTER_ENABLED', True):
+        reading_filter = ReadingFilter(
+            threshold=SensorService.OCCUPIED_THRESHOLD,
+            hysteresis=app.config.get('SENSOR_UPDATE_THRESHOLD', 5),
+            window=app.config.get('SENSOR_READING_WINDOW', 10),
+            min_dwell_seconds=app.config.get('SENSOR_MIN_DWELL_SECONDS', 5)
+        )
+    app.extensions['reading_filter'] = reading_filter
+    return reading_filter
+
+
+def get_reading_filter():
+    return current_app.extensions.get('reading_filter')
@@ -0,0 +1,154 @@
+"""
+Response cache
+Ready-serialized (and optionally pre-gzipped) response bodies for the garage read endpoints,
+invalidated by tag when occupancy changes are published
+"""
+import gzip
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+
+class CachedResponse:
+    __slots__ = ('body', 'gzip_body', 'etag', 'tags', 'size')
+
+    def __init__(self, body, gzip_body, etag, tags):
+        self.body = body
+        self.gzip_body = gzip_body
+        self.etag = etag
+        self.tags = tags
+        self.size = len(body) + (len(gzip_body) if gzip_body else 0)
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, gzip_enabled=True, gzip_min_size=1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.gzip_enabled = gzip_enabled
+        self.gzip_min_size = gzip_min_size
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tag_index = {}
+        self._generations = {}
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self, tags):
+        """Snapshot of the tag generations, taken before building a response"""
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def put(self, key, tags, body, etag, generation):
+        """
+        Store a serialized body unless one of its tags was invalidated while it was being built
+
+        Returns:
+            CachedResponse: The entry, whether or not it was retained
+        """
+        gzip_body = None
+        if self.gzip_enabled and len(body) >= self.gzip_min_size:
+            gzip_body = gzip.compress(body, compresslevel=6)
+        entry = CachedResponse(body, gzip_body, etag, tags)
+
+        if entry.size > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if generation != tuple(self._generations.get(tag, 0) for tag in tags):
+                return entry
+
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for tag in tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+        return entry
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in self._tag_index.pop(tag, ()):
+                    if self._remove(key):
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for tag in list(self._generations):
+                self._generations[tag] += 1
+            self._entries.clear()
+            self._tag_index.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions
+            }
+
+
+def change_tags(garage_id, floor_number, spot_type):
+    """Cache tags made stale by a change to one spot"""
+    return (
+        ('garages',),
+        ('garage', garage_id),
+        ('floor', garage_id, floor_number),
+        ('type', garage_id, spot_type)
+    )
+
+
+def init_response_cache(app):
+    cache = ResponseCache(
+        max_entries=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 256),
+        max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+        gzip_enabled=app.config.get('RESPONSE_CACHE_GZIP', True),
+        gzip_min_size=app.config.get('RESPONSE_CACHE_GZIP_MIN_SIZE', 1024)
+    )
+    app.extensions['response_cache'] = cache
+    return cache
+
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
@@ -0,0 +1,273 @@
+"""
+Occupancy rollups
+Per-minute, per-hour and per-day occupancy aggregates by floor and garage,
+maintained incrementally from a high-water mark on occupancy_history
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from app import db
+from app.models.parking_spot import ParkingSpot
+from app.models.occupancy_history import OccupancyHistory
+from app.models.occupancy_rollup import OccupancyRollup, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_floor(timestamp, granularity):
+    seconds = OccupancyRollup.BUCKET_SECONDS[granularity]
+    offset = int((timestamp - EPOCH).total_seconds()) // seconds * seconds
+    return EPOCH + timedelta(seconds=offset)
+
+
+class RollupService:
+    GRANULARITIES = ('minute', 'hour', 'day')
+
+    @staticmethod
+    def run(now=None, batch_size=50000, minute_retention_days=7):
+        """
+        Fold new occupancy_history rows into the rollup tables
+
+        Every bucket up to the end of the current one is kept materialized, assuming the
+        occupancy level holds until the bucket ends. Transitions are then applied as
+        corrections to every bucket from their timestamp onwards, so rows that arrive
+        late or out of order land exactly where they belong.
+
+        Returns:
+            dict: Summary with the number of history rows applied and whether more remain
+        """
+        now = now or datetime.utcnow()
+        watermarks = {w.granularity: w for w in RollupWatermark.query.all()}
+
+        if set(watermarks) != set(RollupService.GRANULARITIES):
+            watermarks = RollupService._initialize_watermarks(now)
+
+        last_history_id = watermarks['minute'].last_history_id
+        series = RollupService._series_levels(last_history_id)
+
+        rows = db.session.query(
+            OccupancyHistory.history_id,
+            OccupancyHistory.timestamp,
+            OccupancyHistory.was_occupied,
+            OccupancyHistory.garage_id,
+            OccupancyHistory.floor_number
+        ).filter(
+            OccupancyHistory.history_id > last_history_id
+        ).order_by(OccupancyHistory.history_id).limit(batch_size).all()
+
+        transitions = defaultdict(list)
+        for _, timestamp, was_occupied, garage_id, floor_number in rows:
+            delta = 1 if was_occupied else -1
+            transitions[(garage_id, floor_number)].append((timestamp, delta))
+            transitions[(garage_id, OccupancyRollup.GARAGE_LEVEL)].append((timestamp, delta))
+        for events in transitions.values():
+            events.sort(key=lambda event: event[0])
+
+        minute_cutoff = bucket_floor(now - timedelta(days=minute_retention_days), 'minute')
+        for granularity in RollupService.GRANULARITIES:
+            cutoff = minute_cutoff if granularity == 'minute' else None
+            RollupService._roll(granularity, watermarks[granularity], series, transitions, now, cutoff)
+
+        new_history_id = rows[-1].history_id if rows else last_history_id
+        for watermark in watermarks.values():
+            watermark.last_history_id = new_history_id
+
+        pruned = OccupancyRollup.query.filter(
+            OccupancyRollup.granularity == 'minute',
+            OccupancyRollup.bucket_start < minute_cutoff
+        ).delete(synchronize_session=False)
+
+        db.session.commit()
+
+        return {
+            'history_rows': len(rows),
+            'last_history_id': new_history_id,
+            'pruned_minute_rows': pruned,
+            'remaining': len(rows) == batch_size
+        }
+
+    @staticmethod
+    def _initialize_watermarks(now):
+        """Start from the oldest history row so the first run backfills everything"""
+        RollupWatermark.query.delete()
+        OccupancyRollup.query.delete()
+
+        first_timestamp = db.session.query(db.func.min(OccupancyHistory.timestamp)).scalar() or now
+
+        watermarks = {}
+        for granularity in RollupService.GRANULARITIES:
+            watermarks[granularity] = RollupWatermark(
+                granularity=granularity,
+                last_history_id=0,
+                processed_until=bucket_floor(first_timestamp, granularity)
+            )
+            db.session.add(watermarks[granularity])
+        return watermarks
+
+    @staticmethod
+    def _series_levels(last_history_id):
+        """
+        Total spots and occupancy level per (garage_id, floor_number) as of the last applied row
+
+        The level is the current occupancy minus the net effect of history rows not yet
+        applied, read in one statement so concurrent transitions cannot skew it.
+        """
+        unapplied = db.session.query(
+            db.func.coalesce(db.func.sum(db.case((OccupancyHistory.was_occupied, 1), else_=-1)), 0)
+        ).filter(
+            OccupancyHistory.history_id > last_history_id,
+            OccupancyHistory.garage_id == ParkingSpot.garage_id,
+            OccupancyHistory.floor_number == ParkingSpot.floor_number
+        ).correlate(ParkingSpot).scalar_subquery()
+
+        rows = db.session.query(
+            ParkingSpot.garage_id,
+            ParkingSpot.floor_number,
+            db.func.count(ParkingSpot.space_id),
+            db.func.sum(db.case((ParkingSpot.is_occupied, 1), else_=0)) - unapplied
+        ).group_by(ParkingSpot.garage_id, ParkingSpot.floor_number).all()
+
+        series = {}
+        for garage_id, floor_number, total_spots, level in rows:
+            series[(garage_id, floor_number)] = [total_spots, int(level)]
+            garage = series.setdefault((garage_id, OccupancyRollup.GARAGE_LEVEL), [0, 0])
+            garage[0] += total_spots
+            garage[1] += int(level)
+        return series
+
+    @staticmethod
+    def _roll(granularity, watermark, series, transitions, now, cutoff):
+        size = OccupancyRollup.BUCKET_SECONDS[granularity]
+        step = timedelta(seconds=size)
+        horizon = bucket_floor(now, granularity) + step
+        extend_from = watermark.processed_until
+        if cutoff is not None:
+            extend_from = max(extend_from, cutoff)
+
+        range_start = extend_from
+        for events in transitions.values():
+            range_start = min(range_start, bucket_floor(events[0][0], granularity))
+        if cutoff is not None:
+            range_start = max(range_start, cutoff)
+
+        buckets = {}
+        for row in db.session.query(OccupancyRollup.__table__).filter(
+            OccupancyRollup.granularity == granularity,
+            OccupancyRollup.bucket_start >= range_start,
+            OccupancyRollup.bucket_start < horizon
+        ):
+            bucket = dict(row._mapping)
+            bucket['dirty'] = False
+            buckets[(bucket['garage_id'], bucket['floor_number'], bucket['bucket_start'])] = bucket
+
+        # Materialize buckets up to the horizon at the level as of the last applied row
+        for (garage_id, floor_number), (total_spots, level) in series.items():
+            bucket_start = extend_from
+            while bucket_start < horizon:
+                key = (garage_id, floor_number, bucket_start)
+                if key not in buckets:
+                    buckets[key] = {
+                        'rollup_id': None,
+                        'garage_id': garage_id,
+                        'floor_number': floor_number,
+                        'granularity': granularity,
+                        'bucket_start': bucket_start,
+                        'total_spots': total_spots,
+                        'occupied_seconds': float(level * size),
+                        'peak_occupied': level,
+                        'end_occupied': level,
+                        'transitions': 0,
+                        'dirty': True
+                    }
+                bucket_start += step
+
+        # Apply transitions as corrections from their timestamp up to the horizon
+        latest = horizon - timedelta(microseconds=1)
+        for (garage_id, floor_number), events in transitions.items():
+            events = [(min(timestamp, latest), delta) for timestamp, delta in events]
+            offset = 0
+            index = 0
+            while index < len(events) and events[index][0] < range_start:
+                offset += events[index][1]
+                index += 1
+
+            bucket_start = max(range_start, bucket_floor(events[index][0], granularity)) if index < len(events) else horizon
+            if offset:
+                bucket_start = range_start
+
+            while bucket_start < horizon:
+                bucket_end = bucket_start + step
+                start_offset = offset
+                peak_offset = offset
+                partial = 0.0
+                count = 0
+                while index < len(events) and events[index][0] < bucket_end:
+                    timestamp, delta = events[index]
+                    offset += delta
+                    peak_offset = max(peak_offset, offset)
+                    partial += delta * (bucket_end - timestamp).total_seconds()
+                    count += 1
+                    index += 1
+
+                bucket = buckets.get((garage_id, floor_number, bucket_start))
+                if bucket is not None and (start_offset or count):
+                    bucket['occupied_seconds'] += start_offset * size + partial
+                    bucket['end_occupied'] += offset
+                    bucket['transitions'] += count
+                    # Peak is an upper bound once corrections from several runs overlap
+                    bucket['peak_occupied'] = min(
+                        bucket['total_spots'],
+                        max(bucket['peak_occupied'] + peak_offset, bucket['end_occupied'])
+                    )
+                    bucket['dirty'] = True
+
+                if index >= len(events) and not offset:
+                    break
+                bucket_start = bucket_end
+
+        table = OccupancyRollup.__table__
+        inserts = []
+        updates = []
+        for bucket in buckets.values():
+            if not bucket.pop('dirty'):
+                continue
+            if bucket['rollup_id'] is None:
+                del bucket['rollup_id']
+                inserts.append(bucket)
+            else:
+                updates.append({
+                    'b_rollup_id': bucket['rollup_id'],
+                    'b_occupied_seconds': bucket['occupied_seconds'],
+                    'b_peak_occupied': bucket['peak_occupied'],
+                    'b_end_occupied': bucket['end_occupied'],
+                    'b_transitions': bucket['transitions']
+                })
+
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(
+                table.update().where(table.c.rollup_id == db.bindparam('b_rollup_id')).values(
+                    occupied_seconds=db.bindparam('b_occupied_seconds'),
+                    peak_occupied=db.bindparam('b_peak_occupied'),
+                    end_occupied=db.bindparam('b_end_occupied'),
+                    transitions=db.bindparam('b_transitions')
+                ),
+                updates
+            )
+
+        watermark.processed_until = horizon
+
+    @staticmethod
+    def get_garage_history(garage_id, granularity, start, end, floor_number=None):
+        rows = OccupancyRollup.query.filter(
+            OccupancyRollup.garage_id == garage_id,
+            OccupancyRollup.granularity == granularity,
+            OccupancyRollup.floor_number == (floor_number or OccupancyRollup.GARAGE_LEVEL),
+            OccupancyRollup.bucket_start >= bucket_floor(start, granularity),
+            OccupancyRollup.bucket_start < end
+        ).order_by(OccupancyRollup.bucket_start).all()
+
+        return [row.to_dict() for row in rows]
@@ -0,0 +1,269 @@
+"""
+Sensor mapping registry
+Arduino Cloud (thing_id, property_name) -> sensor_id mappings stored in the
+sensor_mapping table and served from an in-memory index that is refreshed
+incrementally, so mappings can change without a restart
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models.sensor import Sensor
+from app.models.sensor_mapping import SensorMapping
+from app.utils.batching import chunked
+
+logger = logging.getLogger(__name__)
+
+
+class SensorMappingIndex:
+    """
+    Mappings grouped by Thing, each Thing's dict replaced whole on change
+
+    Readers never lock: a poll holding one Thing's mapping keeps a consistent view while
+    refresh() swaps in the next one.
+    """
+
+    def __init__(self, overlap_seconds=5):
+        # Rows are re-read from slightly before the watermark, so a transaction that
+        # commits late with an older updated_at is still picked up
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self._lock = threading.Lock()
+        self._things = {}
+        self._keys = {}
+        self._watermark = None
+
+        self.loaded_at = None
+        self.full_loads = 0
+        self.incremental_loads = 0
+        self.rows_applied = 0
+
+    def load(self):
+        rows = db.session.query(
+            SensorMapping.mapping_id,
+            SensorMapping.thing_id,
+            SensorMapping.property_name,
+            SensorMapping.sensor_id,
+            SensorMapping.updated_at
+        ).all()
+
+        things = {}
+        keys = {}
+        watermark = None
+        for mapping_id, thing_id, property_name, sensor_id, updated_at in rows:
+            things.setdefault(thing_id, {})[property_name] = sensor_id
+            keys[mapping_id] = (thing_id, property_name)
+            watermark = updated_at if watermark is None else max(watermark, updated_at)
+
+        with self._lock:
+            self._things = things
+            self._keys = keys
+            self._watermark = watermark or datetime.utcnow()
+            self.loaded_at = datetime.utcnow()
+            self.full_loads += 1
+        logger.info(f"Loaded {len(keys)} sensor mappings for {len(things)} things")
+
+    def refresh(self):
+        """
+        Apply rows changed since the last load
+
+        Deleted rows leave no trace to read incrementally, so a row count that no longer
+        matches the index triggers a full load instead.
+
+        Returns:
+            int: Number of changed rows applied
+        """
+        if self._watermark is None:
+            self.load()
+            return len(self)
+
+        rows = db.session.query(
+            SensorMapping.mapping_id,
+            SensorMapping.thing_id,
+            SensorMapping.property_name,
+            SensorMapping.sensor_id,
+            SensorMapping.updated_at
+        ).filter(SensorMapping.updated_at >= self._watermark - self.overlap).all()
+        total = db.session.query(db.func.count(SensorMapping.mapping_id)).scalar()
+
+        with self._lock:
+            updates = []
+            for mapping_id, thing_id, property_name, sensor_id, updated_at in rows:
+                previous = self._keys.get(mapping_id)
+                if previous == (thing_id, property_name) and self._things[thing_id].get(property_name) == sensor_id:
+                    continue
+                updates.append((mapping_id, previous, thing_id, property_name, sensor_id, updated_at))
+
+            # Every old key goes before any new one is written, so names swapped or passed
+            # between mappings in one refresh never remove an entry another row just added
+            changed = {}
+            for mapping_id, previous, thing_id, property_name, sensor_id, updated_at in updates:
+                if previous is not None and previous != (thing_id, property_name):
+                    old_thing = changed.setdefault(previous[0], dict(self._things.get(previous[0], {})))
+                    old_thing.pop(previous[1], None)
+
+            for mapping_id, previous, thing_id, property_name, sensor_id, updated_at in updates:
+                thing = changed.setdefault(thing_id, dict(self._things.get(thing_id, {})))
+                thing[property_name] = sensor_id
+                self._keys[mapping_id] = (thing_id, property_name)
+                self._watermark = max(self._watermark, updated_at)
+            applied = len(updates)
+
+            for thing_id, mapping in changed.items():
+                if mapping:
+                    self._things[thing_id] = mapping
+                else:
+                    self._things.pop(thing_id, None)
+
+            if applied:
+                self.incremental_loads += 1
+                self.rows_applied += applied
+            stale = total != len(self._keys)
+
+        if stale:
+            self.load()
+        elif applied:
+            logger.info(f"Applied {applied} changed sensor mappings")
+        return applied
+
+    def get(self, thing_id, property_name):
+        mapping = self._things.get(thing_id)
+        return mapping.get(property_name) if mapping else None
+
+    def mapping_for(self, thing_id):
+        """{property_name: sensor_id} for one Thing; treat as read-only"""
+        return self._things.get(thing_id) or {}
+
+    def thing_ids(self):
+        return list(self._things)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get_stats(self):
+        return {
+            'mappings': len(self._keys),
+            'things': len(self._things),
+            'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None,
+            'full_loads': self.full_loads,
+            'incremental_loads': self.incremental_loads,
+            'rows_applied': self.rows_applied
+        }
+
+
+class SensorMappingService:
+
+    @staticmethod
+    def upsert(mappings):
+        """
+        Insert or update mappings in bulk
+
+        Args:
+            mappings: {thing_id: {property_name: sensor_id}}
+
+        Returns:
+            dict: Counts of inserted, updated and unchanged rows, plus mappings whose
+                sensor does not exist, which are skipped
+        """
+        sensor_ids = {sensor_id for properties in mappings.values() for sensor_id in properties.values()}
+        known = set()
+        for chunk in chunked(sensor_ids):
+            known.update(sensor_id for (sensor_id,) in db.session.query(Sensor.sensor_id).filter(Sensor.sensor_id.in_(chunk)))
+
+        existing = {}
+        for chunk in chunked(mappings):
+            rows = db.session.query(
+                SensorMapping.mapping_id, SensorMapping.thing_id, SensorMapping.property_name, SensorMapping.sensor_id
+            ).filter(SensorMapping.thing_id.in_(chunk))
+            for mapping_id, thing_id, property_name, sensor_id in rows:
+                existing[(thing_id, property_name)] = (mapping_id, sensor_id)
+
+        now = datetime.utcnow()
+        inserts = []
+        updates = []
+        invalid = []
+        unchanged = 0
+        for thing_id, properties in mappings.items():
+            for property_name, sensor_id in properties.items():
+                if sensor_id not in known:
+                    invalid.append({'thing_id': thing_id, 'property_name': property_name, 'sensor_id': sensor_id})
+                    continue
+                current = existing.get((thing_id, property_name))
+                if current is None:
+                    inserts.append({
+                        'thing_id': thing_id,
+                        'property_name': property_name,
+                        'sensor_id': sensor_id,
+                        'updated_at': now
+                    })
+                elif current[1] != sensor_id:
+                    updates.append({'b_mapping_id': current[0], 'b_sensor_id': sensor_id, 'b_updated_at': now})
+                else:
+                    unchanged += 1
+
+        table = SensorMapping.__table__
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(
+                table.update().where(table.c.mapping_id == db.bindparam('b_mapping_id')).values(
+                    sensor_id=db.bindparam('b_sensor_id'),
+                    updated_at=db.bindparam('b_updated_at')
+                ),
+                updates
+            )
+        db.session.commit()
+
+        return {
+            'inserted': len(inserts),
+            'updated': len(updates),
+            'unchanged': unchanged,
+            'invalid': invalid
+        }
+
+    @staticmethod
+    def remove(thing_id, property_names=None):
+        query = SensorMapping.query.filter(SensorMapping.thing_id == thing_id)
+        if property_names is not None:
+            query = query.filter(SensorMapping.property_name.in_(property_names))
+        removed = query.delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+    @staticmethod
+    def seed_from_config(config):
+        """
+        Copy ARDUINO_SENSOR_MAPPING and ARDUINO_THING_SENSOR_MAPPINGS into an empty table
+
+        Once the table holds any row it is the source of truth and the config is ignored.
+
+        Returns:
+            int: Number of mappings inserted
+        """
+        if db.session.query(SensorMapping.mapping_id).first() is not None:
+            return 0
+
+        mappings = {}
+        if config.get('ARDUINO_THING_ID') and config.get('ARDUINO_SENSOR_MAPPING'):
+            mappings[config['ARDUINO_THING_ID']] = dict(config['ARDUINO_SENSOR_MAPPING'])
+        for thing_id, properties in (config.get('ARDUINO_THING_SENSOR_MAPPINGS') or {}).items():
+            mappings.setdefault(thing_id, {}).update(properties)
+        if not mappings:
+            return 0
+
+        summary = SensorMappingService.upsert(mappings)
+        if summary['inserted']:
+            logger.info(f"Seeded {summary['inserted']} sensor mappings from config")
+        return summary['inserted']
+
+
+def init_sensor_mapping_index(app):
+    SensorMappingService.seed_from_config(app.config)
+    index = SensorMappingIndex(overlap_seconds=app.config.get('SENSOR_MAPPING_RELOAD_OVERLAP_SECONDS', 5))
+    index.load()
+    app.extensions['sensor_mappings'] = index
+    return index
+
+
+def get_sensor_mapping_index():
+    return current_app.extensions['sensor_mappings']
@@ -1,51 +1,197 @@
 from datetime import datetime, timedelta
+from sqlalchemy import bindparam
 from app import db
 from app.models.sensor import Sensor
 from app.models.parking_spot import ParkingSpot
 from app.services.parking_service import ParkingService
+from app.services.reading_filter import get_reading_filter
+from app.services.telemetry_buffer import get_telemetry_buffer
+from app.utils.batching import chunked
 
 class SensorService:
     OCCUPIED_THRESHOLD = 30  
+    LOW_BATTERY_LEVEL = 20
+    RESPONSIVE_WINDOW = timedelta(minutes=5)
+    HEALTH_CATEGORIES = ('healthy', 'low_battery', 'unresponsive')
 
     @staticmethod
     def process_sensor_reading(sensor_id, distance_reading):
         sensor = Sensor.query.get(sensor_id)
         if not sensor:
-            return {'error': 'Sensor not found'}, 404
+            return {'error': 'Sensor not found'}
 
-        sensor.last_reading = distance_reading
-        sensor.last_ping = datetime.utcnow()
+        now = datetime.utcnow()
+        buffer = get_telemetry_buffer()
+        flush = False
+        if buffer is None:
+            sensor.last_reading = distance_reading
+            sensor.last_ping = now
+        else:
+            flush = buffer.record_reading(sensor_id, distance_reading, now)
 
-        is_occupied = distance_reading < SensorService.OCCUPIED_THRESHOLD
-
-        result = ParkingService.update_spot_occupancy(
-            sensor.parking_space_id,
-            is_occupied
-        )
+        spot = sensor.parking_spot
+        is_occupied = SensorService._filtered_state(sensor_id, distance_reading, spot.is_occupied, now)
+        change = ParkingService.apply_occupancy(spot, is_occupied)
 
         db.session.commit()
 
+        if change:
+            ParkingService.publish_changes([change])
+        if flush:
+            buffer.flush()
+
         return {
             'sensor_id': sensor_id,
             'distance': distance_reading,
             'is_occupied': is_occupied,
-            'spot': result
+            'debounced': is_occupied != (distance_reading < SensorService.OCCUPIED_THRESHOLD),
+            'spot': spot.to_dict()
         }
 
+    @staticmethod
+    def _filtered_state(sensor_id, distance, is_occupied, timestamp):
+        reading_filter = get_reading_filter()
+        if reading_filter is None:
+            return distance < SensorService.OCCUPIED_THRESHOLD
+        return reading_filter.update(sensor_id, distance, is_occupied, timestamp)
+
+    @staticmethod
+    def process_sensor_readings(readings, debounce=True):
+        """
+        Apply a batch of readings in a single transaction
+
+        Args:
+            readings: List of dicts with sensor_id, distance and timestamp
+            debounce: Run readings through the reading filter; sources that report an
+                already settled occupied/free value pass False
+
+        Returns:
+            list: Per-reading results in input order
+        """
+        sensors = {}
+        spot_states = {}
+        for chunk in chunked({reading['sensor_id'] for reading in readings}):
+            rows = db.session.query(Sensor.sensor_id, Sensor.parking_space_id, ParkingSpot.is_occupied).join(
+                ParkingSpot, ParkingSpot.space_id == Sensor.parking_space_id
+            ).filter(Sensor.sensor_id.in_(chunk))
+            for sensor_id, space_id, is_occupied in rows:
+                sensors[sensor_id] = space_id
+                spot_states[space_id] = is_occupied
+
+        # The filter sees each sensor's readings in time order, carrying the state forward
+        states = [None] * len(readings)
+        reading_filter = get_reading_filter() if debounce else None
+        for index in sorted(range(len(readings)), key=lambda i: readings[i]['timestamp']):
+            reading = readings[index]
+            space_id = sensors.get(reading['sensor_id'])
+            if space_id is None:
+                continue
+            if reading_filter is None:
+                states[index] = reading['distance'] < SensorService.OCCUPIED_THRESHOLD
+            else:
+                states[index] = spot_states[space_id] = reading_filter.update(
+                    reading['sensor_id'], reading['distance'], spot_states[space_id], reading['timestamp']
+                )
+
+        results = []
+        updates = []
+        telemetry = {}
+        for reading, is_occupied in zip(readings, states):
+            sensor_id = reading['sensor_id']
+            space_id = sensors.get(sensor_id)
+            if space_id is None:
+                results.append({'sensor_id': sensor_id, 'success': False, 'error': 'Sensor not found'})
+                continue
+
+            updates.append((space_id, is_occupied, reading['timestamp']))
+
+            latest = telemetry.get(sensor_id)
+            if latest is None or reading['timestamp'] >= latest['b_last_ping']:
+                telemetry[sensor_id] = {
+                    'b_sensor_id': sensor_id,
+                    'b_last_reading': reading['distance'],
+                    'b_last_ping': reading['timestamp']
+                }
+
+            results.append({
+                'sensor_id': sensor_id,
+                'success': True,
+                'space_id': space_id,
+                'distance': reading['distance'],
+                'is_occupied': is_occupied,
+                'debounced': is_occupied != (reading['distance'] < SensorService.OCCUPIED_THRESHOLD)
+            })
+
+        updates.sort(key=lambda update: update[2])
+        changes = ParkingService.apply_occupancy_bulk(updates)
+
+        buffer = get_telemetry_buffer()
+        flush = False
+        if buffer is not None:
+            for values in telemetry.values():
+                flush = buffer.record_reading(values['b_sensor_id'], values['b_last_reading'], values['b_last_ping']) or flush
+        elif telemetry:
+            sensor_table = Sensor.__table__
+            db.session.execute(
+                sensor_table.update()
+                .where(sensor_table.c.sensor_id == bindparam('b_sensor_id'))
+                .values(last_reading=bindparam('b_last_reading'), last_ping=bindparam('b_last_ping')),
+                list(telemetry.values())
+            )
+
+        db.session.commit()
+
+        if changes:
+            ParkingService.publish_changes(changes)
+        if flush:
+            buffer.flush()
+
+        return results
+
+    @staticmethod
+    def settle_pending_readings(now=None):
+        """
+        Commit debounced changes whose sensor has gone quiet past the minimum dwell
+
+        The filter otherwise only re-checks the dwell on the sensor's next reading, so
+        the last reading of a burst would never take effect.
+
+        Returns:
+            int: Number of spots changed
+        """
+        reading_filter = get_reading_filter()
+        if reading_filter is None:
+            return 0
+
+        now = now or datetime.utcnow()
+        due = reading_filter.due(now)
+        if not due:
+            return 0
+
+        updates = []
+        for chunk in chunked(due):
+            rows = db.session.query(Sensor.sensor_id, Sensor.parking_space_id, ParkingSpot.is_occupied).join(
+                ParkingSpot, ParkingSpot.space_id == Sensor.parking_space_id
+            ).filter(Sensor.sensor_id.in_(chunk))
+            for sensor_id, space_id, is_occupied in rows:
+                state = reading_filter.settle(sensor_id, is_occupied, now)
+                if state != is_occupied:
+                    updates.append((space_id, state, now))
+
+        changes = ParkingService.apply_occupancy_bulk(updates) if updates else []
+        db.session.commit()
+
+        if changes:
+            ParkingService.publish_changes(changes)
+        return len(changes)
+
     @staticmethod
     def get_sensor_status(sensor_id):
         sensor = Sensor.query.get(sensor_id)
         if not sensor:
             return None
 
-        time_since_ping = datetime.utcnow() - sensor.last_ping
-        is_responsive = time_since_ping < timedelta(minutes=5)
-
-        return {
-            **sensor.to_dict(),
-            'is_responsive': is_responsive,
-            'time_since_ping': time_since_ping.total_seconds()
-        }
+        return SensorService._status_dict(sensor, datetime.utcnow())
 
     @staticmethod
     def update_battery_level(sensor_id, battery_level):
@@ -54,42 +200,128 @@ class SensorService:
         if not sensor:
             return None
 
-        sensor.battery_level = battery_level
+        # The level itself is telemetry and can wait for a flush; a status change is committed now
+        buffer = get_telemetry_buffer()
+        flush = False
+        if buffer is None:
+            sensor.battery_level = battery_level
+        else:
+            flush = buffer.record_battery(sensor_id, battery_level)
 
-        if battery_level < 20:
+        status = sensor.status
+        if battery_level < SensorService.LOW_BATTERY_LEVEL:
             sensor.status = 'low_battery'
-        elif sensor.status == 'low_battery' and battery_level >= 20:
+        elif sensor.status == 'low_battery' and battery_level >= SensorService.LOW_BATTERY_LEVEL:
             sensor.status = 'active'
 
-        db.session.commit()
-        return sensor.to_dict()
+        if buffer is None or sensor.status != status:
+            db.session.commit()
+        if flush:
+            buffer.flush()
+        ParkingService.publish_sensor_status(sensor.parking_space_id, sensor.status)
+        return SensorService._with_telemetry(sensor)[0]
 
     @staticmethod
-    def get_all_sensors_health():
-        sensors = Sensor.query.all()
+    def _health_filters(now):
+        cutoff = now - SensorService.RESPONSIVE_WINDOW
+        low_battery = db.func.coalesce(Sensor.battery_level, 100) < SensorService.LOW_BATTERY_LEVEL
+        unresponsive = db.and_(
+            db.not_(low_battery),
+            db.or_(Sensor.last_ping.is_(None), Sensor.last_ping < cutoff)
+        )
+        return {
+            'low_battery': low_battery,
+            'unresponsive': unresponsive,
+            'healthy': db.not_(db.or_(low_battery, unresponsive))
+        }
 
-        healthy = []
-        low_battery = []
-        unresponsive = []
+    @staticmethod
+    def get_all_sensors_health(sample_size=10):
+        now = datetime.utcnow()
+        filters = SensorService._health_filters(now)
 
-        for sensor in sensors:
-            status = SensorService.get_sensor_status(sensor.sensor_id)
+        def count_where(condition):
+            return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
 
-            if status['battery_level'] < 20:
-                low_battery.append(status)
-            elif not status['is_responsive']:
-                unresponsive.append(status)
-            else:
-                healthy.append(status)
+        battery = db.func.coalesce(Sensor.battery_level, 100)
+        totals = db.session.query(
+            db.func.count(Sensor.sensor_id),
+            count_where(filters['low_battery']),
+            count_where(filters['unresponsive']),
+            count_where(battery < SensorService.LOW_BATTERY_LEVEL),
+            count_where(db.and_(battery >= SensorService.LOW_BATTERY_LEVEL, battery < 70)),
+            count_where(battery >= 70),
+            count_where(Sensor.last_ping >= now - SensorService.RESPONSIVE_WINDOW),
+            count_where(db.and_(Sensor.last_ping < now - SensorService.RESPONSIVE_WINDOW,
+                                Sensor.last_ping >= now - timedelta(hours=1))),
+            count_where(db.or_(Sensor.last_ping.is_(None), Sensor.last_ping < now - timedelta(hours=1)))
+        ).one()
+
+        total, low_battery, unresponsive, critical, low, good, recent, stale, offline = totals
+        by_status = dict(db.session.query(Sensor.status, db.func.count(Sensor.sensor_id)).group_by(Sensor.status))
+
+        sensors = {}
+        next_cursors = {}
+        for category in SensorService.HEALTH_CATEGORIES:
+            page, next_cursor = SensorService.get_sensors_by_health(category, limit=sample_size, now=now)
+            sensors[category] = page
+            next_cursors[category] = next_cursor
 
         return {
-            'total_sensors': len(sensors),
-            'healthy': len(healthy),
-            'low_battery': len(low_battery),
-            'unresponsive': len(unresponsive),
-            'sensors': {
-                'healthy': healthy,
-                'low_battery': low_battery,
-                'unresponsive': unresponsive
-            }
+            'total_sensors': total,
+            'healthy': total - low_battery - unresponsive,
+            'low_battery': low_battery,
+            'unresponsive': unresponsive,
+            'by_status': by_status,
+            'battery': {'critical': critical, 'low': low, 'good': good},
+            'last_ping': {'within_5_minutes': recent, 'within_1_hour': stale, 'older': offline},
+            'sensors': sensors,
+            'next_cursors': next_cursors
         }
+
+    @staticmethod
+    def get_sensors_by_health(category, after=None, limit=50, now=None):
+        """
+        Keyset-paginated sensors in one health category
+
+        Returns:
+            tuple: (list of sensor status dicts, next cursor or None on the last page)
+        """
+        now = now or datetime.utcnow()
+        query = Sensor.query.filter(SensorService._health_filters(now)[category])
+        if after is not None:
+            query = query.filter(Sensor.sensor_id > after)
+
+        sensors = query.order_by(Sensor.sensor_id).limit(limit + 1).all()
+        next_cursor = sensors[limit - 1].sensor_id if len(sensors) > limit else None
+
+        return [SensorService._status_dict(sensor, now) for sensor in sensors[:limit]], next_cursor
+
+    @staticmethod
+    def _status_dict(sensor, now):
+        data, last_ping = SensorService._with_telemetry(sensor)
+        time_since_ping = now - last_ping
+        return {
+            **data,
+            'is_responsive': time_since_ping < SensorService.RESPONSIVE_WINDOW,
+            'time_since_ping': time_since_ping.total_seconds()
+        }
+
+    @staticmethod
+    def _with_telemetry(sensor):
+        """
+        Sensor dict with any unflushed telemetry applied
+
+        Returns:
+            tuple: (dict, last_ping datetime)
+        """
+        data = sensor.to_dict()
+        buffer = get_telemetry_buffer()
+        pending = buffer.get(sensor.sensor_id) if buffer is not None else None
+        if not pending:
+            return data, sensor.last_ping
+
+        data.update(pending)
+        last_ping = pending.get('last_ping', sensor.last_ping)
+        data['last_ping'] = last_ping.isoformat()
+        return data, last_ping
@@ -0,0 +1,230 @@
+"""
+Sensor telemetry buffer
+Write-behind store for last_reading, last_ping and battery_level: updates land in
+compact per-sensor arrays and reach the database in bulk, latest value winning
+"""
+import atexit
+import logging
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models.sensor import Sensor
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TelemetryBuffer:
+    READING = 1
+    BATTERY = 2
+
+    def __init__(self, max_pending=5000):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self._slots = {}
+        self._sensor_ids = array('q')
+        self._reading = array('d')
+        # Seconds since the epoch, naive UTC
+        self._ping = array('d')
+        self._battery = array('h')
+        self._dirty = bytearray()
+        self._pending = []
+        # Values taken by a flush that has not committed yet, still visible to get()
+        self._in_flight = {}
+
+        self.updates = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.last_flush_at = None
+        self.last_flush_ms = None
+
+    def _slot(self, sensor_id):
+        slot = self._slots.get(sensor_id)
+        if slot is None:
+            slot = self._slots[sensor_id] = len(self._sensor_ids)
+            self._sensor_ids.append(sensor_id)
+            self._reading.append(0.0)
+            self._ping.append(0.0)
+            self._battery.append(0)
+            self._dirty.append(0)
+        return slot
+
+    def _mark(self, slot, flag):
+        if not self._dirty[slot]:
+            self._pending.append(slot)
+        elif self._dirty[slot] & flag:
+            self.coalesced += 1
+        self._dirty[slot] |= flag
+
+    def record_reading(self, sensor_id, distance, timestamp):
+        """
+        Buffer a reading; an older reading than the one already pending is dropped
+
+        Returns:
+            bool: True once enough sensors are pending that the caller should flush
+        """
+        moment = (timestamp - EPOCH).total_seconds()
+        with self._lock:
+            self.updates += 1
+            slot = self._slot(sensor_id)
+            if self._dirty[slot] & self.READING and moment < self._ping[slot]:
+                self.coalesced += 1
+            else:
+                self._reading[slot] = distance
+                self._ping[slot] = moment
+                self._mark(slot, self.READING)
+            return len(self._pending) >= self.max_pending
+
+    def record_battery(self, sensor_id, battery_level):
+        with self._lock:
+            self.updates += 1
+            slot = self._slot(sensor_id)
+            self._battery[slot] = battery_level
+            self._mark(slot, self.BATTERY)
+            return len(self._pending) >= self.max_pending
+
+    def get(self, sensor_id):
+        """Unflushed values for one sensor as Sensor column names, empty if none"""
+        with self._lock:
+            values = dict(self._in_flight.get(sensor_id, {}))
+            slot = self._slots.get(sensor_id)
+            if slot is not None and self._dirty[slot]:
+                values.update(self._values(slot, self._dirty[slot]))
+            return values
+
+    def _values(self, slot, flags):
+        values = {}
+        if flags & self.READING:
+            values['last_reading'] = self._reading[slot]
+            values['last_ping'] = EPOCH + timedelta(seconds=self._ping[slot])
+        if flags & self.BATTERY:
+            values['battery_level'] = self._battery[slot]
+        return values
+
+    def flush(self):
+        """
+        Write every pending value in two bulk statements and one commit
+
+        A reading never overwrites a newer last_ping already in the table. If the
+        commit fails the values go back into the buffer unless newer ones arrived.
+
+        Returns:
+            int: Number of sensors written
+        """
+        with self._flush_lock:
+            start = time.perf_counter()
+            with self._lock:
+                taken = {}
+                for slot in self._pending:
+                    taken[self._sensor_ids[slot]] = self._values(slot, self._dirty[slot])
+                    self._dirty[slot] = 0
+                self._pending = []
+                self._in_flight = taken
+
+            if not taken:
+                return 0
+
+            readings = [
+                {'b_sensor_id': sensor_id, 'b_last_reading': values['last_reading'], 'b_last_ping': values['last_ping']}
+                for sensor_id, values in taken.items() if 'last_ping' in values
+            ]
+            batteries = [
+                {'b_sensor_id': sensor_id, 'b_battery_level': values['battery_level']}
+                for sensor_id, values in taken.items() if 'battery_level' in values
+            ]
+
+            table = Sensor.__table__
+            try:
+                if readings:
+                    db.session.execute(
+                        table.update().where(
+                            table.c.sensor_id == db.bindparam('b_sensor_id'),
+                            db.or_(table.c.last_ping.is_(None), table.c.last_ping <= db.bindparam('b_last_ping'))
+                        ).values(last_reading=db.bindparam('b_last_reading'), last_ping=db.bindparam('b_last_ping')),
+                        readings
+                    )
+                if batteries:
+                    db.session.execute(
+                        table.update().where(table.c.sensor_id == db.bindparam('b_sensor_id')).values(
+                            battery_level=db.bindparam('b_battery_level')
+                        ),
+                        batteries
+                    )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self._restore(taken)
+                self.failed_flushes += 1
+                logger.error(f"Telemetry flush failed, {len(taken)} sensors kept for the next one: {e}")
+                return 0
+
+            with self._lock:
+                self._in_flight = {}
+                self.flushes += 1
+                self.flushed_rows += len(taken)
+                self.last_flush_at = datetime.utcnow()
+                self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            logger.debug(f"Flushed telemetry for {len(taken)} sensors in {self.last_flush_ms} ms")
+            return len(taken)
+
+    def _restore(self, taken):
+        with self._lock:
+            for sensor_id, values in taken.items():
+                slot = self._slot(sensor_id)
+                if 'last_ping' in values:
+                    moment = (values['last_ping'] - EPOCH).total_seconds()
+                    if not self._dirty[slot] & self.READING or moment > self._ping[slot]:
+                        self._reading[slot] = values['last_reading']
+                        self._ping[slot] = moment
+                        self._mark(slot, self.READING)
+                if 'battery_level' in values and not self._dirty[slot] & self.BATTERY:
+                    self._battery[slot] = values['battery_level']
+                    self._mark(slot, self.BATTERY)
+            self._in_flight = {}
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'pending_sensors': len(self._pending),
+                'max_pending': self.max_pending,
+                'updates': self.updates,
+                'coalesced': self.coalesced,
+                'flushes': self.flushes,
+                'flushed_rows': self.flushed_rows,
+                'failed_flushes': self.failed_flushes,
+                'last_flush_at': self.last_flush_at.isoformat() if self.last_flush_at else None,
+                'last_flush_ms': self.last_flush_ms
+            }
+
+
+def init_telemetry_buffer(app):
+    buffer = None
+    if app.config.get('TELEMETRY_BUFFER_ENABLED', False):
+        buffer = TelemetryBuffer(max_pending=app.config.get('TELEMETRY_FLUSH_THRESHOLD', 5000))
+
+        def flush_at_exit():
+            # atexit runs this before the scheduler's own hook, so stop the scheduler here
+            # first; otherwise a flush job still running could write after the final flush
+            from app.scheduler import shutdown_scheduler
+            shutdown_scheduler()
+
+            with app.app_context():
+                flushed = buffer.flush()
+                if flushed:
+                    logger.info(f"Flushed telemetry for {flushed} sensors at shutdown")
+
+        atexit.register(flush_at_exit)
+    app.extensions['telemetry_buffer'] = buffer
+    return buffer
+
+
+def get_telemetry_buffer():
+    return current_app.extensions.get('telemetry_buffer')
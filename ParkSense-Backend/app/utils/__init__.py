@@ -1,3 +1,4 @@
 from app.utils.db_init import init_db, populate_sample_data, reset_db
+from app.utils.batching import chunked
 
-__all__ = ['init_db', 'populate_sample_data', 'reset_db']
+__all__ = ['init_db', 'populate_sample_data', 'reset_db', 'chunked']
@@ -0,0 +1,12 @@
+from itertools import islice
+
+# Stay well under SQLite's bound-parameter limit for IN (...) lookups
+DEFAULT_CHUNK_SIZE = 500
+
+def chunked(iterable, size=DEFAULT_CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
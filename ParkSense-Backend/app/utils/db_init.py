@@ -1,14 +1,44 @@
 from datetime import datetime
+from flask import current_app
 from app import db
 from app.models.parking_garage import ParkingGarage
 from app.models.parking_spot import ParkingSpot
 from app.models.sensor import Sensor
 from app.models.camera import Camera
+from app.models.occupancy_history import OccupancyHistory
+from app.utils.topology import BulkWriter
 
 def init_db():
     db.create_all()
     print("Database tables created successfully")
 
+def upgrade_schema():
+    """
+    Bring tables created by an older version up to date
+
+    create_all only creates missing tables, so columns and indexes added to
+    existing tables since are created here.
+    """
+    history = OccupancyHistory.__table__
+    spot = ParkingSpot.__table__
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns(history.name)}
+
+    with db.engine.begin() as conn:
+        added = [name for name in ('garage_id', 'floor_number') if name not in columns]
+        for name in added:
+            conn.execute(db.text(f'ALTER TABLE {history.name} ADD COLUMN {name} INTEGER'))
+
+        if added:
+            conn.execute(history.update().where(history.c.garage_id.is_(None)).values(
+                garage_id=db.select(spot.c.garage_id).where(spot.c.space_id == history.c.space_id).scalar_subquery(),
+                floor_number=db.select(spot.c.floor_number).where(spot.c.space_id == history.c.space_id).scalar_subquery()
+            ))
+            print(f"Added {', '.join(added)} to {history.name}")
+
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
 def populate_sample_data():
 
     if ParkingGarage.query.first():
@@ -36,25 +66,32 @@ def populate_sample_data():
         }
     ]
 
+    # Ids are assigned here so spots and sensors go out in batches rather than a flush per spot
+    writer = BulkWriter()
+    now = datetime.utcnow()
+
     for garage_data in garages_data:
-        garage = ParkingGarage(
-            name=garage_data["name"],
-            address=garage_data["address"],
-            total_floors=garage_data["total_floors"],
-            total_spaces=garage_data["total_spaces"],
-            open_spaces=garage_data["total_spaces"]
-        )
-        db.session.add(garage)
-        db.session.flush()  
+        garage_id = writer.next_id(ParkingGarage)
+        writer.add(ParkingGarage, {
+            'garage_id': garage_id,
+            'name': garage_data["name"],
+            'address': garage_data["address"],
+            'total_floors': garage_data["total_floors"],
+            'total_spaces': garage_data["total_spaces"],
+            'open_spaces': garage_data["total_spaces"],
+            'created_at': now,
+            'updated_at': now
+        })
 
         for floor in range(1, garage_data["total_floors"] + 1):
-            camera = Camera(
-                garage_id=garage.garage_id,
-                floor_number=floor,
-                status="active",
-                last_ping=datetime.utcnow()
-            )
-            db.session.add(camera)
+            writer.add(Camera, {
+                'camera_id': writer.next_id(Camera),
+                'garage_id': garage_id,
+                'floor_number': floor,
+                'status': "active",
+                'last_ping': now,
+                'created_at': now
+            })
 
         spots_per_floor = garage_data["total_spaces"] // garage_data["total_floors"]
 
@@ -72,29 +109,49 @@ def populate_sample_data():
                 else:
                     spot_type = 'regular'
 
-                spot = ParkingSpot(
-                    garage_id=garage.garage_id,
-                    floor_number=floor,
-                    spot_number=spot_num,
-                    spot_type=spot_type,
-                    is_occupied=False,
-                    last_updated=datetime.utcnow()
-                )
-                db.session.add(spot)
-                db.session.flush()  
-
-                sensor = Sensor(
-                    parking_space_id=spot.space_id,
-                    status="active",
-                    last_reading=100.0,  
-                    battery_level=100,
-                    last_ping=datetime.utcnow()
-                )
-                db.session.add(sensor)
-
-    db.session.commit()
+                space_id = writer.next_id(ParkingSpot)
+                writer.add(ParkingSpot, {
+                    'space_id': space_id,
+                    'garage_id': garage_id,
+                    'floor_number': floor,
+                    'spot_number': spot_num,
+                    'spot_type': spot_type,
+                    'is_occupied': False,
+                    'last_updated': now
+                })
+
+                writer.add(Sensor, {
+                    'sensor_id': writer.next_id(Sensor),
+                    'parking_space_id': space_id,
+                    'status': "active",
+                    'last_reading': 100.0,  
+                    'battery_level': 100,
+                    'last_ping': now,
+                    'created_at': now
+                })
+
+    writer.finish()
+
+    from app.services.sensor_mapping_service import SensorMappingService
+    SensorMappingService.seed_from_config(current_app.config)
+
+    reload_occupancy_store()
     print(f"Sample data created: 3 garages (North, South, West) with parking spots and sensors")
 
+def reload_occupancy_store():
+    store = current_app.extensions.get('occupancy_store')
+    if store:
+        store.load()
+    cache = current_app.extensions.get('response_cache')
+    if cache:
+        cache.clear()
+    forecasts = current_app.extensions.get('forecast_store')
+    if forecasts:
+        forecasts.load()
+    mappings = current_app.extensions.get('sensor_mappings')
+    if mappings is not None:
+        mappings.load()
+
 def reset_db():
     db.drop_all()
     print("All tables dropped")
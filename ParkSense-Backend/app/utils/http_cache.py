@@ -0,0 +1,87 @@
+import zlib
+from urllib.parse import urlencode
+from flask import request, current_app
+from app.services.response_cache import get_response_cache
+
+GZIP_ETAG_SUFFIX = '.gz'
+
+
+def etag_for(version_tag):
+    """Strong ETag for the current request, distinguishing query-string variants"""
+    if version_tag is None:
+        return None
+    if request.args:
+        variant = zlib.crc32(urlencode(sorted(request.args.items(multi=True))).encode())
+        return f"{version_tag}.{variant:08x}"
+    return version_tag
+
+
+def not_modified(etag):
+    """Return a 304 response if If-None-Match already names this ETag, else None"""
+    if not etag:
+        return None
+
+    if_none_match = request.if_none_match
+    if if_none_match.contains_weak(etag) or if_none_match.contains_weak(etag + GZIP_ETAG_SUFFIX):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+
+def tag_response(response, etag):
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def cache_key():
+    return (request.path, tuple(sorted(request.args.items(multi=True))))
+
+
+def cache_generation(tags):
+    """
+    Snapshot the tags' generations, taken before the version tag behind the ETag is read
+
+    A change landing after the snapshot then keeps a body built from newer state out
+    of the cache under the older ETag.
+    """
+    return get_response_cache().generation(tags)
+
+
+def cached_json(tags, etag, generation, build):
+    """
+    Serve a JSON body from the response cache, building and storing it on a miss
+
+    Args:
+        tags: Cache tags whose invalidation makes this body stale
+        etag: ETag of the representation being built
+        generation: cache_generation(tags), snapshotted before etag was computed
+        build: Callable returning the JSON envelope, or None when the resource does not exist
+
+    Returns:
+        Response: 200 response with the cached body, or None if build returned None
+    """
+    cache = get_response_cache()
+    key = cache_key()
+
+    entry = cache.get(key)
+    if entry is None:
+        payload = build()
+        if payload is None:
+            return None
+        body = current_app.json.dumps(payload).encode()
+        entry = cache.put(key, tags, body, etag, generation)
+
+    response = current_app.response_class(mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+
+    if entry.gzip_body is not None and 'gzip' in request.accept_encodings:
+        response.set_data(entry.gzip_body)
+        response.headers['Content-Encoding'] = 'gzip'
+        return tag_response(response, entry.etag + GZIP_ETAG_SUFFIX if entry.etag else None)
+
+    response.set_data(entry.body)
+    return tag_response(response, entry.etag)
@@ -0,0 +1,206 @@
+"""
+Bulk topology generation
+Garages, cameras, spots and sensors, optionally with months of occupancy history,
+written with batched core inserts and primary keys assigned up front
+"""
+import bisect
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from app import db
+from app.models.parking_garage import ParkingGarage
+from app.models.parking_spot import ParkingSpot
+from app.models.sensor import Sensor
+from app.models.camera import Camera
+from app.models.occupancy_history import OccupancyHistory
+
+DEFAULT_BATCH_SIZE = 10000
+
+DEFAULT_SPOT_TYPES = {'regular': 88, 'handicap': 4, 'ev': 4, 'staff': 4}
+
+
+class BulkWriter:
+    """
+    Collects rows per table and writes them with one executemany per table and batch
+
+    Ids come from the table's current maximum, so children can reference a parent
+    without a flush per row. Every flush writes all buffered tables in foreign key
+    order and commits, which keeps both memory and transactions bounded.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._rows = {}
+        self._next_ids = {}
+        self.rows = Counter()
+        self.seconds = Counter()
+
+    def next_id(self, model):
+        table = model.__table__
+        if table not in self._next_ids:
+            column = table.primary_key.columns[0]
+            self._next_ids[table] = (db.session.query(db.func.max(column)).scalar() or 0) + 1
+        value = self._next_ids[table]
+        self._next_ids[table] += 1
+        return value
+
+    def add(self, model, row):
+        table = model.__table__
+        self._rows.setdefault(table, []).append(row)
+        if len(self._rows[table]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in db.metadata.sorted_tables:
+            rows = self._rows.pop(table, None)
+            if not rows:
+                continue
+            start = time.perf_counter()
+            db.session.execute(table.insert(), rows)
+            self.seconds[table.name] += time.perf_counter() - start
+            self.rows[table.name] += len(rows)
+        db.session.commit()
+
+    def finish(self):
+        self.flush()
+        self._sync_sequences()
+
+    def _sync_sequences(self):
+        """Move PostgreSQL serial sequences past the ids assigned here"""
+        if db.engine.dialect.name != 'postgresql':
+            return
+        for table in self._next_ids:
+            column = table.primary_key.columns[0].name
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column}'), "
+                f"(SELECT MAX({column}) FROM {table.name}))"
+            ))
+        db.session.commit()
+
+
+def generate_topology(garages, floors=(4, 8), spots_per_floor=(200, 400), spot_types=None, occupancy=0.5,
+                      history_days=0, events_per_day=4, seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Add synthetic garages to the database
+
+    Args:
+        garages: Number of garages to add
+        floors: (low, high) floors per garage, drawn uniformly
+        spots_per_floor: (low, high) spots per floor, drawn uniformly per garage
+        spot_types: {spot_type: weight}, DEFAULT_SPOT_TYPES if omitted
+        occupancy: Share of spots occupied now
+        history_days: Days of OccupancyHistory to generate per spot, none if 0
+        events_per_day: Mean state changes per spot and day of history
+        seed: Random seed for a repeatable topology
+
+    Returns:
+        BulkWriter: Rows written and insert time per table
+    """
+    from app.services.sensor_service import SensorService
+
+    rng = random.Random(seed)
+    spot_types = spot_types or DEFAULT_SPOT_TYPES
+    type_names = list(spot_types)
+    cumulative = []
+    total_weight = 0
+    for name in type_names:
+        total_weight += spot_types[name]
+        cumulative.append(total_weight)
+
+    writer = BulkWriter(batch_size)
+    now = datetime.utcnow()
+
+    for _ in range(garages):
+        garage_id = writer.next_id(ParkingGarage)
+        floor_count = rng.randint(*floors)
+        per_floor = rng.randint(*spots_per_floor)
+        total = floor_count * per_floor
+        states = [rng.random() < occupancy for _ in range(total)]
+
+        writer.add(ParkingGarage, {
+            'garage_id': garage_id,
+            'name': f"Synthetic Garage {garage_id}",
+            'address': f"{garage_id} Synthetic Way, San Jose, CA 95112",
+            'total_floors': floor_count,
+            'total_spaces': total,
+            'open_spaces': total - sum(states),
+            'latitude': 37.3352 + rng.uniform(-0.05, 0.05),
+            'longitude': -121.8811 + rng.uniform(-0.05, 0.05),
+            'created_at': now,
+            'updated_at': now
+        })
+
+        for floor in range(1, floor_count + 1):
+            writer.add(Camera, {
+                'camera_id': writer.next_id(Camera),
+                'garage_id': garage_id,
+                'floor_number': floor,
+                'status': 'active',
+                'last_ping': now,
+                'created_at': now
+            })
+
+        index = 0
+        for floor in range(1, floor_count + 1):
+            for spot_num in range(1, per_floor + 1):
+                is_occupied = states[index]
+                index += 1
+                space_id = writer.next_id(ParkingSpot)
+                if index == 1:
+                    first_space_id = space_id
+                writer.add(ParkingSpot, {
+                    'space_id': space_id,
+                    'garage_id': garage_id,
+                    'floor_number': floor,
+                    'spot_number': str(spot_num),
+                    'is_occupied': is_occupied,
+                    'spot_type': type_names[bisect.bisect(cumulative, rng.random() * total_weight)],
+                    'last_updated': now
+                })
+
+                battery_level = rng.randint(SensorService.LOW_BATTERY_LEVEL // 2, 100)
+                writer.add(Sensor, {
+                    'sensor_id': writer.next_id(Sensor),
+                    'parking_space_id': space_id,
+                    'status': 'low_battery' if battery_level < SensorService.LOW_BATTERY_LEVEL else 'active',
+                    'last_reading': 10.0 if is_occupied else 100.0,
+                    'battery_level': battery_level,
+                    'last_ping': now,
+                    'created_at': now
+                })
+
+        if history_days:
+            _add_history(writer, rng, garage_id, first_space_id, per_floor, states, history_days, events_per_day, now)
+
+    writer.finish()
+    return writer
+
+
+def _add_history(writer, rng, garage_id, first_space_id, per_floor, states, history_days, events_per_day, now):
+    """
+    State changes for one garage's spots, generated a day at a time back from now
+
+    Each day goes out sorted by time, so inserts land in one day's stretch of the
+    timestamp indexes rather than all over the range.
+    """
+    states = bytearray(states)
+    for day in range(history_days):
+        day_end = now - timedelta(days=day)
+        events = []
+        for index in range(len(states)):
+            count = int(rng.random() * 2 * events_per_day + 0.5)
+            # Walk back from the current state so the latest event agrees with the spot
+            for offset in sorted(rng.random() * 86400 for _ in range(count)):
+                events.append((offset, index, states[index]))
+                states[index] ^= 1
+
+        events.sort(reverse=True)
+        for offset, index, was_occupied in events:
+            writer.add(OccupancyHistory, {
+                'space_id': first_space_id + index,
+                'garage_id': garage_id,
+                'floor_number': index // per_floor + 1,
+                'was_occupied': bool(was_occupied),
+                'timestamp': day_end - timedelta(seconds=offset)
+            })
@@ -0,0 +1,369 @@
+"""
+API benchmark suite
+Times every route in garage_routes, spot_routes and sensor_routes with concurrent
+clients, either in process against create_app(TestingConfig) or over HTTP against a
+running server, and reports p50/p95/p99 latency, requests per second and, in process,
+SQL queries per request
+
+Results can be saved as a JSON baseline; --compare exits with status 1 when an endpoint's
+p95 latency or query count regresses past --threshold against one.
+
+Run from ParkSense-Backend:
+    python -m benchmarks.api_suite --concurrency 4 --requests 400 --save baseline.json
+    python -m benchmarks.api_suite --garages 50 --history-days 7 --compare baseline.json
+    python -m benchmarks.api_suite --url http://127.0.0.1:5000 --only availability,floor
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from sqlalchemy import event
+from app import create_app, db
+from app.scheduler.jobs import run_forecast_refresh, run_rollups_until_caught_up
+from app.utils.db_init import populate_sample_data, reload_occupancy_store
+from app.utils.topology import generate_topology
+from benchmarks.arduino_pipeline import percentile
+from benchmarks.traffic_simulator import InProcessClient, HttpClient, load_topology
+from config.config import TestingConfig
+
+BASE_URL = '/api/v1'
+
+ROUTE_MODULES = ('app.routes.garage_routes', 'app.routes.spot_routes', 'app.routes.sensor_routes')
+
+
+class SuiteConfig(TestingConfig):
+    ARDUINO_POLL_ENABLED = False
+
+
+class ConcurrentSuiteConfig(SuiteConfig):
+    # An in-memory database is one connection shared by every thread
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'parksense_api_suite.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+
+
+Case = namedtuple('Case', 'name method rule build stream', defaults=(False,))
+
+# build(ctx, rng) -> (path, json body or None); reads first, writes last so they time a settled dataset
+CASES = [
+    Case('garages', 'GET', '/garages',
+         lambda c, r: ('/garages', None)),
+    Case('garage', 'GET', '/garages/<int:garage_id>',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}", None)),
+    Case('availability', 'GET', '/garages/<int:garage_id>/availability',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/availability", None)),
+    Case('availability_bitmap', 'GET', '/garages/<int:garage_id>/availability',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/availability?format=bitmap", None)),
+    Case('layout', 'GET', '/garages/<int:garage_id>/layout',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/layout", None)),
+    Case('floor', 'GET', '/garages/<int:garage_id>/floors/<int:floor_number>',
+         lambda c, r: floor_path(c, r, '/garages/{garage_id}/floors/{floor}')),
+    Case('spots_by_type', 'GET', '/garages/<int:garage_id>/spots/type/<spot_type>',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/spots/type/regular?limit=50", None)),
+    Case('spots_page', 'GET', '/garages/<int:garage_id>/spots',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/spots?limit=100&available=true", None)),
+    Case('garage_history', 'GET', '/garages/<int:garage_id>/history',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/history?granularity=hour", None)),
+    Case('garage_occupancy', 'GET', '/garages/<int:garage_id>/occupancy',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/occupancy?step=15m", None)),
+    Case('garage_forecast', 'GET', '/garages/<int:garage_id>/forecast',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/forecast?hours=3", None)),
+    Case('garage_changes', 'GET', '/garages/<int:garage_id>/changes',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/changes", None)),
+    Case('garage_stream', 'GET', '/garages/<int:garage_id>/stream',
+         lambda c, r: (f"/garages/{r.choice(c['garage_ids'])}/stream", None), stream=True),
+    Case('spot', 'GET', '/spots/<int:space_id>',
+         lambda c, r: (f"/spots/{r.choice(c['space_ids'])}", None)),
+    Case('spot_history', 'GET', '/spots/<int:space_id>/history',
+         lambda c, r: (f"/spots/{r.choice(c['space_ids'])}/history?hours=24", None)),
+    Case('sensor', 'GET', '/sensors/<int:sensor_id>',
+         lambda c, r: (f"/sensors/{r.choice(c['sensor_ids'])}", None)),
+    Case('sensors_health', 'GET', '/sensors/health',
+         lambda c, r: ('/sensors/health', None)),
+    Case('sensors_health_category', 'GET', '/sensors/health/<category>',
+         lambda c, r: (f"/sensors/health/{r.choice(['healthy', 'low_battery', 'unresponsive'])}?limit=50", None)),
+    Case('sensor_filter', 'GET', '/sensors/filter',
+         lambda c, r: ('/sensors/filter', None)),
+    Case('telemetry_buffer', 'GET', '/sensors/telemetry-buffer',
+         lambda c, r: ('/sensors/telemetry-buffer', None)),
+    Case('polling_status', 'GET', '/polling/status',
+         lambda c, r: ('/polling/status', None)),
+    Case('spot_occupancy', 'PUT', '/spots/<int:space_id>/occupancy',
+         lambda c, r: (f"/spots/{r.choice(c['space_ids'])}/occupancy", {'is_occupied': r.random() < 0.5})),
+    Case('sensor_reading', 'POST', '/sensors/<int:sensor_id>/reading',
+         lambda c, r: (f"/sensors/{r.choice(c['sensor_ids'])}/reading", {'distance': r.choice([10.0, 150.0])})),
+    Case('sensor_readings_batch', 'POST', '/sensors/readings',
+         lambda c, r: ('/sensors/readings', [
+             {'sensor_id': sensor_id, 'distance': r.choice([10.0, 150.0])}
+             for sensor_id in r.sample(c['sensor_ids'], min(100, len(c['sensor_ids'])))
+         ])),
+    Case('sensor_battery', 'PUT', '/sensors/<int:sensor_id>/battery',
+         lambda c, r: (f"/sensors/{r.choice(c['sensor_ids'])}/battery", {'battery_level': r.randint(10, 100)})),
+]
+
+
+def floor_path(ctx, rng, template):
+    garage_id = rng.choice(ctx['garage_ids'])
+    return template.format(garage_id=garage_id, floor=rng.choice(ctx['floors'][garage_id])), None
+
+
+class QueryCounter:
+    """SQL statements executed per thread, counted from engine events"""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def get(self):
+        return getattr(self._local, 'count', 0)
+
+
+class InProcessTimer(InProcessClient):
+    def send(self, method, path, json=None, stream=False):
+        if stream:
+            response = self.client.get(BASE_URL + path, buffered=False)
+            chunk = next(iter(response.response), b'')
+            response.close()
+            return response.status_code, len(chunk)
+        response = self.client.open(BASE_URL + path, method=method, json=json)
+        return response.status_code, len(response.data)
+
+
+class HttpTimer(HttpClient):
+    def send(self, method, path, json=None, stream=False):
+        try:
+            response = self.session.request(method, self.url + path, json=json, timeout=30, stream=stream)
+            if stream:
+                chunk = next(response.iter_content(chunk_size=None), b'')
+                response.close()
+                return response.status_code, len(chunk)
+            return response.status_code, len(response.content)
+        except self.errors:
+            return 0, 0
+
+
+def check_coverage(app, cases):
+    """Names of routes in ROUTE_MODULES that no case exercises"""
+    covered = {(case.method, case.rule) for case in cases}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        view = app.view_functions[rule.endpoint]
+        if view.__module__ not in ROUTE_MODULES:
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (method, rule.rule[len(BASE_URL):]) not in covered:
+                missing.append(f"{method} {rule.rule}")
+    return sorted(missing)
+
+
+def prepare_dataset(args):
+    config = ConcurrentSuiteConfig if args.concurrency > 1 else SuiteConfig
+    path = config.SQLALCHEMY_DATABASE_URI.replace('sqlite:///', '')
+    if path != ':memory:' and os.path.exists(path):
+        os.remove(path)
+
+    app = create_app(config)
+    with app.app_context():
+        if args.garages:
+            generate_topology(args.garages, floors=(args.floors, args.floors),
+                              spots_per_floor=(args.spots_per_floor, args.spots_per_floor),
+                              history_days=args.history_days, seed=args.seed)
+            if args.history_days:
+                run_rollups_until_caught_up(app, max_batches=1000)
+                run_forecast_refresh(app)
+            reload_occupancy_store()
+        else:
+            populate_sample_data()
+    return app
+
+
+def run_case(case, make_client, ctx, args, counter):
+    client = make_client()
+    rng = random.Random(args.seed)
+    for _ in range(args.warmup):
+        path, body = case.build(ctx, rng)
+        client.send(case.method, path, body, case.stream)
+
+    latencies = []
+    queries = []
+    statuses = Counter()
+    sizes = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.concurrency + 1)
+
+    def worker(index, count):
+        worker_client = make_client()
+        worker_rng = random.Random(args.seed + 1 + index)
+        requests = [case.build(ctx, worker_rng) for _ in range(count)]
+        timings = []
+        barrier.wait()
+        for path, body in requests:
+            before = counter.get() if counter else 0
+            start = time.perf_counter()
+            status, size = worker_client.send(case.method, path, body, case.stream)
+            elapsed = time.perf_counter() - start
+            timings.append((elapsed * 1000, counter.get() - before if counter else None, status, size))
+        with lock:
+            for elapsed, query_count, status, size in timings:
+                latencies.append(elapsed)
+                queries.append(query_count)
+                statuses[status] += 1
+                sizes.append(size)
+
+    per_worker, extra = divmod(args.requests, args.concurrency)
+    threads = [threading.Thread(target=worker, args=(i, per_worker + (i < extra))) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    errors = {str(status): count for status, count in statuses.items() if not 200 <= status < 300}
+    return {
+        'count': len(latencies),
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(max(latencies), 3),
+        'queries_per_request': round(statistics.mean(queries), 2) if counter else None,
+        'bytes_per_response': round(statistics.mean(sizes)),
+        'errors': errors
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    Print results against a baseline
+
+    Returns:
+        list: Names of cases that regressed
+    """
+    regressions = []
+    print(f"{'case':<26}{'base p95':>10}{'p95':>10}{'change':>9}{'base q':>8}{'q':>8}  verdict")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<26}{'':>10}{result['p95_ms']:>10.2f}{'':>9}{'':>8}{'':>8}  new")
+            continue
+
+        change = result['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        slower = change > threshold and result['p95_ms'] - base['p95_ms'] > min_delta_ms
+        base_queries = base.get('queries_per_request')
+        queries = result['queries_per_request']
+        more_queries = (base_queries is not None and queries is not None
+                        and queries - base_queries >= 1 and queries > base_queries * (1 + threshold))
+
+        verdict = ', '.join(reason for reason, failed in (('slower', slower), ('more queries', more_queries)) if failed)
+        if verdict:
+            regressions.append(name)
+        print(f"{name:<26}{base['p95_ms']:>10.2f}{result['p95_ms']:>10.2f}{change:>+9.0%}"
+              f"{'-' if base_queries is None else base_queries:>8}{'-' if queries is None else queries:>8}  "
+              f"{verdict.upper() if verdict else 'ok'}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running server; runs in process if omitted')
+    parser.add_argument('--garages', type=int, default=0, help='in process: synthetic garages instead of the sample data')
+    parser.add_argument('--floors', type=int, default=5)
+    parser.add_argument('--spots-per-floor', type=int, default=300)
+    parser.add_argument('--history-days', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per case')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests per case')
+    parser.add_argument('--only', help='comma-separated case names')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative p95 or query count increase')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='p95 increases below this never fail')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    cases = CASES
+    if args.only:
+        names = set(args.only.split(','))
+        cases = [case for case in CASES if case.name in names]
+        unknown = names - {case.name for case in cases}
+        if unknown:
+            raise SystemExit(f"Unknown cases: {', '.join(sorted(unknown))}")
+
+    if args.url:
+        app = create_app(SuiteConfig)
+        make_client = lambda: HttpTimer(args.url)
+        counter = None
+    else:
+        app = prepare_dataset(args)
+        make_client = lambda: InProcessTimer(app)
+        with app.app_context():
+            counter = QueryCounter(db.engine)
+
+    missing = check_coverage(app, CASES)
+    if missing:
+        raise SystemExit(f"Routes without a benchmark case: {', '.join(missing)}")
+
+    garages, floors, states, sensors = load_topology(make_client())
+    ctx = {
+        'garage_ids': list(garages),
+        'floors': floors,
+        'space_ids': list(states),
+        'sensor_ids': list(sensors.values())
+    }
+
+    results = {}
+    print("=" * 96)
+    print(f"Target: {args.url or 'in process'}   Garages: {len(garages)}   Spots: {len(states)}   "
+          f"Concurrency: {args.concurrency}   Requests: {args.requests} (+{args.warmup} warm-up)")
+    print("-" * 96)
+    print(f"{'case':<26}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'queries':>9}{'bytes':>9}  errors")
+    for case in cases:
+        result = results[case.name] = run_case(case, make_client, ctx, args, counter)
+        queries = '-' if result['queries_per_request'] is None else result['queries_per_request']
+        print(f"{case.name:<26}{result['rps']:>9,.0f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{result['p99_ms']:>9.2f}{result['max_ms']:>9.1f}{queries:>9}{result['bytes_per_response']:>9}  "
+              f"{result['errors'] or ''}")
+    print("=" * 96)
+
+    meta = {
+        'created_at': datetime.utcnow().isoformat(),
+        'target': args.url or 'in-process',
+        'garages': len(garages),
+        'spots': len(states),
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'python': platform.python_version()
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        differs = [key for key in ('target', 'spots', 'concurrency') if baseline['meta'].get(key) != meta[key]]
+        if differs:
+            print(f"Warning: baseline differs in {', '.join(differs)}, numbers may not be comparable")
+        regressions = compare(results, baseline['results'], args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"✗ {len(regressions)} regressed past {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"✓ No regressions past {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Arduino polling pipeline
+Drives PollingService.poll_and_update end to end against replayed Arduino Cloud traffic,
+fetch through diff to the database writes, and reports throughput and per-stage latency
+
+Run from ParkSense-Backend:
+    python -m benchmarks.arduino_pipeline --things 50 --properties 100 --rounds 20 --speedup 10
+    python -m benchmarks.arduino_pipeline --recording traffic.jsonl --fault-429 0.02 --fault-timeout 0.01
+"""
+import argparse
+import json
+import statistics
+import time
+from app import create_app
+from app.models.sensor import Sensor
+from app.services.arduino_cloud_service import ArduinoCloudService
+from app.services.polling_service import PollingService
+from app.services.sensor_mapping_service import SensorMappingService
+from app.utils.db_init import populate_sample_data
+from benchmarks.arduino_replay import ReplayAdapter, install, load_records, synthesize, thing_id_from_path
+from config.config import TestingConfig
+
+
+class BenchmarkConfig(TestingConfig):
+    ARDUINO_POLL_ENABLED = False
+    ARDUINO_ADAPTIVE_POLL = False
+    ARDUINO_THING_IDS = []
+    ARDUINO_SENSOR_MAPPING = {}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def map_properties(records, sensor_ids):
+    """Assign every replayed property its own sample sensor"""
+    mappings = {}
+    sensors = iter(sensor_ids)
+    for record in records:
+        thing_id = thing_id_from_path(record['path'])
+        if thing_id is None or record['status'] != 200 or thing_id in mappings:
+            continue
+        mapping = {}
+        for prop in json.loads(record['body']):
+            sensor_id = next(sensors, None)
+            if sensor_id is None:
+                raise SystemExit(f"Recording has more properties than the {len(sensor_ids)} sample sensors")
+            mapping[prop['name']] = sensor_id
+        mappings[thing_id] = mapping
+    return mappings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', help='JSON lines file from arduino_replay; synthesized if omitted')
+    parser.add_argument('--things', type=int, default=50)
+    parser.add_argument('--properties', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--flip-rate', type=float, default=0.02)
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--speedup', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate-limit', type=int, default=1000, help='client-side requests per second')
+    parser.add_argument('--fault-429', type=float, default=0.0)
+    parser.add_argument('--fault-timeout', type=float, default=0.0)
+    parser.add_argument('--fault-401', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.recording:
+        records = load_records(args.recording)
+    else:
+        records = synthesize(args.things, args.properties, args.rounds, args.flip_rate, args.latency_ms, args.seed)
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        populate_sample_data()
+        sensor_ids = [sensor_id for (sensor_id,) in Sensor.query.with_entities(Sensor.sensor_id).order_by(Sensor.sensor_id)]
+        mappings = map_properties(records, sensor_ids)
+        SensorMappingService.upsert(mappings)
+        app.extensions['sensor_mappings'].refresh()
+
+    adapter = ReplayAdapter(
+        records,
+        speedup=args.speedup,
+        faults={'429': args.fault_429, 'timeout': args.fault_timeout, '401': args.fault_401},
+        seed=args.seed
+    )
+    service = ArduinoCloudService(
+        client_id='bench',
+        client_secret='bench',
+        max_workers=args.workers,
+        rate_limit_requests=args.rate_limit,
+        rate_limit_period=1
+    )
+    install(service, adapter)
+    polling_service = PollingService(app, service)
+
+    total_properties = sum(len(mapping) for mapping in mappings.values())
+    stages = {'fetch_ms': [], 'diff_ms': [], 'apply_ms': [], 'total_ms': []}
+    thing_latencies = []
+    writes = 0
+    failed_things = 0
+    retries = 0
+    initial = None
+
+    start = time.perf_counter()
+    for round_number in range(args.rounds):
+        result = polling_service.poll_and_update()
+        failed_things += len(result.get('failed_things') or {})
+        retries += 1 if result.get('retry') else 0
+        thing_latencies.extend(stats['last_latency_ms'] for stats in polling_service.thing_stats.values())
+        if not result['success']:
+            continue
+
+        timings = dict(polling_service.last_poll_stages, total_ms=polling_service.last_poll_duration_ms)
+        if round_number == 0:
+            initial = (timings, result['sensors_updated'])
+            continue
+        writes += result['sensors_updated']
+        for stage, value in timings.items():
+            stages[stage].append(value)
+    elapsed = time.perf_counter() - start
+    service.close()
+
+    print("=" * 72)
+    print(f"Things: {len(mappings)}   Properties: {total_properties}   Rounds: {args.rounds}   "
+          f"Speed-up: {args.speedup}x   Workers: {args.workers}")
+    print("-" * 72)
+    if initial:
+        print(f"Initial full sync: {initial[0]['total_ms']:.1f} ms, {initial[1]} sensors written")
+    print(f"Throughput: {total_properties * args.rounds / elapsed:,.0f} properties/s over {elapsed:.2f} s, "
+          f"{writes} sensor writes after the first round")
+    if stages['total_ms']:
+        print(f"{'stage':<10}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+        for stage, values in stages.items():
+            print(f"{stage[:-3]:<10}{statistics.median(values):>12.1f}{percentile(values, 0.95):>12.1f}"
+                  f"{max(values):>12.1f}")
+    if thing_latencies:
+        print(f"Per-thing fetch latency: p50 {statistics.median(thing_latencies):.1f} ms, "
+              f"p95 {percentile(thing_latencies, 0.95):.1f} ms")
+    print("-" * 72)
+    breaker = service.circuit_breaker.get_stats()
+    print(f"Requests: {dict(adapter.requests)}   Injected faults: {dict(adapter.injected) or 'none'}")
+    print(f"Failed thing fetches: {failed_things}   Polls that requested a retry: {retries}   "
+          f"Breaker: {breaker['state']} ({breaker['trips']} trips)")
+    print("=" * 72)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Multi-Thing Arduino Cloud polling
+Polls a local stub API serially and on the thread pool and reports wall time and per-Thing latency
+
+Run from ParkSense-Backend:
+    python -m benchmarks.arduino_poll --things 40 --latency 0.1 --workers 8
+"""
+import argparse
+import statistics
+import time
+from app.services.arduino_cloud_service import ArduinoCloudService
+from benchmarks.arduino_stub import ArduinoStubServer, make_things
+
+
+def run(stub, thing_ids, workers, rounds):
+    service = ArduinoCloudService(
+        client_id='bench',
+        client_secret='bench',
+        thing_ids=thing_ids,
+        token_url=stub.token_url,
+        api_base_url=stub.base_url,
+        max_workers=workers
+    )
+    service.get_access_token()
+
+    durations = []
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fetched = service.get_all_properties()
+        durations.append(time.perf_counter() - start)
+        latencies.extend(poll['latency_ms'] for poll in fetched.values())
+        assert not any(poll['error'] for poll in fetched.values()), fetched
+    service.close()
+    return durations, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--things', type=int, default=40)
+    parser.add_argument('--properties', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    things = make_things(args.things, args.properties)
+    stub = ArduinoStubServer(things, latency=args.latency).start()
+
+    try:
+        for label, workers in (('serial', 1), ('concurrent', args.workers)):
+            durations, latencies = run(stub, list(things), workers, args.rounds)
+            print(f"{label:>10} ({workers} workers): {statistics.mean(durations) * 1000:8.1f} ms per poll of "
+                  f"{args.things} things, per-thing latency median {statistics.median(latencies):.1f} ms, "
+                  f"max {max(latencies):.1f} ms")
+        print(f"Token requests: {stub.token_requests}")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Arduino Cloud record/replay
+Captures token and properties exchanges from the real API into a JSON lines file and
+serves them back through a requests transport adapter, faster than real time and
+with injected 429s, timeouts and 401s, so the poller can be load tested offline
+
+Run from ParkSense-Backend:
+    python -m benchmarks.arduino_replay record --out traffic.jsonl --rounds 10 --interval 5
+    python -m benchmarks.arduino_replay synthesize --out traffic.jsonl --things 50 --properties 100
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from config.arduino_config import ArduinoConfig
+
+FAULTS = ('429', 'timeout', '401')
+RECORDED_HEADERS = ('Content-Type', 'Retry-After')
+
+
+def thing_id_from_path(path):
+    """Thing id of a properties request path, or None for any other request"""
+    parts = path.rstrip('/').split('/')
+    if len(parts) >= 4 and parts[-1] == 'properties' and parts[-3] == 'things':
+        return parts[-2]
+    return None
+
+
+def install(service, adapter):
+    """Route every request of an ArduinoCloudService through `adapter`"""
+    service.session.mount('https://', adapter)
+    service.session.mount('http://', adapter)
+    return adapter
+
+
+def save_records(records, path):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def load_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests for real and keeps each exchange, with its latency, in `records`"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.records = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        body = response.content
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        path = urlsplit(request.url).path
+        if request.method == 'POST' and response.status_code == 200:
+            # Never write a live access token to disk
+            token = response.json()
+            token['access_token'] = 'recorded-token'
+            body = json.dumps(token).encode('utf-8')
+
+        record = {
+            'method': request.method,
+            'path': path,
+            'status': response.status_code,
+            'elapsed_ms': round(elapsed_ms, 2),
+            'headers': {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            'body': body.decode('utf-8')
+        }
+        with self._lock:
+            self.records.append(record)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Answers requests from a recording instead of the network
+
+    Responses for the same method and path are served in recorded order and wrap around,
+    so a recording of several polls replays its property changes. Recorded latency is
+    divided by `speedup`. Faults are injected into properties requests only, each with
+    its own probability.
+    """
+
+    def __init__(self, records, speedup=1.0, faults=None, retry_after=1.0, seed=42):
+        super().__init__()
+        self.speedup = speedup
+        self.faults = {fault: rate for fault, rate in (faults or {}).items() if rate}
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._responses = defaultdict(list)
+        for record in records:
+            self._responses[(record['method'], record['path'])].append(record)
+        self._cursor = Counter()
+
+        self.requests = Counter()
+        self.injected = Counter()
+
+    @property
+    def thing_ids(self):
+        ids = (thing_id_from_path(path) for method, path in self._responses if method == 'GET')
+        return [thing_id for thing_id in ids if thing_id]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = (request.method, urlsplit(request.url).path)
+        is_properties = thing_id_from_path(key[1]) is not None
+
+        with self._lock:
+            self.requests[request.method] += 1
+            recorded = self._responses.get(key)
+            record = None
+            if recorded:
+                record = recorded[self._cursor[key] % len(recorded)]
+                self._cursor[key] += 1
+
+            fault = None
+            if is_properties:
+                for name, rate in self.faults.items():
+                    if self._rng.random() < rate:
+                        fault = name
+                        self.injected[name] += 1
+                        break
+
+        if record is None:
+            return self._response(request, 404, {'error': 'not recorded'})
+
+        delay = record['elapsed_ms'] / 1000 / self.speedup
+        if fault == 'timeout':
+            read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+            time.sleep(min(delay, read_timeout or delay))
+            raise requests.exceptions.ReadTimeout(f"Injected timeout for {request.url}", request=request)
+
+        time.sleep(delay)
+        if fault == '429':
+            return self._response(request, 429, {'error': 'rate limited'},
+                                  {'Retry-After': str(self.retry_after / self.speedup)})
+        if fault == '401':
+            return self._response(request, 401, {'error': 'unauthorized'})
+
+        return self._response(request, record['status'], record['body'].encode('utf-8'), record['headers'])
+
+    def _response(self, request, status, body, headers=None):
+        response = requests.models.Response()
+        response.status_code = status
+        response.reason = http.client.responses.get(status, '')
+        response.headers = CaseInsensitiveDict(headers or {'Content-Type': 'application/json'})
+        response._content = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def synthesize(things, properties, rounds, flip_rate=0.02, latency_ms=80.0, seed=42,
+               base_url=ArduinoConfig.API_BASE_URL):
+    """
+    Recording of `rounds` polls of `things` Things with `properties` boolean properties each
+
+    Every property flips with probability `flip_rate` between consecutive polls.
+    """
+    rng = random.Random(seed)
+    records = [{
+        'method': 'POST',
+        'path': urlsplit(base_url.rstrip('/') + '/v1/clients/token').path,
+        'status': 200,
+        'elapsed_ms': latency_ms,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'access_token': 'recorded-token', 'expires_in': 3600})
+    }]
+
+    for index in range(things):
+        thing_id = f'thing-{index}'
+        path = urlsplit(ArduinoConfig.get_properties_url(thing_id, base_url)).path
+        values = [rng.random() < 0.5 for _ in range(properties)]
+        for _ in range(rounds):
+            records.append({
+                'method': 'GET',
+                'path': path,
+                'status': 200,
+                'elapsed_ms': round(rng.gauss(latency_ms, latency_ms / 4), 2) if latency_ms else 0.0,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps([
+                    {'name': f'space{number + 1}', 'last_value': value} for number, value in enumerate(values)
+                ])
+            })
+            values = [not value if rng.random() < flip_rate else value for value in values]
+
+    for record in records:
+        record['elapsed_ms'] = max(0.0, record['elapsed_ms'])
+    return records
+
+
+def record(out, rounds, interval):
+    """Poll the real API with the credentials from .env and save every exchange"""
+    from app.services.arduino_cloud_service import ArduinoCloudService
+    from config.config import Config
+
+    if not Config.ARDUINO_CLIENT_ID or not Config.ARDUINO_CLIENT_SECRET:
+        raise SystemExit("Set ARDUINO_CLIENT_ID and ARDUINO_CLIENT_SECRET in .env to record")
+
+    service = ArduinoCloudService(
+        client_id=Config.ARDUINO_CLIENT_ID,
+        client_secret=Config.ARDUINO_CLIENT_SECRET,
+        thing_ids=Config.ARDUINO_THING_IDS,
+        token_url=Config.ARDUINO_TOKEN_URL,
+        api_base_url=Config.ARDUINO_API_BASE_URL
+    )
+    adapter = install(service, RecordingAdapter())
+
+    for round_number in range(rounds):
+        fetched = service.get_all_properties()
+        failed = sum(1 for poll in fetched.values() if poll['error'])
+        print(f"Round {round_number + 1}/{rounds}: {len(fetched)} things, {failed} failed")
+        if round_number < rounds - 1:
+            time.sleep(interval)
+    service.close()
+
+    save_records(adapter.records, out)
+    print(f"Recorded {len(adapter.records)} exchanges to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='capture traffic from the real API')
+    record_parser.add_argument('--out', required=True)
+    record_parser.add_argument('--rounds', type=int, default=10)
+    record_parser.add_argument('--interval', type=float, default=5)
+
+    synth_parser = commands.add_parser('synthesize', help='generate a recording without the API')
+    synth_parser.add_argument('--out', required=True)
+    synth_parser.add_argument('--things', type=int, default=50)
+    synth_parser.add_argument('--properties', type=int, default=100)
+    synth_parser.add_argument('--rounds', type=int, default=20)
+    synth_parser.add_argument('--flip-rate', type=float, default=0.02)
+    synth_parser.add_argument('--latency-ms', type=float, default=80.0)
+    synth_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.out, args.rounds, args.interval)
+    else:
+        records = synthesize(args.things, args.properties, args.rounds, args.flip_rate, args.latency_ms, args.seed)
+        save_records(records, args.out)
+        print(f"Wrote {len(records)} exchanges for {args.things} things to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
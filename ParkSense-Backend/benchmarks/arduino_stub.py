@@ -0,0 +1,129 @@
+"""
+Local stand-in for the Arduino Cloud API
+Serves the token and properties endpoints with configurable latency so the poller
+can be exercised without credentials or network access
+
+Run from ParkSense-Backend:
+    python -m benchmarks.arduino_stub --things 20 --properties 4 --latency 0.1 --port 8765
+then point ARDUINO_API_BASE_URL and ARDUINO_TOKEN_URL at http://127.0.0.1:8765
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ArduinoStubServer:
+
+    def __init__(self, things, latency=0.0, host='127.0.0.1', port=0, token_ttl=3600):
+        """
+        Args:
+            things: {thing_id: {property_name: value}}; values may be changed while running
+            latency: Seconds to wait before answering a properties request
+        """
+        self.things = things
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.token_requests = 0
+        self.property_requests = 0
+        self._lock = threading.Lock()
+        self._token = 0
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def token_url(self):
+        return self.base_url + '/v1/clients/token'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path != '/v1/clients/token':
+                    return self._send(404, {'error': 'not found'})
+                with stub._lock:
+                    stub.token_requests += 1
+                    stub._token += 1
+                    token = f'stub-token-{stub._token}'
+                self._send(200, {'access_token': token, 'expires_in': stub.token_ttl})
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if len(parts) != 4 or parts[:2] != ['v2', 'things'] or parts[3] != 'properties':
+                    return self._send(404, {'error': 'not found'})
+                if not self.headers.get('Authorization', '').startswith('Bearer stub-token-'):
+                    return self._send(401, {'error': 'unauthorized'})
+
+                properties = stub.things.get(parts[2])
+                if properties is None:
+                    return self._send(404, {'error': 'thing not found'})
+
+                with stub._lock:
+                    stub.property_requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self._send(200, [{'name': name, 'last_value': value} for name, value in properties.items()])
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def make_things(count, properties, seed=42):
+    rng = random.Random(seed)
+    return {
+        f'thing-{index}': {f'space{number}': rng.random() < 0.5 for number in range(1, properties + 1)}
+        for index in range(count)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--things', type=int, default=20)
+    parser.add_argument('--properties', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = ArduinoStubServer(make_things(args.things, args.properties), latency=args.latency, port=args.port)
+    print(f"Arduino stub listening on {stub.base_url} with things thing-0..thing-{args.things - 1}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
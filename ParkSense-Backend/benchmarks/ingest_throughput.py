@@ -0,0 +1,81 @@
+"""
+Sensor ingestion throughput
+Compares POST /sensors/<id>/reading against batched POST /sensors/readings
+
+Run from ParkSense-Backend:
+    python -m benchmarks.ingest_throughput --readings 2000 --batch-size 200
+"""
+import argparse
+import random
+import time
+from app import create_app
+from app.models.sensor import Sensor
+from app.utils.db_init import populate_sample_data
+from config.config import TestingConfig
+
+BASE_URL = '/api/v1'
+
+
+class BenchmarkConfig(TestingConfig):
+    ARDUINO_POLL_ENABLED = False
+
+
+def make_readings(sensor_ids, count, seed):
+    rng = random.Random(seed)
+    return [
+        {'sensor_id': rng.choice(sensor_ids), 'distance': rng.choice([10.0, 100.0])}
+        for _ in range(count)
+    ]
+
+
+def run_single(client, readings):
+    start = time.perf_counter()
+    for reading in readings:
+        response = client.post(f"{BASE_URL}/sensors/{reading['sensor_id']}/reading", json=reading)
+        assert response.status_code == 200, response.data
+    return time.perf_counter() - start
+
+
+def run_batched(client, readings, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(readings), batch_size):
+        response = client.post(f"{BASE_URL}/sensors/readings", json=readings[offset:offset + batch_size])
+        assert response.status_code == 200, response.data
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readings', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ('single', 'batched'):
+        app = create_app(BenchmarkConfig)
+        with app.app_context():
+            populate_sample_data()
+            sensor_ids = [sensor_id for (sensor_id,) in Sensor.query.with_entities(Sensor.sensor_id)]
+
+        readings = make_readings(sensor_ids, args.readings, args.seed)
+        client = app.test_client()
+
+        if mode == 'single':
+            elapsed = run_single(client, readings)
+        else:
+            elapsed = run_batched(client, readings, args.batch_size)
+        results[mode] = elapsed
+
+    print("=" * 60)
+    print(f"Readings: {args.readings}   Batch size: {args.batch_size}")
+    print("-" * 60)
+    for mode, elapsed in results.items():
+        print(f"{mode:<10} {elapsed:>8.2f} s   {args.readings / elapsed:>10.0f} readings/s")
+    print("-" * 60)
+    print(f"Speed-up: {results['single'] / results['batched']:.1f}x")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
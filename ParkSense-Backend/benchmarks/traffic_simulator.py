@@ -0,0 +1,422 @@
+"""
+Sensor traffic simulator
+Models vehicle arrivals and departures per garage from a time-of-day curve and a dwell
+distribution, replays them as POST /sensors/<id>/reading and PUT /spots/<id>/occupancy
+while closed-loop readers hit the availability endpoints, and reports read and write
+throughput, latency percentiles and counter-consistency errors
+
+Simulated time runs --time-scale times faster than the wall clock, so --time-scale 600
+plays ten minutes of traffic per second. Writes are open loop, sent when the model says
+they happen; how far they fall behind is reported as schedule lag. A server that
+debounces readings (SENSOR_FILTER_ENABLED) holds single readings back, so against one
+the spots changed through sensors end up differing from the model.
+
+Run from ParkSense-Backend:
+    python -m benchmarks.traffic_simulator --duration 30 --readers 8 --writers 4
+    python -m benchmarks.traffic_simulator --garages 20 --profile retail --start-hour 11
+    python -m benchmarks.traffic_simulator --url http://127.0.0.1:5000 --time-scale 1200
+"""
+import argparse
+import heapq
+import math
+import os
+import queue
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from app import create_app, db
+from app.models.parking_garage import ParkingGarage
+from app.models.parking_spot import ParkingSpot
+from app.utils.db_init import populate_sample_data, reload_occupancy_store
+from app.utils.topology import generate_topology
+from benchmarks.arduino_pipeline import percentile
+from config.config import TestingConfig
+
+BASE_URL = '/api/v1'
+
+# Arrival rate per hour of the day as a share of the peak rate
+PROFILES = {
+    'commuter': [0.02, 0.01, 0.01, 0.01, 0.02, 0.08, 0.35, 0.85, 1.0, 0.7, 0.4, 0.35,
+                 0.4, 0.35, 0.3, 0.3, 0.3, 0.25, 0.2, 0.15, 0.1, 0.08, 0.05, 0.03],
+    'retail': [0.01, 0.01, 0.01, 0.01, 0.01, 0.02, 0.05, 0.1, 0.2, 0.4, 0.6, 0.8,
+               0.9, 0.85, 0.8, 0.8, 0.9, 1.0, 0.9, 0.7, 0.5, 0.3, 0.1, 0.03],
+    'flat': [1.0] * 24,
+}
+
+OCCUPIED_DISTANCE = 10.0
+VACANT_DISTANCE = 150.0
+
+
+class SimulatorConfig(TestingConfig):
+    ARDUINO_POLL_ENABLED = False
+    # Every reading stands for a settled sensor, the debounce would hold single readings back
+    SENSOR_FILTER_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'parksense_traffic.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json=None):
+        response = self.client.open(BASE_URL + path, method=method, json=json)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip('/') + BASE_URL
+        self.session = requests.Session()
+        self.errors = requests.RequestException
+
+    def request(self, method, path, json=None):
+        try:
+            response = self.session.request(method, self.url + path, json=json, timeout=30)
+        except self.errors:
+            return 0, None
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+
+class Recorder:
+    """Latencies, statuses and consistency errors, shared by every worker thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.lags = []
+        self.statuses = defaultdict(Counter)
+        self.inconsistencies = Counter()
+        self.examples = []
+
+    def record(self, kind, status, seconds, lag=None):
+        with self._lock:
+            self.latencies[kind].append(seconds * 1000)
+            self.statuses[kind][status] += 1
+            if lag is not None:
+                self.lags.append(lag * 1000)
+
+    def inconsistent(self, check, detail):
+        with self._lock:
+            self.inconsistencies[check] += 1
+            if len(self.examples) < 5:
+                self.examples.append(f"{check}: {detail}")
+
+
+def load_topology(client):
+    """
+    Read garages, spots and sensors through the API
+
+    Returns:
+        tuple: ({garage_id: [space_id]}, {garage_id: [floor_number]}, {space_id: is_occupied},
+            {space_id: sensor_id})
+    """
+    status, body = client.request('GET', '/garages')
+    if status != 200:
+        raise SystemExit(f"GET /garages returned {status}, is the API running?")
+
+    garages = {}
+    floors = {}
+    states = {}
+    for garage in body['data']:
+        status, body = client.request('GET', f"/garages/{garage['garage_id']}/availability?fields=space_id,is_occupied")
+        spots = [spot for floor in body['data']['floors'] for spot in floor['spots']]
+        garages[garage['garage_id']] = [spot['space_id'] for spot in spots]
+        floors[garage['garage_id']] = [floor['floor_number'] for floor in body['data']['floors']]
+        states.update((spot['space_id'], spot['is_occupied']) for spot in spots)
+
+    sensors = {}
+    for category in ('healthy', 'low_battery', 'unresponsive'):
+        cursor = None
+        while True:
+            path = f"/sensors/health/{category}?limit=500" + (f"&cursor={cursor}" if cursor else '')
+            status, body = client.request('GET', path)
+            if status != 200:
+                break
+            sensors.update((sensor['parking_space_id'], sensor['sensor_id']) for sensor in body['data'])
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+    return garages, floors, states, sensors
+
+
+def build_events(garages, states, args, rng):
+    """
+    Arrivals and departures over the simulated span, sorted by time
+
+    Arrivals are a Poisson process thinned by the profile; each car takes a random free
+    spot and leaves after a lognormal dwell. Cars finding the garage full are turned away.
+
+    Returns:
+        tuple: (list of (sim_seconds, space_id, is_occupied), cars turned away)
+    """
+    curve = PROFILES[args.profile]
+    span = args.duration * args.time_scale
+    mu = math.log(args.dwell_median_minutes * 60)
+    dwell = lambda: rng.lognormvariate(mu, args.dwell_sigma)
+
+    events = []
+    turned_away = 0
+    for spot_ids in garages.values():
+        free = [space_id for space_id in spot_ids if not states[space_id]]
+        departures = [(dwell() * rng.random(), space_id) for space_id in spot_ids if states[space_id]]
+        heapq.heapify(departures)
+
+        peak = len(spot_ids) * args.peak_arrival_rate / 3600
+        now = 0.0
+        while peak:
+            now += rng.expovariate(peak)
+            while departures and departures[0][0] <= min(now, span):
+                at, space_id = heapq.heappop(departures)
+                events.append((at, space_id, False))
+                free.append(space_id)
+            if now > span:
+                break
+
+            hour = int(args.start_hour + now / 3600) % 24
+            if rng.random() >= curve[hour]:
+                continue
+            if not free:
+                turned_away += 1
+                continue
+
+            index = rng.randrange(len(free))
+            free[index], free[-1] = free[-1], free[index]
+            space_id = free.pop()
+            events.append((now, space_id, True))
+            heapq.heappush(departures, (now + dwell(), space_id))
+
+    if args.heartbeat_rate:
+        spot_ids = [space_id for ids in garages.values() for space_id in ids]
+        count = int(args.heartbeat_rate * args.duration)
+        events.extend((rng.random() * span, rng.choice(spot_ids), None) for _ in range(count))
+
+    events.sort(key=lambda event: event[0])
+    return events, turned_away
+
+
+def check_availability(recorder, garage_id, data, prefix=''):
+    garage = data['garage']
+    available = sum(floor['available_spots'] for floor in data['floors'])
+    if available != garage['open_spaces']:
+        recorder.inconsistent(prefix + 'garage_vs_floors',
+                              f"garage {garage_id} open_spaces {garage['open_spaces']}, floors say {available}")
+    for floor in data['floors']:
+        listed = sum(1 for spot in floor['spots'] if not spot['is_occupied'])
+        if listed != floor['available_spots']:
+            recorder.inconsistent(prefix + 'floor_vs_spots', f"garage {garage_id} floor {floor['floor_number']} "
+                                                    f"available_spots {floor['available_spots']}, spots say {listed}")
+
+
+def check_floor(recorder, garage_id, floor_number, data):
+    if len(data['available']) != data['available_spots'] or len(data['occupied']) != data['occupied_spots']:
+        recorder.inconsistent('floor_lists', f"garage {garage_id} floor {floor_number} counts "
+                                             f"{data['available_spots']}/{data['occupied_spots']}, lists "
+                                             f"{len(data['available'])}/{len(data['occupied'])}")
+
+
+def writer_loop(client, work, stop, recorder, states, sensors, occupancy_share, rng):
+    """Send one partition's writes in order, so a spot's events never overtake each other"""
+    while not stop.is_set():
+        try:
+            due, space_id, is_occupied = work.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        kind = 'heartbeat' if is_occupied is None else None
+        if is_occupied is None:
+            is_occupied = states[space_id]
+        else:
+            states[space_id] = is_occupied
+
+        sensor_id = sensors.get(space_id)
+        if kind is None:
+            kind = 'occupancy' if sensor_id is None or rng.random() < occupancy_share else 'reading'
+
+        start = time.perf_counter()
+        if kind == 'occupancy':
+            status, _ = client.request('PUT', f"/spots/{space_id}/occupancy", json={'is_occupied': is_occupied})
+        else:
+            distance = OCCUPIED_DISTANCE if is_occupied else VACANT_DISTANCE
+            status, _ = client.request('POST', f"/sensors/{sensor_id}/reading", json={'distance': distance})
+        recorder.record(kind, status, time.perf_counter() - start, lag=start - due)
+
+
+def reader_loop(client, stop, recorder, garages, floors, think, rng):
+    """Closed loop: each reader sends its next request once the last one answered"""
+    garage_ids = list(garages)
+    while not stop.is_set():
+        garage_id = rng.choice(garage_ids)
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.5:
+            status, body = client.request('GET', f"/garages/{garage_id}/availability")
+            kind = 'availability'
+            if status == 200:
+                check_availability(recorder, garage_id, body['data'])
+        elif roll < 0.8:
+            floor_number = rng.choice(floors[garage_id])
+            status, body = client.request('GET', f"/garages/{garage_id}/floors/{floor_number}")
+            kind = 'floor'
+            if status == 200:
+                check_floor(recorder, garage_id, floor_number, body['data'])
+        else:
+            status, body = client.request('GET', '/garages')
+            kind = 'garages'
+        recorder.record(kind, status, time.perf_counter() - start)
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+
+def final_check(client, recorder, garages, states, app=None):
+    """
+    Once writes have drained: counters against each other, the server against the model
+    and, in process, the garage table against its spots
+
+    Returns:
+        int: Spots whose state differs from the model
+    """
+    drift = 0
+    for garage_id in garages:
+        status, body = client.request('GET', f"/garages/{garage_id}/availability")
+        if status != 200:
+            recorder.inconsistent('final_fetch', f"garage {garage_id} returned {status}")
+            continue
+        check_availability(recorder, garage_id, body['data'], prefix='final_')
+        for floor in body['data']['floors']:
+            drift += sum(1 for spot in floor['spots'] if spot['is_occupied'] != states[spot['space_id']])
+
+    if app is not None:
+        with app.app_context():
+            free = dict(db.session.query(ParkingSpot.garage_id, db.func.count(ParkingSpot.space_id)).filter(
+                ParkingSpot.is_occupied.is_(False)
+            ).group_by(ParkingSpot.garage_id).all())
+            for garage_id, open_spaces in db.session.query(ParkingGarage.garage_id, ParkingGarage.open_spaces):
+                if open_spaces != free.get(garage_id, 0):
+                    recorder.inconsistent('final_table_vs_spots', f"garage {garage_id} open_spaces column "
+                                                                  f"{open_spaces}, {free.get(garage_id, 0)} free spot rows")
+    return drift
+
+
+def summarize(name, values):
+    if not values:
+        return f"{name:<14}{0:>9}"
+    return (f"{name:<14}{len(values):>9}{statistics.median(values):>10.1f}{percentile(values, 0.95):>10.1f}"
+            f"{percentile(values, 0.99):>10.1f}{max(values):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='base URL of a running server; runs in process if omitted')
+    parser.add_argument('--garages', type=int, default=0, help='in process: synthetic garages instead of the sample data')
+    parser.add_argument('--duration', type=float, default=30.0, help='wall-clock seconds')
+    parser.add_argument('--time-scale', type=float, default=600.0, help='simulated seconds per wall second')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='commuter')
+    parser.add_argument('--start-hour', type=float, default=7.0)
+    parser.add_argument('--peak-arrival-rate', type=float, default=0.5, help='arrivals per spot and hour at peak')
+    parser.add_argument('--dwell-median-minutes', type=float, default=120.0)
+    parser.add_argument('--dwell-sigma', type=float, default=0.8)
+    parser.add_argument('--heartbeat-rate', type=float, default=20.0, help='unchanged sensor readings per wall second')
+    parser.add_argument('--occupancy-share', type=float, default=0.2,
+                        help='share of state changes sent as PUT occupancy instead of sensor readings')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--think-ms', type=float, default=0.0, help='mean pause between a reader\'s requests')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = None
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        path = SimulatorConfig.SQLALCHEMY_DATABASE_URI.replace('sqlite:///', '')
+        if os.path.exists(path):
+            os.remove(path)
+        app = create_app(SimulatorConfig)
+        with app.app_context():
+            if args.garages:
+                generate_topology(args.garages, seed=args.seed)
+                reload_occupancy_store()
+            else:
+                populate_sample_data()
+        make_client = lambda: InProcessClient(app)
+
+    client = make_client()
+    garages, floors, states, sensors = load_topology(client)
+
+    events, turned_away = build_events(garages, dict(states), args, rng)
+    arrivals = sum(1 for event in events if event[2] is True)
+    departures = sum(1 for event in events if event[2] is False)
+
+    recorder = Recorder()
+    stop = threading.Event()
+    queues = [queue.Queue() for _ in range(args.writers)]
+    threads = [
+        threading.Thread(target=writer_loop, args=(make_client(), work, stop, recorder, states, sensors,
+                                                   args.occupancy_share, random.Random(args.seed + i)))
+        for i, work in enumerate(queues)
+    ]
+    threads += [
+        threading.Thread(target=reader_loop, args=(make_client(), stop, recorder, garages, floors,
+                                                   args.think_ms / 1000, random.Random(args.seed + 1000 + i)))
+        for i in range(args.readers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for at, space_id, is_occupied in events:
+        due = start + at / args.time_scale
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        queues[space_id % args.writers].put((due, space_id, is_occupied))
+    delay = start + args.duration - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+    # Writes still queued at the end are left unsent and reported as backlog
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    backlog = sum(work.qsize() for work in queues)
+
+    drift = final_check(client, recorder, garages, states, app)
+
+    writes = sum(len(recorder.latencies[kind]) for kind in ('reading', 'occupancy', 'heartbeat'))
+    reads = sum(len(recorder.latencies[kind]) for kind in ('availability', 'floor', 'garages'))
+    print("=" * 72)
+    print(f"Target: {args.url or 'in process'}   Garages: {len(garages)}   Spots: {len(states)}   "
+          f"Profile: {args.profile} from {args.start_hour:g}:00")
+    print(f"Simulated {args.duration * args.time_scale / 3600:.1f} h in {elapsed:.1f} s: {arrivals} arrivals, "
+          f"{departures} departures, {turned_away} cars turned away")
+    print("-" * 72)
+    print(f"Writes: {writes / elapsed:,.0f}/s   Reads: {reads / elapsed:,.0f}/s   "
+          f"({args.writers} writers, {args.readers} readers)")
+    print(f"{'request':<14}{'count':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind in ('reading', 'occupancy', 'heartbeat', 'availability', 'floor', 'garages'):
+        print(summarize(kind, recorder.latencies[kind]))
+    print(summarize('schedule lag', recorder.lags))
+    print(f"Writes still queued when the run ended: {backlog} of {len(events)}")
+    errors = {kind: {status: count for status, count in statuses.items() if status != 200}
+              for kind, statuses in recorder.statuses.items()}
+    errors = {kind: statuses for kind, statuses in errors.items() if statuses}
+    print(f"Error responses: {errors or 'none'}")
+    print("-" * 72)
+    print(f"Counter-consistency errors: {dict(recorder.inconsistencies) or 'none'}")
+    for example in recorder.examples:
+        print(f"  {example}")
+    print(f"Spots differing from the model at the end: {drift}")
+    print("=" * 72)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 class ArduinoConfig:
-    TOKEN_URL = "https://api2.arduino.cc/iot/v1/clients/token"
-    PROPERTIES_URL_TEMPLATE = "https://api2.arduino.cc/iot/v2/things/{thing_id}/properties"
+    API_BASE_URL = "https://api2.arduino.cc/iot"
+    TOKEN_URL = API_BASE_URL + "/v1/clients/token"
+    PROPERTIES_URL_TEMPLATE = "{base_url}/v2/things/{thing_id}/properties"
 
     GRANT_TYPE = "client_credentials"
     AUDIENCE = "https://api2.arduino.cc/iot"
@@ -11,13 +12,20 @@ class ArduinoConfig:
     DEFAULT_MAX_RETRIES = 3
     DEFAULT_RETRY_DELAY = 2  
     DEFAULT_TIMEOUT = 10  
+    DEFAULT_POLL_WORKERS = 8
 
     RATE_LIMIT_REQUESTS = 10
     RATE_LIMIT_PERIOD = 1  
 
+    BREAKER_FAILURE_THRESHOLD = 5
+    BREAKER_RESET_TIMEOUT = 30
+
     @staticmethod
-    def get_properties_url(thing_id):
-        return ArduinoConfig.PROPERTIES_URL_TEMPLATE.format(thing_id=thing_id)
+    def get_properties_url(thing_id, base_url=None):
+        return ArduinoConfig.PROPERTIES_URL_TEMPLATE.format(
+            base_url=(base_url or ArduinoConfig.API_BASE_URL).rstrip('/'),
+            thing_id=thing_id
+        )
 
     @staticmethod
     def convert_boolean_to_distance(is_available):
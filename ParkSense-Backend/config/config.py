@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
@@ -13,28 +14,107 @@ class Config:
     API_VERSION = 'v1'
 
     SPOTS_PER_PAGE = 50
+    SPOTS_MAX_PER_PAGE = 500
 
+    # Readings are debounced with a hysteresis band of +/- SENSOR_UPDATE_THRESHOLD cm around
+    # the occupied threshold, the median of the last SENSOR_READING_WINDOW readings and a minimum dwell
+    SENSOR_FILTER_ENABLED = os.environ.get('SENSOR_FILTER_ENABLED', 'True') == 'True'
     SENSOR_UPDATE_THRESHOLD = 5  
     SENSOR_READING_WINDOW = 10   
+    SENSOR_MIN_DWELL_SECONDS = float(os.environ.get('SENSOR_MIN_DWELL_SECONDS', 5))
+    # Pending changes of sensors that stop reporting are committed by a sweep once the dwell has passed
+    SENSOR_FILTER_SWEEP_ENABLED = os.environ.get('SENSOR_FILTER_SWEEP_ENABLED', 'True') == 'True'
+    SENSOR_FILTER_SWEEP_INTERVAL_SECONDS = float(os.environ.get('SENSOR_FILTER_SWEEP_INTERVAL_SECONDS', 1))
+
+    # last_reading, last_ping and battery_level are written behind in bulk, every interval or once
+    # the threshold of pending sensors is reached, and on shutdown
+    TELEMETRY_BUFFER_ENABLED = os.environ.get('TELEMETRY_BUFFER_ENABLED', 'True') == 'True'
+    TELEMETRY_FLUSH_INTERVAL_SECONDS = int(os.environ.get('TELEMETRY_FLUSH_INTERVAL_SECONDS', 5))
+    TELEMETRY_FLUSH_THRESHOLD = 5000
+
+    SENSOR_BATCH_MAX_SIZE = int(os.environ.get('SENSOR_BATCH_MAX_SIZE', 5000))
+    # Batched readings may be timestamped at most this far past the server clock
+    SENSOR_TIMESTAMP_MAX_SKEW_SECONDS = 300
 
     MAX_CONCURRENT_USERS = 200
     DATABASE_QUERY_TIMEOUT = 100 
 
+    CHANGE_LOG_SIZE = int(os.environ.get('CHANGE_LOG_SIZE', 10000))
+
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    RESPONSE_CACHE_GZIP = os.environ.get('RESPONSE_CACHE_GZIP', 'True') == 'True'
+    RESPONSE_CACHE_GZIP_MIN_SIZE = 1024
+
+    # Per-request, SQL, job and cache metrics in Prometheus text format at /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+
+    SSE_KEEPALIVE_SECONDS = 15
+    SSE_QUEUE_SIZE = 100
+    SSE_MAX_SUBSCRIBERS = int(os.environ.get('SSE_MAX_SUBSCRIBERS', 5000))
+
     ARDUINO_CLIENT_ID = os.environ.get('ARDUINO_CLIENT_ID')
     ARDUINO_CLIENT_SECRET = os.environ.get('ARDUINO_CLIENT_SECRET')
     ARDUINO_THING_ID = os.environ.get('ARDUINO_THING_ID', '9d509034-3983-4bd7-9f08-0027587d72f3')
+    ARDUINO_THING_IDS = [
+        thing_id.strip() for thing_id in os.environ.get('ARDUINO_THING_IDS', ARDUINO_THING_ID).split(',') if thing_id.strip()
+    ]
+    ARDUINO_API_BASE_URL = os.environ.get('ARDUINO_API_BASE_URL', 'https://api2.arduino.cc/iot')
+    ARDUINO_TOKEN_URL = os.environ.get('ARDUINO_TOKEN_URL', ARDUINO_API_BASE_URL + '/v1/clients/token')
+    ARDUINO_POLL_WORKERS = int(os.environ.get('ARDUINO_POLL_WORKERS', 8))
     ARDUINO_POLL_INTERVAL = int(os.environ.get('ARDUINO_POLL_INTERVAL', 5))  
     ARDUINO_POLL_ENABLED = os.environ.get('ARDUINO_POLL_ENABLED', 'True') == 'True'
     ARDUINO_MAX_RETRIES = int(os.environ.get('ARDUINO_MAX_RETRIES', 3))
+    ARDUINO_RATE_LIMIT_REQUESTS = int(os.environ.get('ARDUINO_RATE_LIMIT_REQUESTS', 10))
+    ARDUINO_RATE_LIMIT_PERIOD = float(os.environ.get('ARDUINO_RATE_LIMIT_PERIOD', 1))
+    ARDUINO_ADAPTIVE_POLL = os.environ.get('ARDUINO_ADAPTIVE_POLL', 'True') == 'True'
+    ARDUINO_POLL_MIN_INTERVAL = float(os.environ.get('ARDUINO_POLL_MIN_INTERVAL', 2))
+    ARDUINO_POLL_MAX_INTERVAL = float(os.environ.get('ARDUINO_POLL_MAX_INTERVAL', 60))
+    ARDUINO_POLL_BACKOFF = 1.5
+    # Share of mapped properties the adaptive interval aims to see change between polls
+    ARDUINO_POLL_TARGET_CHURN = float(os.environ.get('ARDUINO_POLL_TARGET_CHURN', 0.01))
+    ARDUINO_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('ARDUINO_BREAKER_FAILURE_THRESHOLD', 5))
+    ARDUINO_BREAKER_RESET_TIMEOUT = float(os.environ.get('ARDUINO_BREAKER_RESET_TIMEOUT', 30))
+    ARDUINO_FULL_SYNC_INTERVAL = int(os.environ.get('ARDUINO_FULL_SYNC_INTERVAL', 60))
     ARDUINO_OCCUPIED_DISTANCE = 15.0  
     ARDUINO_AVAILABLE_DISTANCE = 100.0  
 
+    # Seed for the sensor_mapping table, copied only while the table is empty
     ARDUINO_SENSOR_MAPPING = {
         'space1': 1,
         'space2': 2,
         'space3': 3,
         'space4': 4
     }
+    # {thing_id: {property_name: sensor_id}} for Things other than ARDUINO_THING_ID
+    ARDUINO_THING_SENSOR_MAPPINGS = json.loads(os.environ.get('ARDUINO_THING_SENSOR_MAPPINGS', '{}'))
+    SENSOR_MAPPING_RELOAD_OVERLAP_SECONDS = 5
+
+    ROLLUP_ENABLED = os.environ.get('ROLLUP_ENABLED', 'True') == 'True'
+    ROLLUP_INTERVAL_SECONDS = int(os.environ.get('ROLLUP_INTERVAL_SECONDS', 60))
+    ROLLUP_BATCH_SIZE = 50000
+    ROLLUP_MINUTE_RETENTION_DAYS = int(os.environ.get('ROLLUP_MINUTE_RETENTION_DAYS', 7))
+    ROLLUP_MAX_BUCKETS = 2000
+
+    OCCUPANCY_SERIES_MAX_POINTS = 2000
+
+    FORECAST_ENABLED = os.environ.get('FORECAST_ENABLED', 'True') == 'True'
+    FORECAST_INTERVAL_SECONDS = int(os.environ.get('FORECAST_INTERVAL_SECONDS', 900))
+    FORECAST_SLOT_MINUTES = 15
+    FORECAST_TIMEZONE = os.environ.get('FORECAST_TIMEZONE', 'America/Los_Angeles')
+    FORECAST_LOOKBACK_DAYS = 28
+    FORECAST_DECAY = 0.8
+    FORECAST_DEFAULT_HOURS = 3
+    FORECAST_MAX_HOURS = 48
+
+    HISTORY_RETENTION_ENABLED = os.environ.get('HISTORY_RETENTION_ENABLED', 'True') == 'True'
+    HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', 30))
+    HISTORY_RETENTION_INTERVAL_SECONDS = int(os.environ.get('HISTORY_RETENTION_INTERVAL_SECONDS', 3600))
+    HISTORY_ARCHIVE_DIR = os.environ.get('HISTORY_ARCHIVE_DIR') or os.path.join(basedir, 'archive')
+    HISTORY_ARCHIVE_BATCH_SIZE = 5000
+    HISTORY_ARCHIVE_MAX_BATCHES = 20
+    # Longest from/to range /spots/<id>/history serves, archive reads included
+    HISTORY_RANGE_MAX_DAYS = 366
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -45,3 +125,8 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    ROLLUP_ENABLED = False
+    HISTORY_RETENTION_ENABLED = False
+    FORECAST_ENABLED = False
+    TELEMETRY_BUFFER_ENABLED = False
+    SENSOR_FILTER_SWEEP_ENABLED = False
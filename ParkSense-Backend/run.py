@@ -1,4 +1,6 @@
 import os
+import json
+import click
 from app import create_app
 from app.utils.db_init import init_db, populate_sample_data
 from config.config import DevelopmentConfig, ProductionConfig, TestingConfig
@@ -25,6 +27,54 @@ def seeddb():
     populate_sample_data()
     print("Database seeded with sample data")
 
+def parse_range(value):
+    low, _, high = value.partition('-')
+    return int(low), int(high or low)
+
+def parse_weights(value):
+    weights = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight)
+    return weights
+
+@app.cli.command()
+@click.option('--garages', default=10, show_default=True, help='garages to add')
+@click.option('--floors', default='4-8', show_default=True, help='floors per garage, N or LOW-HIGH')
+@click.option('--spots-per-floor', default='200-400', show_default=True, help='spots per floor, N or LOW-HIGH')
+@click.option('--spot-types', default='regular=88,handicap=4,ev=4,staff=4', show_default=True, help='spot type weights')
+@click.option('--occupancy', default=0.5, show_default=True, help='share of spots occupied now')
+@click.option('--history-days', default=0, show_default=True, help='days of occupancy history per spot')
+@click.option('--events-per-day', default=4, show_default=True, help='mean state changes per spot and day')
+@click.option('--seed', type=int, default=None, help='random seed for a repeatable topology')
+@click.option('--batch-size', default=10000, show_default=True, help='rows per insert batch')
+def generate_topology(garages, floors, spots_per_floor, spot_types, occupancy, history_days, events_per_day, seed,
+                      batch_size):
+    """add synthetic garages, spots and sensors in bulk for load testing"""
+    import time
+    from app.utils.db_init import reload_occupancy_store
+    from app.utils.topology import generate_topology as generate
+    start = time.perf_counter()
+    writer = generate(
+        garages,
+        floors=parse_range(floors),
+        spots_per_floor=parse_range(spots_per_floor),
+        spot_types=parse_weights(spot_types),
+        occupancy=occupancy,
+        history_days=history_days,
+        events_per_day=events_per_day,
+        seed=seed,
+        batch_size=batch_size
+    )
+    elapsed = time.perf_counter() - start
+    reload_occupancy_store()
+
+    for table, rows in writer.rows.items():
+        seconds = writer.seconds[table]
+        print(f"  {table:<20}{rows:>12,} rows  {seconds:>8.2f} s insert  {rows / seconds if seconds else 0:>12,.0f} rows/s")
+    total = sum(writer.rows.values())
+    print(f"✓ Generated {total:,} rows in {elapsed:.2f} s ({total / elapsed:,.0f} rows/s overall)")
+
 @app.cli.command()
 def resetdb():
     """reset database"""
@@ -57,7 +107,20 @@ def polling_status():
         status = polling_service.get_status()
         print("Arduino Cloud Polling Status:")
         print(f"  Enabled: {status['enabled']}")
-        print(f"  Interval: {status['interval_seconds']} seconds")
+        print(f"  Interval: {status['interval_seconds']} seconds"
+              f"{' (adaptive, churn ' + str(status['churn']) + ')' if status['adaptive_interval'] else ''}")
+        limiter = status['rate_limiter']
+        print(f"  Rate limit: {limiter['requests_per_second']}/s, {limiter['throttled']} requests throttled "
+              f"({limiter['total_wait_seconds']} s waited)")
+        breaker = status['circuit_breaker']
+        print(f"  Circuit breaker: {breaker['state']} for {breaker['seconds_in_state']} s, "
+              f"{breaker['consecutive_failures']} consecutive failures, {breaker['trips']} trips, "
+              f"{breaker['rejected_requests']} requests rejected")
+        if breaker['next_probe_in_seconds'] is not None:
+            print(f"    Next probe in {breaker['next_probe_in_seconds']} s")
+        if status['pending_retry']:
+            retry = status['pending_retry']
+            print(f"  Pending retry: {len(retry['thing_ids'])} things at {retry['run_at']} (attempt {retry['attempt']})")
         print(f"  Last poll: {status['last_poll_time'] or 'Never'}")
         print(f"  Last poll success: {status['last_poll_success']}")
         if status['last_error']:
@@ -65,10 +128,68 @@ def polling_status():
         print(f"  Successful polls: {status['successful_polls']}")
         print(f"  Failed polls: {status['failed_polls']}")
         print(f"  Sensor count: {status['sensor_count']}")
+        print(f"  Unmapped properties: {status['unmapped_properties']}")
+        print(f"  Writes avoided (last poll): {status['last_poll_writes_avoided']}")
+        print(f"  Writes avoided (total): {status['total_writes_avoided']}")
+        print(f"  Last poll duration: {status['last_poll_duration_ms']} ms")
+        if status['last_poll_stages']:
+            stages = ', '.join(f"{stage[:-3]} {ms} ms" for stage, ms in status['last_poll_stages'].items())
+            print(f"    Stages: {stages}")
+        for thing_id, thing in status['things'].items():
+            print(f"  Thing {thing_id}: last {thing['last_latency_ms']} ms, avg {thing['avg_latency_ms']} ms, "
+                  f"{thing['successful_polls']} ok / {thing['failed_polls']} failed")
+            if thing['last_error']:
+                print(f"    Last error: {thing['last_error']}")
     else:
         print("✗ Polling service not enabled")
         print("  Set ARDUINO_POLL_ENABLED=True in .env to enable polling")
 
+@app.cli.command()
+def rollup_now():
+    """apply pending occupancy history to the rollup tables"""
+    from app.scheduler.jobs import run_rollups_until_caught_up
+    summary = run_rollups_until_caught_up(app, max_batches=1000)
+    if summary:
+        print(f"✓ Rollups up to date (history_id {summary['last_history_id']})")
+        print(f"  Minute buckets pruned: {summary['pruned_minute_rows']}")
+    else:
+        print("✗ Rollup failed, see log for details")
+
+@app.cli.command()
+def archive_history():
+    """archive occupancy history older than the retention window"""
+    from app.scheduler.jobs import run_history_retention
+    summary = run_history_retention(app, max_batches=1000)
+    if summary:
+        print(f"✓ Archived {summary['archived_rows']} rows older than {summary['cutoff']}")
+        print(f"  Archive directory: {app.config['HISTORY_ARCHIVE_DIR']}")
+    else:
+        print("✗ Archival failed, see log for details")
+
+@app.cli.command()
+def refresh_forecasts():
+    """fold recent occupancy history into the availability forecasts"""
+    from app.scheduler.jobs import run_forecast_refresh
+    folded = run_forecast_refresh(app)
+    if folded is not None:
+        print(f"✓ Forecasts refreshed ({sum(folded.values())} slots across {len(folded)} garages)")
+    else:
+        print("✗ Forecast refresh failed, see log for details")
+
+@app.cli.command()
+@click.argument('path')
+def import_sensor_mappings(path):
+    """import {thing_id: {property_name: sensor_id}} mappings from a JSON file"""
+    from app.services.sensor_mapping_service import SensorMappingService
+    with open(path) as f:
+        mappings = json.load(f)
+    summary = SensorMappingService.upsert(mappings)
+    print(f"✓ Sensor mappings: {summary['inserted']} inserted, {summary['updated']} updated, "
+          f"{summary['unchanged']} unchanged")
+    if summary['invalid']:
+        print(f"✗ Skipped {len(summary['invalid'])} mappings to unknown sensors, e.g. {summary['invalid'][0]}")
+    print("  Running pollers pick the changes up on their next poll")
+
 if __name__ == '__main__':
     with app.app_context():
         init_db()